@@ -1,21 +1,41 @@
 from flask import Flask
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
-from app.commands import register_commands
-from app.models import db
-from config import Config
-from app.bar.app import bar_bp
-from app.user.login import login_bp
-from app.user.register import register_bp
 
 def create_app():
+    # importing the package has no side effects, the config (and with it .env), logging,
+    # extensions and blueprints are only loaded here so scripts importing app.models stay cheap
+    from flask_cors import CORS
+    from flask_jwt_extended import JWTManager
+    from config import Config
+    from app.commands import register_commands
+    from app.extensions import configure_logging
+    from app.models import db
+    from app.bar.app import bar_bp
+    from app.bar.catalog import drink_catalog
+    from app.carwash.carwash import carwash_bp
+    from app.user.auth import is_token_revoked, token_versions
+    from app.user.login import login_bp
+    from app.user.security import login_throttle, password_hashes
+    from app.user.register import register_bp
+    from app.reports.sales import reports_bp
+    from app.exports.tables import exports_bp
+    from app.metrics import metrics
+    from app.compression import compression
+    from app.etags import table_versions
+    from app.serialization import json_provider
+    from app.slow_queries import slow_queries
+    from app.query_budget import query_budgets
+    from app.replica import replica_router
+
     app = Flask(__name__)
     app.config.from_object(Config)
-    
-    migrate = Migrate()
+    if app.config['PROXY_FIX_X_FOR']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    app.json = json_provider(app)
+    configure_logging(app)
+
     jwt = JWTManager()
-    
+
     CORS(app, resources={
         r"/api/*": {
             "origins": ["http://localhost:3000", "http://127.0.0.1:3000"],
@@ -25,16 +45,29 @@ def create_app():
             "supports_credentials": True
         }
     })
-    
+
     db.init_app(app)
-    migrate.init_app(app, db)
     jwt.init_app(app)
+    jwt.token_in_blocklist_loader(is_token_revoked)
+    token_versions.init_app(app)
+    password_hashes.init_app(app)
+    login_throttle.init_app(app)
+    drink_catalog.init_app(app)
+    table_versions.init_app(app)
+    metrics.init_app(app)
+    # after_request hooks run in reverse, compression goes just before metrics records the request
+    compression.init_app(app)
+    slow_queries.init_app(app)
+    query_budgets.init_app(app)
+    replica_router.init_app(app)
     register_commands(app)
-    
+
     with app.app_context():
         app.register_blueprint(bar_bp)
+        app.register_blueprint(carwash_bp)
         app.register_blueprint(login_bp)
         app.register_blueprint(register_bp)
-    
+        app.register_blueprint(reports_bp)
+        app.register_blueprint(exports_bp)
+
     return app
-    
\ No newline at end of file
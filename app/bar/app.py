@@ -1,13 +1,64 @@
-from flask import Blueprint, make_response, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
-from sqlalchemy import and_
+from flask import Blueprint, Response, make_response, request, stream_with_context
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+from sqlalchemy import case, insert, select, update
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from app.models import DRINK_TYPES, DRINK_VOLUME, PAYMENT_METHODS, Drink, DrinkPurchases, DrinkSales, OpenBottle, Staff, TotSales, db
+from app.models import DRINK_TYPES, DRINK_VOLUME, PAYMENT_METHODS, Drink, DrinkPurchases, DrinkSales, OpenBottle, TotSales, db
+from app.bar.catalog import drink_catalog
+from app.bar.catalog_io import export_catalog, import_catalog, read_catalog
+from app.etags import conditional
 from app.extensions import logger
+from app.rollups import record_bar_sale, record_bar_sales
+from app.user.auth import department_required
+from app.query_budget import query_budget
+from app.replica import read_only
 
 bar_bp = Blueprint('bar_bp', __name__, url_prefix='/api/v1')
 
+VAT_RATE = 0.16
+
+MAX_BATCH_SALE_LINES = 50
+
+def retail_unit_price(drink) -> float:
+    """
+    selling price of a single bottle, purchase price plus the markup margin plus VAT
+
+    Args:
+        drink: a Drink or catalog entry with purchase_price and markup
+    """
+    margin_amount = drink.purchase_price * drink.markup
+    net_sales_price = margin_amount + drink.purchase_price
+    vat_charge = net_sales_price * VAT_RATE
+    return net_sales_price + vat_charge
+
+def take_drink_stock(drink_id: int, quantity: int):
+    """
+    take bottles out of stock with a single conditional update, the row is only
+    changed when there is enough stock so concurrent sales can never oversell.
+    the prices come back from the same update, the cached catalog entry can be up to
+    DRINK_CATALOG_CACHE_TTL old when the drink was edited on another worker
+
+    Args:
+        drink_id (int): id of the drink
+        quantity (int): number of bottles to take
+
+    Returns:
+        a row of the stock left, purchase_price, markup and shot_quantity, or None when
+        there was not enough stock
+    """
+    return db.session.execute(
+        update(Drink)
+        .where(Drink.id == drink_id, Drink.stock >= quantity)
+        .values(stock=Drink.stock - quantity)
+        .returning(Drink.stock, Drink.purchase_price, Drink.markup, Drink.shot_quantity)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+def current_shot_price():
+    """ the shot price of an open bottle's drink, for the RETURNING of an update on open_bottles """
+    return select(Drink.shot_price).where(Drink.id == OpenBottle.drink_id).scalar_subquery()
+
 @bar_bp.route('/drinks/add', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def add_drinks():
     try:
@@ -39,6 +90,7 @@ def add_drinks():
             )
             db.session.add(new_drink)
             db.session.commit()
+            drink_catalog.invalidate(new_drink.id)
             
             logger.info(f"new drink {name}, {volume}: {stock} units has been added", extra={'user_id': get_jwt_identity()})
             return make_response({"success": True, "msg": "drink added successfully"}, 201)
@@ -52,29 +104,144 @@ def add_drinks():
         logger.error(f"an error occured: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({"success": False, "msg": "internal server error"}, 500)
     
+DRINK_LIST_FIELDS = {
+    "id": Drink.id,
+    "name": Drink.name,
+    "bottle_size": Drink.volume.label('bottle_size'),
+    "category": Drink.drink_type.label('category'),
+    "stock": Drink.stock,
+    "selling_price": (Drink.purchase_price * Drink.markup).label('selling_price')
+}
+
+DRINK_PAGE_SIZE = 50
+MAX_DRINK_PAGE_SIZE = 200
+
 @bar_bp.route('/drinks', methods=['GET'])
+@query_budget(3)
+@read_only
 @jwt_required()
+@conditional(Drink)
 def list_drinks():
+    """
+    list drinks one page at a time, ordered by id
+
+    query params:
+        cursor: id of the last drink on the previous page
+        limit: page size, capped at MAX_DRINK_PAGE_SIZE
+        drink_type, volume: exact match filters
+        low_stock: only return drinks with stock at or below this number
+        fields: comma separated subset of the drink fields to return
+    """
     try:
-        drinks = Drink.query.all()
-        
-        drinks_list = [{
-            "id": d.id,
-            "name": d.name,
-            "bottle_size": d.volume,
-            "category": d.drink_type,
-            "stock": d.stock,
-            "selling_price": d.purchase_price * d.markup
-        } for d in drinks]
-        
-        return make_response({'success': False, 'drinks': drinks_list}, 200)
-    
+        args = request.args
+
+        cursor = args.get('cursor', type=int)
+        limit = min(args.get('limit', DRINK_PAGE_SIZE, type=int), MAX_DRINK_PAGE_SIZE)
+        low_stock = args.get('low_stock', type=int)
+
+        if limit <= 0:
+            return make_response({'success': False, 'msg': 'limit must be greater than zero'}, 400)
+
+        fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()] or list(DRINK_LIST_FIELDS)
+        unknown_fields = [f for f in fields if f not in DRINK_LIST_FIELDS]
+        if unknown_fields:
+            return make_response({'success': False, 'msg': f"fields can only be: {', '.join(DRINK_LIST_FIELDS)}"}, 400)
+
+        drink_type = args.get('drink_type')
+        if drink_type is not None and drink_type not in DRINK_TYPES:
+            return make_response({'success': False, 'msg': f"drink types can only be one of: {', '.join(DRINK_TYPES)}"}, 400)
+
+        volume = args.get('volume')
+        if volume is not None and volume not in DRINK_VOLUME:
+            return make_response({'success': False, 'msg': f"drink volume can only be {', '.join(DRINK_VOLUME)}"}, 400)
+
+        # the id is always selected so the next cursor can be built from the page
+        columns = [DRINK_LIST_FIELDS['id']] + [DRINK_LIST_FIELDS[f] for f in fields if f != 'id']
+        query = db.session.query(*columns)
+
+        if cursor is not None:
+            query = query.filter(Drink.id > cursor)
+        if drink_type is not None:
+            query = query.filter(Drink.drink_type == drink_type)
+        if volume is not None:
+            query = query.filter(Drink.volume == volume)
+        if low_stock is not None:
+            query = query.filter(Drink.stock <= low_stock)
+
+        # fetch one extra row to know whether there is another page without a count query
+        rows = query.order_by(Drink.id).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        drinks_list = [{f: row._mapping[f] for f in fields} for row in rows]
+        next_cursor = rows[-1].id if has_more else None
+
+        return make_response({'success': True, 'drinks': drinks_list, 'next_cursor': next_cursor}, 200)
+
     except Exception as e:
         logger.error(f"an error occured: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
 
+@bar_bp.route('/drinks/import', methods=['POST'])
+# sized for a catalog of 2000 drinks: 4 batches of a select, an insert and one update per set of
+# changed columns, with room for 3 sets per batch. a larger catalog logs a warning
+@query_budget(24, repeats=8)
+@jwt_required()
+def import_drinks():
+    """
+    create or update many drinks from a csv, ndjson or json catalog, matched by name and volume.
+    with ?dry_run=true nothing is written and the response lists what would change
+    """
+    try:
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        
+        try:
+            rows = read_catalog(request.stream, request.mimetype)
+            summary = import_catalog(rows, dry_run=dry_run)
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+                drink_catalog.invalidate()
+        
+        except ValueError as e:
+            db.session.rollback()
+            return make_response({'success': False, 'msg': f"invalid catalog: {str(e)}"}, 400)
+        
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"database error importing the drink catalog: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to import drinks, please try again'}, 500)
+        
+        if not dry_run:
+            logger.info(
+                f"drink catalog imported: {summary['created']} created, {summary['updated']} updated, {len(summary['errors'])} rejected",
+                extra={'user_id': get_jwt_identity()}
+            )
+        return make_response(dict(summary, success=True, dry_run=dry_run), 200)
+    
+    except Exception as e:
+        logger.error(f"an error occured importing the drink catalog: {str(e)}", extra={'user_id': get_jwt_identity()})
+        return make_response({'success': False, 'msg': 'internal server error'}, 500)
+
+@bar_bp.route('/drinks/export', methods=['GET'])
+@query_budget(2)
+@read_only
+@jwt_required()
+def export_drinks():
+    """ stream the whole drink catalog as csv, or ndjson with ?format=ndjson """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return make_response({'success': False, 'msg': 'format can only be csv or ndjson'}, 400)
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(export_catalog(fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f"attachment; filename=drinks.{fmt}"
+    return response
+
 @bar_bp.route('/drinks/<int:drink_id>/edit', methods=['PUT'])
+@query_budget(4)
 @jwt_required()
 def edit_drinks(drink_id: int):
     try:
@@ -116,6 +283,7 @@ def edit_drinks(drink_id: int):
                 drink.shot_quantity = data['shot_quantity']
                 
             db.session.commit()
+            drink_catalog.invalidate(drink_id)
             logger.info(f"drink {drink_id} has been updated", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'drink details have been updated successfully'}, 200)
         
@@ -129,6 +297,7 @@ def edit_drinks(drink_id: int):
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
 
 @bar_bp.route('/drinks/<int:drink_id>/delete', methods=['DELETE'])
+@query_budget(7)
 @jwt_required()
 def delete_drink(drink_id: int):
     try:
@@ -139,6 +308,7 @@ def delete_drink(drink_id: int):
         try:
             db.session.delete(drink)
             db.session.commit()
+            drink_catalog.invalidate(drink_id)
             
             logger.info(f"drink {drink.name}, {drink.volume} has been deleted", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'drink has been deleted'}, 200)
@@ -153,16 +323,14 @@ def delete_drink(drink_id: int):
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
 @bar_bp.route('/drinks/<int:drink_id>/sell/retail', methods=['POST'])
-@jwt_required()
+@query_budget(6)
+@department_required('bar')
 def sell_drink(drink_id: int):
     try:
-        drink = Drink.query.get(drink_id)
+        drink = drink_catalog.get(drink_id)
         if not drink:
             return make_response({'success': False, 'msg': 'drink not found'}, 404)
         
-        if drink.stock == 0:
-            return make_response({'success': False, 'msg': 'drink is currently not in stock'}, 400)
-        
         data = request.get_json()
         quantity = int(data.get('quantity'))
         payment_method = data.get('payment_method')
@@ -171,25 +339,18 @@ def sell_drink(drink_id: int):
         if quantity <= 0:
             return make_response({'success': False, 'msg': 'quantity sold cannot be zero'}, 400)
         
-        if quantity > drink.stock:
-            return make_response({'success': False, 'msg': 'not enough bottles in stock'}, 400)
-        
         if payment_method not in PAYMENT_METHODS:
             return make_response({'success': False, 'msg': f'payment can only be made via {', '.join(PAYMENT_METHODS)}'}, 400)
         
-        user_id = get_jwt_identity()
-        staff = Staff.query.filter_by(user_id=int(user_id)).first()
-        
-        markup = drink.markup
-        vat = 0.16
-        
-        margin_amount = drink.purchase_price * markup
-        net_sales_price = margin_amount + drink.purchase_price
-        vat_charge = net_sales_price * vat
-        unit_selling_price  = net_sales_price + vat_charge
-        total_amount = round(unit_selling_price * quantity, 1)
+        staff_id = get_jwt()['staff_id']
         
         try:
+            taken = take_drink_stock(drink_id, quantity)
+            if taken is None:
+                db.session.rollback()
+                return make_response({'success': False, 'msg': 'not enough bottles in stock'}, 400)
+            
+            total_amount = round(retail_unit_price(taken) * quantity, 1)
             new_drink_sale = DrinkSales(
                 drink_id=drink_id,
                 quantity=quantity,
@@ -197,45 +358,46 @@ def sell_drink(drink_id: int):
                 payment_method=payment_method,
                 reference_number=reference_number,
                 amount=total_amount,
-                sold_by=staff.id
+                sold_by=staff_id
             )
             db.session.add(new_drink_sale)
-            
-            drink.stock -= quantity
-            
+            record_bar_sale(drink_id, 'bottle', staff_id, payment_method, quantity, total_amount)
             db.session.commit()
             
             logger.info(f"new sale recorded for {quantity} bottles of {drink.name}", extra={'user_id': get_jwt_identity()})
             return make_response({"success": True, "msg": "sale recorded successfully"})
         
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logger.error(f"database error occured trying to record a drink sale: {str(e)}", extra={'user_id': get_jwt_identity()})
-            return make_response({'success': False, 'msg': 'failed to record sale, please try again'}, 500)
-        
         except IntegrityError as e:
             db.session.rollback()
             logger.error(f"unique constraint violation: {str(e)}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': False, 'msg': 'payment reference number already exists'}, 500)
         
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"database error occured trying to record a drink sale: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to record sale, please try again'}, 500)
+        
     except Exception as e:
         logger.error(f"an error occured: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
         
                 
 @bar_bp.route('/drinks/open-bottle/<int:drink_id>', methods=['POST'])
+@query_budget(5)
 @jwt_required()
 def open_bottle(drink_id: int):
     try:
-        drink = Drink.query.get(drink_id)
+        drink = drink_catalog.get(drink_id)
         if not drink:
             return make_response({'msg': 'drink does not exist'}, 404)
         
         try:
-            bottles_remaining = drink.stock
-            drink.stock = bottles_remaining - 1
+            taken = take_drink_stock(drink_id, 1)
+            if taken is None:
+                db.session.rollback()
+                return make_response({'success': False, 'msg': 'drink is currently not in stock'}, 400)
             
-            open_bottle = OpenBottle(drink_id=drink_id, remaining_shots=drink.shot_quantity)
+            open_bottle = OpenBottle(drink_id=drink_id, shots_remaining=taken.shot_quantity)
             db.session.add(open_bottle)
             db.session.commit()
             
@@ -257,17 +419,22 @@ def open_bottle(drink_id: int):
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
 
 @bar_bp.route('/drinks/open-bottle', methods=['GET'])
+@query_budget(3)
+@read_only
 @jwt_required()
+@conditional(OpenBottle, Drink)
 def list_open_bottles():
     try:
-        open_bottles = OpenBottle.query.all()
+        open_bottles = db.session.query(
+            OpenBottle.id, Drink.name, OpenBottle.shots_remaining, Drink.shot_price
+        ).join(Drink, OpenBottle.drink_id == Drink.id).filter(OpenBottle.shots_remaining > 0).order_by(OpenBottle.id).all()
         
         open_bottle_list = [{
             "id": op.id,
-            "name": op.drinks.name,
+            "name": op.name,
             "shots_remaining": op.shots_remaining,
-            "shot_price": op.drinks.shot_price
-        }for op in open_bottles]
+            "shot_price": op.shot_price
+        } for op in open_bottles]
         
         return make_response({'success': True, 'open_bottles': open_bottle_list}, 200)
     
@@ -276,23 +443,16 @@ def list_open_bottles():
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
 @bar_bp.route('/drinks/sell-tot/<int:bottle_id>', methods=['POST'])
-@jwt_required()
+@query_budget(6)
+@department_required('bar')
 def sell_tots(bottle_id: int):
     try:
-        open_bottle = OpenBottle.query.get(bottle_id)
-        if not open_bottle:
-            return make_response({'success': False, 'msg': 'bottle not found'}, 404)
-        
         data = request.get_json()
         shot_quantity = int(data.get('shot_quantity'))
         payment_method = data.get('payment_method')
         reference_number = data.get('reference_number', None)
         
-        staff = Staff.query.filter(and_(
-            Staff.user_id == int(get_jwt_identity()), Staff.department == 'bar'
-        )).first()
-        if not staff:
-            return make_response({'success': False, 'msg': 'invalid staff details'}, 400)
+        staff_id = get_jwt()['staff_id']
         
         if payment_method not in PAYMENT_METHODS:
             return make_response({'success': False, 'msg': f'payment can only be made via {', '.join(PAYMENT_METHODS)}'}, 400)
@@ -301,43 +461,58 @@ def sell_tots(bottle_id: int):
             return make_response({'success': False, 'msg': 'shots sold cannot be zero'}, 400)
         
         try:
-            price = shot_quantity * open_bottle.drink.shot_price
+            poured = db.session.execute(
+                update(OpenBottle)
+                .where(OpenBottle.id == bottle_id, OpenBottle.shots_remaining >= shot_quantity)
+                .values(shots_remaining=OpenBottle.shots_remaining - shot_quantity)
+                .returning(OpenBottle.drink_id, OpenBottle.shots_remaining, current_shot_price().label('shot_price'))
+                .execution_options(synchronize_session=False)
+            ).first()
+            if poured is None:
+                db.session.rollback()
+                if db.session.query(OpenBottle.id).filter(OpenBottle.id == bottle_id).first() is None:
+                    return make_response({'success': False, 'msg': 'bottle not found'}, 404)
+                return make_response({'success': False, 'msg': 'not enough shots remaining in the bottle'}, 400)
+            
+            drink = drink_catalog.get(poured.drink_id)
+            price = shot_quantity * poured.shot_price
             new_tot_sale = TotSales(
                 open_bottle_id=bottle_id,
+                drink_id=poured.drink_id,
                 shot_quantity=shot_quantity,
                 price=price,
                 payment_method=payment_method,
                 reference_number=reference_number,
-                sold_by=staff.id
+                sold_by=staff_id
             )
             db.session.add(new_tot_sale)
+            record_bar_sale(poured.drink_id, 'tot', staff_id, payment_method, shot_quantity, price)
             
-            open_bottle.shots_remaining -= shot_quantity
-            
-            if open_bottle.shots_remaining == 0:
-                db.session.delete(open_bottle)
-                logger.info(f"open bottle {open_bottle.drink.name} is now finished", extra={'user_id': get_jwt_identity()})
+            # a finished bottle stays at 0 shots instead of being deleted, the sale references it
+            if poured.shots_remaining == 0:
+                logger.info(f"open bottle {drink.name} is now finished", extra={'user_id': get_jwt_identity()})
             
             db.session.commit()
             
-            logger.info(f"{shot_quantity} shots of {open_bottle.drink.name} sold", extra={'user_id': get_jwt_identity()})
+            logger.info(f"{shot_quantity} shots of {drink.name} sold", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'sale recorded successfully'}, 201)
         
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logger.error(f"a database error occured trying to record a shot sale: {str(e)}", extra={'user_id': get_jwt_identity()})
-            return make_response({'success': False, 'msg': 'failed to record sale, please try again'}, 500)
-        
         except IntegrityError as e:
             db.session.rollback()
             logger.error(f"unique constraint violation: {str(e)}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': False, 'msg': 'payment reference number already exists'}, 500)
         
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"a database error occured trying to record a shot sale: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to record sale, please try again'}, 500)
+        
     except Exception as e:
         logger.error(f"an error occured: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
 @bar_bp.route('drinks/tot-sales/<int:sale_id>/edit', methods=['PUT'])
+@query_budget(10)
 @jwt_required()
 def edit_tot_sale(sale_id: int):
     try:
@@ -347,16 +522,25 @@ def edit_tot_sale(sale_id: int):
         
         data = request.get_json()
         try:
+            original_bottle = OpenBottle.query.get(sale.open_bottle_id)
+            # the sale keeps its drink id, the bottle is only a fallback for sales older than the column
+            original_drink_id = sale.drink_id or (original_bottle.drink_id if original_bottle else None)
+            original_sale = (original_drink_id, sale.payment_method, sale.shot_quantity, sale.price)
+            
             if 'bottle_id' in data or 'shot_quantity' in data:
             
-                original_bottle = OpenBottle.query.get(sale.open_bottle_id)
                 if original_bottle:
                     original_bottle.shots_remaining += sale.shot_quantity
                 
                 new_bottle_id = data.get('bottle_id', sale.open_bottle_id)
-                new_quantity = int(data.get('shot_quantity')) if data['shot_quantity'] is not None else sale.shot_quantity 
+                new_quantity = int(data['shot_quantity']) if data.get('shot_quantity') is not None else sale.shot_quantity
 
-                target_bottle = OpenBottle.query.get(new_bottle_id)
+                # nothing is flushed until the commit, the bottles and the sale go out in one flush
+                with db.session.no_autoflush:
+                    target_bottle = OpenBottle.query.get(new_bottle_id)
+                    shot_price = db.session.query(Drink.shot_price).filter(
+                        Drink.id == target_bottle.drink_id
+                    ).scalar() if target_bottle else None
                 
                 if not target_bottle:
                     return make_response({'success': False, 'msg': 'Target bottle not found'}, 404)
@@ -369,9 +553,10 @@ def edit_tot_sale(sale_id: int):
                 target_bottle.shots_remaining -= new_quantity
 
                 sale.open_bottle_id = new_bottle_id
+                sale.drink_id = target_bottle.drink_id
                 sale.shot_quantity = new_quantity
                 
-                sale.price = target_bottle.drink.shot_price * new_quantity
+                sale.price = shot_price * new_quantity
                 
             if 'payment_method' in data:
                 if data['payment_method'] not in PAYMENT_METHODS:
@@ -381,6 +566,13 @@ def edit_tot_sale(sale_id: int):
                 
             if 'reference_number' in data:
                 sale.reference_number = data['reference_number']
+            
+            drink_id, payment_method, shot_quantity, price = original_sale
+            if drink_id is not None and ('bottle_id' in data or 'shot_quantity' in data or 'payment_method' in data):
+                record_bar_sale(drink_id, 'tot', sale.sold_by, payment_method, -shot_quantity, -price,
+                                sales_count=-1, day=sale.created_at)
+                record_bar_sale(sale.drink_id or drink_id, 'tot', sale.sold_by, sale.payment_method, sale.shot_quantity, sale.price,
+                                day=sale.created_at)
                 
             db.session.commit()
             
@@ -403,10 +595,11 @@ def edit_tot_sale(sale_id: int):
         
     
 @bar_bp.route('/drinks/record-purchase/<int:drink_id>', methods=['POST'])
+@query_budget(5)
 @jwt_required()
 def record_drink_purchase(drink_id: int):
     try:
-        drink = Drink.query.get(drink_id)
+        drink = drink_catalog.get(drink_id)
         if not drink:
             return make_response({'success': False, 'msg': 'drink not found'}, 404)
         
@@ -436,9 +629,11 @@ def record_drink_purchase(drink_id: int):
                 supplier=supplier
             )
             db.session.add(new_purchase)
-            drink.stock += quantity
-            drink.purchase_price = unit_price
+            db.session.query(Drink).filter(Drink.id == drink_id).update(
+                {Drink.stock: Drink.stock + quantity, Drink.purchase_price: unit_price}, synchronize_session=False
+            )
             db.session.commit()
+            drink_catalog.invalidate(drink_id)
             
             logger.info(f"new purchase recorded for {drink.name}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'drink purchase recorded successfully'}, 201)
@@ -451,4 +646,197 @@ def record_drink_purchase(drink_id: int):
     except Exception as e:
         logger.error(f"an error occured: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
-    
\ No newline at end of file
+    
+@bar_bp.route('/sales/batch', methods=['POST'])
+@query_budget(12)
+@department_required('bar')
+def sell_batch():
+    """
+    record a whole round of bottle and tot sales in one transaction
+
+    body:
+        payment_method, reference_number: shared by every line, the reference is
+            suffixed with the line number when the round has more than one line
+        items: list of {"type": "bottle", "drink_id", "quantity"} or
+            {"type": "tot", "bottle_id", "shot_quantity"}
+    """
+    try:
+        data = request.get_json()
+        items = data.get('items')
+        payment_method = data.get('payment_method')
+        reference_number = data.get('reference_number', None)
+        
+        if payment_method not in PAYMENT_METHODS:
+            return make_response({'success': False, 'msg': f'payment can only be made via {', '.join(PAYMENT_METHODS)}'}, 400)
+        
+        if not isinstance(items, list) or not items:
+            return make_response({'success': False, 'msg': 'a sale must have at least one item'}, 400)
+        
+        if len(items) > MAX_BATCH_SALE_LINES:
+            return make_response({'success': False, 'msg': f'a sale cannot have more than {MAX_BATCH_SALE_LINES} items'}, 400)
+        
+        staff_id = get_jwt()['staff_id']
+        
+        errors = []
+        bottle_lines = []
+        tot_lines = []
+        for line_number, item in enumerate(items, start=1):
+            try:
+                if item.get('type') == 'bottle':
+                    line = (line_number, int(item['drink_id']), int(item['quantity']))
+                    bottle_lines.append(line)
+                elif item.get('type') == 'tot':
+                    line = (line_number, int(item['bottle_id']), int(item['shot_quantity']))
+                    tot_lines.append(line)
+                else:
+                    errors.append({'line': line_number, 'msg': 'item type can only be bottle or tot'})
+                    continue
+            except (AttributeError, KeyError, TypeError, ValueError):
+                errors.append({'line': line_number, 'msg': 'item is missing an id or quantity'})
+                continue
+            
+            if line[2] <= 0:
+                errors.append({'line': line_number, 'msg': 'quantity sold cannot be zero'})
+        
+        drinks = drink_catalog.get_many(drink_id for _, drink_id, _ in bottle_lines)
+        for line_number, drink_id, _ in bottle_lines:
+            if drink_id not in drinks:
+                errors.append({'line': line_number, 'msg': 'drink not found'})
+        
+        if errors:
+            return make_response({'success': False, 'msg': 'some items are invalid', 'errors': errors}, 400)
+        
+        bottles_needed = {}
+        for _, drink_id, quantity in bottle_lines:
+            bottles_needed[drink_id] = bottles_needed.get(drink_id, 0) + quantity
+        
+        shots_needed = {}
+        for _, bottle_id, shot_quantity in tot_lines:
+            shots_needed[bottle_id] = shots_needed.get(bottle_id, 0) + shot_quantity
+        
+        def line_reference(line_number):
+            if reference_number is None or len(items) == 1:
+                return reference_number
+            return f"{reference_number}-{line_number}"
+        
+        try:
+            # rows are always locked drinks first then open bottles, each in id order,
+            # so two rounds touching the same rows cannot deadlock each other
+            stock = dict(db.session.query(Drink.id, Drink.stock).filter(
+                Drink.id.in_(bottles_needed)
+            ).order_by(Drink.id).with_for_update().all()) if bottles_needed else {}
+            
+            open_bottles = {b.id: b for b in db.session.query(
+                OpenBottle.id, OpenBottle.drink_id, OpenBottle.shots_remaining
+            ).filter(
+                OpenBottle.id.in_(shots_needed)
+            ).order_by(OpenBottle.id).with_for_update().all()} if shots_needed else {}
+            
+            for drink_id, quantity in bottles_needed.items():
+                if stock.get(drink_id) is None:
+                    errors.append({'drink_id': drink_id, 'msg': 'drink not found'})
+                elif quantity > stock[drink_id]:
+                    errors.append({'drink_id': drink_id, 'msg': 'not enough bottles in stock'})
+            
+            for bottle_id, shot_quantity in shots_needed.items():
+                if bottle_id not in open_bottles:
+                    errors.append({'bottle_id': bottle_id, 'msg': 'bottle not found'})
+                elif shot_quantity > open_bottles[bottle_id].shots_remaining:
+                    errors.append({'bottle_id': bottle_id, 'msg': 'not enough shots remaining in the bottle'})
+            
+            if errors:
+                db.session.rollback()
+                return make_response({'success': False, 'msg': 'some items cannot be sold', 'errors': errors}, 400)
+            
+            # one update per table instead of one per drink or bottle. the stock and shot checks
+            # are repeated in the WHERE clause, FOR UPDATE does not lock anything on sqlite
+            if bottles_needed:
+                drinks_table = Drink.__table__
+                sold = case(bottles_needed, value=drinks_table.c.id)
+                # the prices are read back from the update, not from the per worker catalog cache
+                prices = {row.id: row for row in db.session.execute(
+                    update(drinks_table)
+                    .where(drinks_table.c.id.in_(bottles_needed), drinks_table.c.stock >= sold)
+                    .values(stock=drinks_table.c.stock - sold)
+                    .returning(drinks_table.c.id, drinks_table.c.purchase_price, drinks_table.c.markup)
+                )}
+                errors += [{'drink_id': d, 'msg': 'not enough bottles in stock'} for d in sorted(set(bottles_needed) - set(prices))]
+            
+            if shots_needed:
+                bottles_table = OpenBottle.__table__
+                poured = case(shots_needed, value=bottles_table.c.id)
+                shot_prices = dict(db.session.execute(
+                    update(bottles_table)
+                    .where(bottles_table.c.id.in_(shots_needed), bottles_table.c.shots_remaining >= poured)
+                    .values(shots_remaining=bottles_table.c.shots_remaining - poured)
+                    .returning(bottles_table.c.id, current_shot_price())
+                ).all())
+                errors += [{'bottle_id': b, 'msg': 'not enough shots remaining in the bottle'} for b in sorted(set(shots_needed) - set(shot_prices))]
+            
+            if errors:
+                db.session.rollback()
+                return make_response({'success': False, 'msg': 'some items cannot be sold', 'errors': errors}, 400)
+            
+            # finished bottles stay at 0 shots, the tot sales below reference them
+            finished = sorted(b for b, shots in shots_needed.items() if shots == open_bottles[b].shots_remaining)
+            if finished:
+                logger.info(f"open bottles {', '.join(map(str, finished))} are now finished", extra={'user_id': get_jwt_identity()})
+            
+            drink_sales = [{
+                'drink_id': drink_id,
+                'quantity': quantity,
+                'sale_type': 'retail',
+                'payment_method': payment_method,
+                'reference_number': line_reference(line_number),
+                'amount': round(retail_unit_price(prices[drink_id]) * quantity, 1),
+                'sold_by': staff_id
+            } for line_number, drink_id, quantity in bottle_lines]
+            
+            tot_sales = [{
+                'open_bottle_id': bottle_id,
+                'drink_id': open_bottles[bottle_id].drink_id,
+                'shot_quantity': shot_quantity,
+                'price': shot_quantity * shot_prices[bottle_id],
+                'payment_method': payment_method,
+                'reference_number': line_reference(line_number),
+                'sold_by': staff_id
+            } for line_number, bottle_id, shot_quantity in tot_lines]
+            
+            if drink_sales:
+                db.session.execute(insert(DrinkSales), drink_sales)
+            if tot_sales:
+                db.session.execute(insert(TotSales), tot_sales)
+            
+            rollup = {}
+            for sale in drink_sales:
+                key = (sale['drink_id'], 'bottle')
+                count, quantity, amount = rollup.get(key, (0, 0, 0))
+                rollup[key] = (count + 1, quantity + sale['quantity'], amount + sale['amount'])
+            for sale in tot_sales:
+                key = (sale['drink_id'], 'tot')
+                count, quantity, amount = rollup.get(key, (0, 0, 0))
+                rollup[key] = (count + 1, quantity + sale['shot_quantity'], amount + sale['price'])
+            record_bar_sales([{
+                'drink_id': drink_id, 'sale_kind': sale_kind, 'staff_id': staff_id, 'payment_method': payment_method,
+                'sales_count': count, 'quantity': quantity, 'amount': amount
+            } for (drink_id, sale_kind), (count, quantity, amount) in sorted(rollup.items())])
+            
+            db.session.commit()
+            
+            total_amount = round(sum(s['amount'] for s in drink_sales) + sum(s['price'] for s in tot_sales), 1)
+            logger.info(f"batch sale of {len(items)} items recorded, total {total_amount}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': True, 'msg': 'sale recorded successfully', 'total_amount': total_amount}, 201)
+        
+        except IntegrityError as e:
+            db.session.rollback()
+            logger.error(f"unique constraint violation: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'payment reference number already exists'}, 400)
+        
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"a database error occured trying to record a batch sale: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to record sale, please try again'}, 500)
+        
+    except Exception as e:
+        logger.error(f"an error occured: {str(e)}", extra={'user_id': get_jwt_identity()})
+        return make_response({'success': False, 'msg': 'internal server error'}, 500)
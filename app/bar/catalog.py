@@ -0,0 +1,131 @@
+from collections import OrderedDict, namedtuple
+import threading
+import time
+
+from app.models import Drink, db
+
+CatalogEntry = namedtuple('CatalogEntry', [
+    'id', 'name', 'drink_type', 'volume', 'purchase_price', 'markup', 'shot_price', 'shot_quantity'
+])
+
+class DrinkCatalogCache:
+    """
+    per worker LRU cache of the drink attributes that rarely change.
+    stock is deliberately left out, it is always read and written in the database.
+
+    every invalidation bumps the version counter, a load that started before an
+    invalidation is not stored so a slow read cannot put stale prices back in the cache.
+    entries also expire after `ttl` seconds since edits made on other workers are not seen here,
+    so sales never price from it, they read the prices back from the update that takes the stock.
+    """
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('DRINK_CATALOG_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('DRINK_CATALOG_CACHE_TTL', self.ttl)
+        self.invalidate()
+
+    def get(self, drink_id: int):
+        """
+        return the catalog entry for a drink, loading it from the database on a miss
+
+        Args:
+            drink_id (int): id of the drink
+
+        Returns:
+            CatalogEntry or None if the drink does not exist
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(drink_id)
+            if cached is not None:
+                entry, loaded_at = cached
+                if self.ttl is None or now - loaded_at < self.ttl:
+                    self._entries.move_to_end(drink_id)
+                    return entry
+                del self._entries[drink_id]
+            version = self.version
+
+        row = self._query().filter(Drink.id == drink_id).first()
+        if row is None:
+            return None
+
+        entry = CatalogEntry(*row)
+        self._store(entry, version, now)
+        return entry
+
+    def get_many(self, drink_ids) -> dict:
+        """
+        return the catalog entries for several drinks, every miss is loaded by one query
+
+        Args:
+            drink_ids: ids of the drinks
+
+        Returns:
+            dict: drink id -> CatalogEntry, drinks that do not exist are left out
+        """
+        drink_ids = set(drink_ids)
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for drink_id in drink_ids:
+                cached = self._entries.get(drink_id)
+                if cached is None:
+                    continue
+                entry, loaded_at = cached
+                if self.ttl is None or now - loaded_at < self.ttl:
+                    self._entries.move_to_end(drink_id)
+                    found[drink_id] = entry
+                else:
+                    del self._entries[drink_id]
+            version = self.version
+
+        missing = drink_ids - set(found)
+        if missing:
+            for row in self._query().filter(Drink.id.in_(missing)).all():
+                entry = CatalogEntry(*row)
+                self._store(entry, version, now)
+                found[entry.id] = entry
+        return found
+
+    def prime(self) -> int:
+        """ load up to `maxsize` drinks into the cache with one query, returns how many were loaded """
+        now = time.monotonic()
+        with self._lock:
+            version = self.version
+        rows = self._query().order_by(Drink.id).limit(self.maxsize).all()
+        for row in rows:
+            self._store(CatalogEntry(*row), version, now)
+        return len(rows)
+
+    def _query(self):
+        return db.session.query(
+            Drink.id, Drink.name, Drink.drink_type, Drink.volume, Drink.purchase_price,
+            Drink.markup, Drink.shot_price, Drink.shot_quantity
+        )
+
+    def invalidate(self, drink_id: int = None):
+        """ drop one drink, or the whole catalog when no id is given """
+        with self._lock:
+            self.version += 1
+            if drink_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(drink_id, None)
+
+    def _store(self, entry, version, loaded_at):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[entry.id] = (entry, loaded_at)
+            self._entries.move_to_end(entry.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+drink_catalog = DrinkCatalogCache()
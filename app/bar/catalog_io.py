@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+
+from sqlalchemy import insert, select, tuple_, update
+
+from app.models import DRINK_TYPES, DRINK_VOLUME, Drink, db
+
+CATALOG_FIELDS = ['name', 'drink_type', 'volume', 'stock', 'purchase_price', 'markup', 'shot_price', 'shot_quantity']
+# stock is only written when the row has a value for it so a repricing file does not reset counts
+PRICE_FIELDS = ['drink_type', 'purchase_price', 'markup', 'shot_price', 'shot_quantity']
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+
+def parse_drink_row(data: dict):
+    """
+    validate one catalog row the same way as add_drinks
+
+    Args:
+        data (dict): row from the catalog file, 'category' is accepted for drink_type
+
+    Returns:
+        tuple of (values, None) or (None, error message)
+    """
+    if not isinstance(data, dict):
+        return None, 'row should be an object'
+
+    name = str(data.get('name') or '').strip()
+    drink_type = data.get('drink_type') or data.get('category')
+    volume = data.get('volume')
+
+    if not name:
+        return None, 'name is required'
+
+    if drink_type not in DRINK_TYPES:
+        return None, f"drink types can only be one of: {', '.join(DRINK_TYPES)}"
+
+    if volume not in DRINK_VOLUME:
+        return None, f"drink volume can only be {', '.join(DRINK_VOLUME)}"
+
+    try:
+        values = {
+            'name': name,
+            'drink_type': drink_type,
+            'volume': volume,
+            'purchase_price': float(data.get('purchase_price')),
+            'markup': float(data.get('markup')),
+            'shot_price': float(data.get('shot_price')),
+            'shot_quantity': int(data.get('shot_quantity') or 25),
+        }
+        if data.get('stock') not in (None, ''):
+            values['stock'] = int(data['stock'])
+    except (TypeError, ValueError):
+        return None, 'stock, purchase price, markup, shot price and shot quantity should be numbers'
+
+    if values['purchase_price'] <= 0:
+        return None, 'purchase price cannot be or less than zero'
+
+    if values['markup'] <= 0.0:
+        return None, 'markup cannot be less than or equal to zero'
+
+    if values.get('stock', 0) < 0 or values['shot_price'] < 0 or values['shot_quantity'] <= 0:
+        return None, 'stock, shot price and shot quantity cannot be negative'
+
+    return values, None
+
+def read_catalog(stream, content_type: str):
+    """
+    yield the rows of an uploaded catalog without reading the whole file first
+
+    Args:
+        stream: binary request stream
+        content_type (str): text/csv, application/x-ndjson or application/json
+    """
+    if content_type == 'application/json':
+        # a json array has to be parsed whole, large catalogs should use csv or ndjson
+        rows = json.load(io.TextIOWrapper(stream, encoding='utf-8'))
+        if not isinstance(rows, list):
+            raise ValueError('json catalog should be a list of drinks')
+        yield from rows
+        return
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if content_type == 'application/x-ndjson':
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    elif content_type == 'text/csv':
+        yield from csv.DictReader(text)
+    else:
+        raise ValueError('catalog should be text/csv, application/x-ndjson or application/json')
+
+def _apply_batch(batch: list, summary: dict, dry_run: bool):
+    """ upsert a batch of (row number, values) by name and volume """
+    keys = [(values['name'], values['volume']) for _, values in batch]
+    existing = {}
+    for row in db.session.execute(
+        select(Drink.id, Drink.name, Drink.volume, Drink.stock, *[getattr(Drink, f) for f in PRICE_FIELDS])
+        .where(tuple_(Drink.name, Drink.volume).in_(keys))
+        .order_by(Drink.id)
+    ):
+        existing.setdefault((row.name, row.volume), row)
+
+    inserts, updates = [], []
+    for row_number, values in batch:
+        current = existing.get((values['name'], values['volume']))
+        if current is None:
+            inserts.append(dict({'stock': 0}, **values))
+            summary['created'] += 1
+            if dry_run:
+                summary['changes'].append({'row': row_number, 'action': 'create', 'drink': values})
+            continue
+
+        changed = {
+            field: {'from': getattr(current, field), 'to': values[field]}
+            for field in PRICE_FIELDS + ['stock'] if field in values and getattr(current, field) != values[field]
+        }
+        if not changed:
+            summary['unchanged'] += 1
+            continue
+
+        updates.append(dict({field: change['to'] for field, change in changed.items()}, id=current.id))
+        summary['updated'] += 1
+        if dry_run:
+            summary['changes'].append({'row': row_number, 'action': 'update', 'id': current.id, 'changes': changed})
+
+    if dry_run:
+        return
+    if inserts:
+        db.session.execute(insert(Drink), inserts)
+    # every update dict in an executemany has to set the same columns, so group them
+    by_columns = {}
+    for values in updates:
+        by_columns.setdefault(tuple(sorted(values)), []).append(values)
+    for group in by_columns.values():
+        db.session.execute(update(Drink), group)
+
+def import_catalog(rows, dry_run: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    upsert drinks by name and volume, in the caller's transaction.
+
+    rows are validated one at a time and written a batch at a time with one select, one
+    multi row insert and one executemany update per batch. invalid rows are skipped and
+    reported, a drink repeated in the file keeps its first row.
+
+    Args:
+        rows: iterable of catalog rows
+        dry_run (bool): report what would change without writing anything
+        batch_size (int): rows upserted per batch. Defaults to 500.
+
+    Returns:
+        dict: created, updated and unchanged counts, errors, and the changes when dry_run
+    """
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+    if dry_run:
+        summary['changes'] = []
+
+    seen = {}
+    batch = []
+    for row_number, data in enumerate(rows, start=1):
+        values, error = parse_drink_row(data)
+        if error:
+            summary['errors'].append({'row': row_number, 'msg': error})
+            continue
+
+        key = (values['name'], values['volume'])
+        if key in seen:
+            summary['errors'].append({'row': row_number, 'msg': f"{values['name']} {values['volume']} repeats row {seen[key]}"})
+            continue
+        seen[key] = row_number
+
+        batch.append((row_number, values))
+        if len(batch) >= batch_size:
+            _apply_batch(batch, summary, dry_run)
+            batch = []
+
+    if batch:
+        _apply_batch(batch, summary, dry_run)
+    return summary
+
+def export_catalog(fmt: str = 'csv', batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    yield the drink catalog as csv or ndjson, reading it from the database a batch at a time
+
+    Args:
+        fmt (str): 'csv' or 'ndjson'
+        batch_size (int): rows fetched per round trip
+    """
+    columns = ['id'] + CATALOG_FIELDS
+    stmt = (
+        select(*[getattr(Drink, c) for c in columns])
+        .order_by(Drink.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+
+    for partition in db.session.execute(stmt).partitions():
+        for row in partition:
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
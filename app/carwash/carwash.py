@@ -5,10 +5,15 @@ from sqlalchemy import and_
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from app.extensions import logger
 from app.models import PAYMENT_METHODS, SERVICE_TYPES, CarwashIncome, Staff, db
+from app.rollups import record_carwash_income
+from app.query_budget import query_budget
 
 carwash_bp = Blueprint('carwash_bp', __name__, url_prefix='/api/v1')
 
-@carwash_bp.route('/carwash/add-income', method=['POST'])
+CARWASH_DATE_FORMAT = '%d-%m-%Y, %H:%M'
+
+@carwash_bp.route('/carwash/add-income', methods=['POST'])
+@query_budget(5)
 @jwt_required()
 def add_carwash_income():
     try:
@@ -37,8 +42,8 @@ def add_carwash_income():
             return make_response({'success': False, 'msg': f"carwash service can only be {', '.join(SERVICE_TYPES)}"}, 400)
         
         try:
-            formatted_date = datetime.strftime(date, '%d-%m-%Y, %H-%M')
-        except ValueError:
+            formatted_date = datetime.strptime(date, CARWASH_DATE_FORMAT) if date else None
+        except (TypeError, ValueError):
             return make_response({'success': False, 'msg': 'invalid date format'}, 400)
         
         try:
@@ -48,30 +53,33 @@ def add_carwash_income():
                 amount_charged=amount_charged,
                 payment_method=payment_method,
                 payment_reference_number=payment_reference_number if payment_reference_number else None,
-                service=service,
-                date=formatted_date
+                service=service
             )
+            if formatted_date:
+                new_carwash_income.date = formatted_date
             db.session.add(new_carwash_income)
+            record_carwash_income(service, staff_id, payment_method, amount_charged, day=new_carwash_income.date)
             db.session.commit()
             
             logger.info(f"new carwash income recorded {new_carwash_income.id}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'carwash income recorded successfully'}, 201)
         
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logger.error(f"database error recording carwash income: {str(e)}", extra={'user_id': get_jwt_identity()})
-            return make_response({'success': False, 'msg': 'failed to record carwash income, please try again'}, 500)
-        
         except IntegrityError as e:
             db.session.rollback()
             logger.error(f"unique constraint violation for payment reference number: {str(e)}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': False, 'msg': 'payment reference number exists'}, 400)
         
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"database error recording carwash income: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to record carwash income, please try again'}, 500)
+        
     except Exception as e:
         logger.error(f"an error occured trying to record carwash income: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
-@carwash_bp.route('/carwarsh/income/<id:income_id>/edit', methods=['PUT'])
+@carwash_bp.route('/carwash/income/<int:income_id>/edit', methods=['PUT'])
+@query_budget(7)
 @jwt_required()
 def edit_carwash_income(income_id: int):
     try:
@@ -82,12 +90,17 @@ def edit_carwash_income(income_id: int):
         data = request.get_json()
         
         try:
+            original_income = (
+                carwash_income.service, carwash_income.staff_id, carwash_income.payment_method,
+                carwash_income.amount_charged, carwash_income.date
+            )
+            
             if 'customer' in data:
-                carwash_income.customer = data['cutomer']
+                carwash_income.customer = data['customer']
             
             if 'staff_id' in data:
                 staff = Staff.query.filter(and_(
-                    Staff.id == data['staff_id'], staff.department == 'carwash'
+                    Staff.id == data['staff_id'], Staff.department == 'carwash'
                 )).first()
                 if staff:
                     carwash_income.staff_id = data['staff_id']
@@ -104,7 +117,7 @@ def edit_carwash_income(income_id: int):
                     return make_response({'success': False, 'msg': f'payment method can only be: {', '.join(PAYMENT_METHODS)}'}, 400)
                 
             if 'payment_reference_number' in data:
-                carwash_income.payment_reference_number = data['reference_number']
+                carwash_income.payment_reference_number = data['payment_reference_number']
                 
             if 'service' in data:
                 if data['service'] in SERVICE_TYPES:
@@ -114,30 +127,37 @@ def edit_carwash_income(income_id: int):
                 
             if 'date' in data:
                 try:
-                    formatted_date = datetime.strftime(data['date'], '%d-%m-%Y, %H:%M')
-                    carwash_income.date = formatted_date
-                except ValueError:
+                    carwash_income.date = datetime.strptime(data['date'], CARWASH_DATE_FORMAT)
+                except (TypeError, ValueError):
                     return make_response({'success': False, 'msg': 'invalid date format'}, 400)
             
+            service, staff_id, payment_method, amount_charged, date = original_income
+            record_carwash_income(service, staff_id, payment_method, -amount_charged, income_count=-1, day=date)
+            record_carwash_income(
+                carwash_income.service, carwash_income.staff_id, carwash_income.payment_method,
+                carwash_income.amount_charged, day=carwash_income.date
+            )
+            
             db.session.commit()
             logger.info(f"carwash income entry {carwash_income.id} has been updated", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'income entry updated successfully'}, 200)
 
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logger.error(f"a database error occured trying to update a carwash income entry: {str(e)}", extra={'useer_id': get_jwt_identity()})
-            return make_response({'success': False, 'msg': 'failed to update entry, please try again'}, 400)
-        
         except IntegrityError as e:
             db.session.rollback()
             logger.error(f"unique constraint violation trying to update carwash income: {str(e)}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': False, 'msg': 'payment reference number already exists'}, 400)
         
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"a database error occured trying to update a carwash income entry: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to update entry, please try again'}, 400)
+        
     except Exception as e:
         logger.error(f"an error occured trying to update carwash income entry: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
 @carwash_bp.route('/carwash/income/<int:income_id>/delete', methods=['DELETE'])
+@query_budget(5)
 @jwt_required()
 def delete_carwash_income(income_id):
     try:
@@ -146,6 +166,10 @@ def delete_carwash_income(income_id):
             return make_response({'success': False, 'msg': 'income record not found'}, 404)
         
         try:
+            record_carwash_income(
+                carwash_income.service, carwash_income.staff_id, carwash_income.payment_method,
+                -carwash_income.amount_charged, income_count=-1, day=carwash_income.date
+            )
             db.session.delete(carwash_income)
             db.session.commit()
             
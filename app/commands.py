@@ -1,9 +1,50 @@
+import csv
+from datetime import timedelta
+
 import click
 
+from app.exports.tables import EXPORT_TABLES
 from app.models import User, db
 
 
+class LazyMigrate:
+    """
+    stands in for flask_migrate in app.extensions['migrate'] until migrations are first used,
+    alembic is most of the import time of create_app. the first attribute read, from the
+    `flask db` commands, flask_migrate.upgrade() or migrations/env.py, sets flask_migrate up
+    for the app, which replaces this object and the `db` command with the real ones
+    """
+    def __init__(self, app):
+        self.app = app
+
+    def load(self):
+        from flask_migrate import Migrate
+
+        if self.app.extensions.get('migrate') is self:
+            Migrate().init_app(self.app, db)
+        return self.app.extensions['migrate']
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+class LazyMigrateCommand:
+    """ the `flask db` group, it stands in for flask_migrate's group and loads it on first use """
+    name = 'db'
+
+    def __init__(self, migrate):
+        self.migrate = migrate
+
+    def __getattr__(self, name):
+        from flask_migrate.cli import db as db_group
+
+        self.migrate.load()
+        return getattr(db_group, name)
+
 def register_commands(app):
+    migrate = LazyMigrate(app)
+    app.extensions['migrate'] = migrate
+    app.cli.add_command(LazyMigrateCommand(migrate))
+    
     @app.cli.command("create-superuser")
     @click.option('--username', prompt=True)
     def create_superuser(username):
@@ -14,4 +55,62 @@ def register_commands(app):
             admin.hash_password(password)
             db.session.add(admin)
             db.session.commit()
-            click.echo(f"superuser {username} has been created")
\ No newline at end of file
+            click.echo(f"superuser {username} has been created")
+    
+    @app.cli.command("rebuild-rollups")
+    @click.option('--chunk-size', default=10000, show_default=True, help='source ids aggregated per statement')
+    def rebuild_rollups_command(chunk_size):
+        from app.rollups import rebuild_rollups
+        
+        with app.app_context():
+            upserts = rebuild_rollups(chunk_size=chunk_size, echo=click.echo)
+            click.echo(f"daily rollups rebuilt: {', '.join(f'{table} {count}' for table, count in upserts.items())}")
+    
+    @app.cli.command("import-staff")
+    @click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--chunk-size', default=100, show_default=True, help='staff inserted per transaction')
+    @click.option('--workers', type=int, default=None, help='password hashing processes, defaults to the number of cpus')
+    def import_staff(csv_file, chunk_size, workers):
+        """ onboard staff from a csv with name, phone_number, id_number and department columns """
+        from app.user.onboarding import onboard_staff
+        
+        with app.app_context():
+            rows = list(csv.DictReader(csv_file))
+            report = onboard_staff(rows, chunk_size=chunk_size, workers=workers or app.config.get('STAFF_IMPORT_HASH_WORKERS'))
+            for row in report:
+                if row['status'] != 'created':
+                    click.echo(f"row {row['row']}: {row['status']}, {row['msg']}")
+            created = sum(1 for row in report if row['status'] == 'created')
+            click.echo(f"{created} of {len(rows)} staff profiles created")
+    
+    @app.cli.command("export-parquet")
+    @click.argument('out_dir', type=click.Path(file_okay=False))
+    @click.option('--table', 'tables', multiple=True, type=click.Choice(list(EXPORT_TABLES)), help='table to export, repeat for more, defaults to all')
+    @click.option('--full', is_flag=True, help='rewrite every month instead of the ones changed since the last export')
+    @click.option('--batch-size', default=50000, show_default=True, help='rows fetched and written per batch')
+    @click.option('--overlap-minutes', default=10, show_default=True, help='minutes before the last watermark rescanned for late commits')
+    def export_parquet_command(out_dir, tables, full, batch_size, overlap_minutes):
+        """ write sales and purchases to parquet partitioned by month, point DATABASE_URI at a replica to keep the load off production """
+        from app.exports.parquet import export_parquet
+        
+        with app.app_context():
+            try:
+                rewritten = export_parquet(out_dir, tables=list(tables) or None, full=full, batch_size=batch_size,
+                                           overlap=timedelta(minutes=overlap_minutes), echo=click.echo)
+            except RuntimeError as e:
+                raise click.ClickException(str(e))
+            click.echo(f"months rewritten: {', '.join(f'{table} {count}' for table, count in rewritten.items())}")
+    
+    @app.cli.command("seed-synthetic")
+    @click.option('--drinks', default=200, show_default=True)
+    @click.option('--sales', default=100000, show_default=True, help='bottle, tot and carwash rows in total')
+    @click.option('--days', default=90, show_default=True, help='days of history the sales are spread over')
+    @click.option('--seed', type=int, default=None, help='random seed for a repeatable data set')
+    def seed_synthetic_command(drinks, sales, days, seed):
+        """ fill the database with generated staff, drinks and sales, never run this against production """
+        from app.synthetic import seed_synthetic
+        
+        with app.app_context():
+            created = seed_synthetic(drinks=drinks, sales=sales, days=days, seed=seed, echo=click.echo)
+            click.echo(f"created: {', '.join(f'{table} {count}' for table, count in created.items())}")
+            click.echo("every synthetic staff member logs in with their phone number and the password 'synthetic'")
@@ -0,0 +1,65 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html')
+
+class Compression:
+    """
+    compresses responses larger than `min_size` bytes with brotli or gzip, whichever the client
+    prefers in Accept-Encoding, brotli winning a tie when it is installed.
+
+    streamed responses (the csv exports) are left alone, they are sent as they are produced.
+    an ETag on a compressed response gets the encoding appended, "abc" becomes "abc-gzip", so a
+    cache never serves one encoding for the other
+    """
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.gzip_level = app.config.get('COMPRESS_GZIP_LEVEL', self.gzip_level)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', self.brotli_quality)
+        if self.min_size is None or self.min_size < 0:
+            return
+        app.after_request(self._compress_response)
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _compress_response(self, response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        # the body depends on Accept-Encoding whether or not this one gets compressed
+        response.vary.add('Accept-Encoding')
+
+        if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 304) or request.method == 'HEAD'):
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        response.set_data(self.compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+
+compression = Compression()
@@ -0,0 +1,193 @@
+import functools
+import hashlib
+import threading
+import time
+from datetime import date
+from itertools import chain
+
+from flask import make_response, request
+from sqlalchemy import event, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import TableVersion, db
+
+# suffixes app.compression appends to the ETag of a compressed response
+ENCODING_SUFFIXES = ('', '-br', '-gzip')
+
+def conditional(*models, daily=False):
+    """
+    give a GET view a strong ETag built from the versions of the tables it reads, put it right
+    above the view so authentication runs first. a request whose If-None-Match still matches
+    gets a 304 without the view running, costing at most one query on table_versions
+
+    Args:
+        models: the models whose tables the response is built from
+        daily (bool): the response also depends on today's date, e.g. a report whose default
+            range ends today
+    """
+    tables = tuple(sorted({model.__tablename__ for model in models}))
+    table_versions.watched.update(tables)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            etag = table_versions.etag(tables, daily)
+            # If-None-Match compares weakly, a W/ tag a proxy made from ours still matches.
+            # `*` matches any current representation, which a GET view always has
+            if request.if_none_match.star_tag:
+                matched = etag
+            else:
+                matched = next((etag + suffix for suffix in ENCODING_SUFFIXES
+                                if request.if_none_match.contains_weak(etag + suffix)), None)
+            if matched is not None:
+                response = make_response('', 304)
+                response.set_etag(matched)
+                return response
+
+            response = fn(*args, **kwargs)
+            if response.status_code == 200 and not response.is_streamed:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+class TableVersions:
+    """
+    a change counter per table, bumped once in every commit that inserted, updated or
+    deleted rows of a table a @conditional view reads.
+
+    writes are picked up from the session, orm flushes and insert/update/delete statements run
+    through db.session, so the write endpoints do not have to bump anything themselves. the
+    bump is the last statement of the writing transaction, on the session's own connection, so
+    it commits or rolls back with the rows it describes and a request never holds a second
+    pooled connection for it. the version row stays locked only from the bump to the commit.
+
+    versions are cached for `ttl` seconds per worker, a bump made on this worker clears its
+    cached version straight away, one made on another worker is seen once the cache expires.
+
+    postgres and sqlite bump with one upsert, other databases update the row and insert it
+    when it does not exist yet.
+    """
+    def __init__(self, ttl=2):
+        self.ttl = ttl
+        self.dialect = None
+        self.upsert = True
+        self.watched = set()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('TABLE_VERSION_CACHE_TTL', self.ttl)
+        with app.app_context():
+            self.dialect = db.engine.dialect.name
+        self.upsert = self.dialect in ('postgresql', 'sqlite')
+        with self._lock:
+            self._versions.clear()
+        for name, listener in (('after_flush', self._track_flush), ('do_orm_execute', self._track_statement),
+                               ('before_commit', self._bump_changed), ('after_commit', self._expire_bumped),
+                               ('after_rollback', self._forget_changed)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+
+    def get(self, tables) -> dict:
+        """ current version of each table, 0 for a table that was never written """
+        now = time.monotonic()
+        versions, stale = {}, []
+        with self._lock:
+            for table in tables:
+                cached = self._versions.get(table)
+                if cached is not None and now - cached[1] < self.ttl:
+                    versions[table] = cached[0]
+                else:
+                    stale.append(table)
+        if not stale:
+            return versions
+
+        rows = dict(db.session.query(TableVersion.table_name, TableVersion.version).filter(TableVersion.table_name.in_(stale)).all())
+        with self._lock:
+            for table in stale:
+                versions[table] = rows.get(table, 0)
+                self._versions[table] = (versions[table], now)
+        return versions
+
+    def etag(self, tables, daily=False) -> str:
+        """ tag of the current request, it changes with the table versions and the query string """
+        versions = self.get(tables)
+        parts = [request.path, request.query_string.decode('latin-1')]
+        parts += [f"{table}={versions[table]}" for table in tables]
+        if daily:
+            parts.append(date.today().isoformat())
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+
+    def bump(self, tables, session=None):
+        """
+        add one to the version of each table in the session's current transaction, the caller
+        commits it. the cached versions of this worker are dropped once it commits
+
+        Args:
+            tables (iterable): names of the tables that changed
+            session: session whose transaction the bump joins. Defaults to db.session.
+        """
+        session = session or db.session
+        tables = sorted(tables)
+        if not tables:
+            return
+        # sorted, so two transactions bumping the same tables lock their rows in the same order
+        if self.upsert:
+            session.execute(self._upsert_statement(self.dialect), [{'table_name': table} for table in tables])
+        else:
+            self._update_or_insert(session, tables)
+        session.info.setdefault('bumped_tables', set()).update(tables)
+
+    def _upsert_statement(self, dialect):
+        upsert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        table = TableVersion.__table__
+        stmt = upsert(table).values(version=1)
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.table_name],
+            set_={'version': table.c.version + 1, 'updated_at': func.current_timestamp()}
+        )
+
+    def _update_or_insert(self, session, tables):
+        # two workers inserting the same new table at once make one of them fail on the unique
+        # table_name, that commit fails and the endpoint reports it like any other database error
+        table = TableVersion.__table__
+        for name in tables:
+            updated = session.execute(
+                update(table).where(table.c.table_name == name)
+                .values(version=table.c.version + 1, updated_at=func.current_timestamp())
+            )
+            if updated.rowcount == 0:
+                session.execute(insert(table).values(table_name=name, version=1))
+
+    def _changed(self, session) -> set:
+        return session.info.setdefault('changed_tables', set())
+
+    def _track_flush(self, session, flush_context):
+        # still the pre-flush state here, new/dirty/deleted are what was just written
+        tables = {getattr(obj, '__tablename__', None) for obj in chain(session.new, session.dirty, session.deleted)}
+        self._changed(session).update(tables & self.watched)
+
+    def _track_statement(self, state):
+        if state.is_insert or state.is_update or state.is_delete:
+            table = getattr(state.statement.table, 'name', None)
+            if table in self.watched:
+                self._changed(session=state.session).add(table)
+
+    def _bump_changed(self, session):
+        # the commit flushes after before_commit, flush here so its writes are tracked too
+        session.flush()
+        self.bump(session.info.pop('changed_tables', ()), session)
+
+    def _expire_bumped(self, session):
+        tables = session.info.pop('bumped_tables', ())
+        with self._lock:
+            for table in tables:
+                self._versions.pop(table, None)
+
+    def _forget_changed(self, session):
+        session.info.pop('changed_tables', None)
+        session.info.pop('bumped_tables', None)
+
+
+table_versions = TableVersions()
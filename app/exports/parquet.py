@@ -0,0 +1,143 @@
+from datetime import date, datetime, timedelta, timezone
+import json
+import os
+from pathlib import Path
+
+from sqlalchemy import Boolean, Date, DateTime, Enum, Float, Integer, String, func, select
+
+from app.models import db
+from app.exports.tables import EXPORT_TABLES
+
+STATE_FILE = '_export_state.json'
+PARQUET_BATCH_SIZE = 50000
+# timestamps are taken when a transaction starts on postgres, a row committed after the watermark
+# was read can still be stamped before it. the next run looks back this far to pick such rows up
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+def _arrow_type(pa, column):
+    """ arrow type for a table column """
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column.type, Date):
+        return pa.date32()
+    if isinstance(column.type, (Enum, String)):
+        return pa.string()
+    raise TypeError(f"no parquet type for {column.table.name}.{column.name} ({column.type})")
+
+def _month_start(day) -> date:
+    return date(day.year, day.month, 1)
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def _changed_months(model, date_column, since):
+    """ months of the date column that hold a row created or updated at or after `since`, all months when None """
+    day = func.date(date_column, type_=db.Date)
+    stmt = select(day).distinct()
+    if since is not None:
+        stmt = stmt.where(func.coalesce(model.updated_at, model.created_at) >= since)
+    return sorted({_month_start(d) for d in db.session.execute(stmt).scalars() if d is not None})
+
+def _write_month(pa, pq, model, date_column, month, path, batch_size):
+    """
+    write the rows of one month to `path`, through a temporary file that replaces it at the end
+    so readers never see a half written partition
+
+    Returns:
+        int: rows written, the partition is removed when the month has none
+    """
+    columns = list(model.__table__.columns)
+    schema = pa.schema([pa.field(c.name, _arrow_type(pa, c), nullable=c.nullable) for c in columns])
+    stmt = (
+        select(*columns)
+        .where(date_column >= month, date_column < _next_month(month))
+        .order_by(date_column, model.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    rows = 0
+    writer = None
+    try:
+        for partition in db.session.execute(stmt).partitions():
+            values = list(zip(*partition))
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(values[i], type=field.type) for i, field in enumerate(schema)], schema=schema
+            )
+            if writer is None:
+                writer = pq.ParquetWriter(str(tmp_path), schema, compression='zstd')
+            writer.write_batch(batch)
+            rows += len(partition)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if rows:
+        os.replace(tmp_path, path)
+    elif path.exists():
+        path.unlink()
+    return rows
+
+def export_parquet(out_dir, tables=None, full=False, batch_size=PARQUET_BATCH_SIZE, overlap=WATERMARK_OVERLAP, echo=None) -> dict:
+    """
+    write the sales and purchases tables to parquet, one file per table and month:
+    <out_dir>/<table>/month=YYYY-MM/data.parquet
+
+    after the first run only months with rows created or updated since the previous run are
+    rewritten, the high water mark of coalesce(updated_at, created_at) per table is kept in
+    <out_dir>/_export_state.json and the next run starts `overlap` before it. deleted rows and
+    rows moved to another month are only dropped from the old month by a full export.
+
+    Args:
+        out_dir (str): folder the partitions are written to
+        tables (list): tables to export. Defaults to every table in EXPORT_TABLES.
+        full (bool): rewrite every month instead of only the changed ones
+        batch_size (int): rows fetched and written per batch
+        overlap (timedelta): how far before the watermark changes are looked for, it should
+            exceed the longest write transaction. Defaults to WATERMARK_OVERLAP.
+        echo (callable): optional progress printer
+
+    Returns:
+        dict: number of months rewritten per table
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('parquet export needs pyarrow, install it with pip install pyarrow')
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state_path = out_dir / STATE_FILE
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+
+    rewritten = {}
+    for table in tables or list(EXPORT_TABLES):
+        model, date_column = EXPORT_TABLES[table]
+        since = None if full or table not in state else datetime.fromisoformat(state[table]['watermark']) - overlap
+
+        # read before the export so changes made while it runs are picked up next time
+        watermark = db.session.execute(select(func.max(func.coalesce(model.updated_at, model.created_at)))).scalar()
+        months = _changed_months(model, date_column, since)
+        for month in months:
+            path = out_dir / table / f"month={month:%Y-%m}" / 'data.parquet'
+            rows = _write_month(pa, pq, model, date_column, month, path, batch_size)
+            if echo:
+                echo(f"{table} {month:%Y-%m}: {rows} rows")
+        db.session.rollback()
+
+        rewritten[table] = len(months)
+        if watermark is not None:
+            state[table] = {'watermark': watermark.isoformat(), 'exported_at': datetime.now(timezone.utc).isoformat()}
+            tmp_state = state_path.with_name(f".{STATE_FILE}.tmp")
+            tmp_state.write_text(json.dumps(state, indent=2))
+            os.replace(tmp_state, state_path)
+
+    return rewritten
@@ -0,0 +1,92 @@
+import csv
+from datetime import timedelta
+import io
+
+from flask import Blueprint, Response, make_response, request, stream_with_context
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import select
+
+from app.models import CarwashIncome, DrinkPurchases, DrinkSales, TotSales, db
+from app.extensions import logger
+from app.reports.sales import parse_date_range
+from app.query_budget import query_budget
+from app.replica import read_only
+
+exports_bp = Blueprint('exports_bp', __name__, url_prefix='/api/v1')
+
+# table name in the url: (model, column the from and to range applies to)
+EXPORT_TABLES = {
+    'drink_sales': (DrinkSales, DrinkSales.created_at),
+    'tot_sales': (TotSales, TotSales.created_at),
+    'drink_purchases': (DrinkPurchases, DrinkPurchases.created_at),
+    'carwash_income': (CarwashIncome, CarwashIncome.date),
+}
+
+EXPORT_BATCH_SIZE = 2000
+
+def stream_csv(model, date_column, start, end, batch_size=EXPORT_BATCH_SIZE):
+    """
+    yield every row of a table between two dates as csv, one batch of rows per chunk.
+
+    rows are fetched through a server side cursor `batch_size` at a time, so memory
+    use depends on the batch size and not on how many rows are in the range
+
+    Args:
+        model: model of the table to export
+        date_column: column the range applies to
+        start (date): first day included
+        end (date): first day excluded
+        batch_size (int): rows fetched per round trip and written per chunk
+    """
+    columns = list(model.__table__.columns)
+    stmt = (
+        select(*columns)
+        .where(date_column >= start, date_column < end)
+        .order_by(date_column, model.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([c.name for c in columns])
+    result = db.session.execute(stmt)
+    try:
+        for partition in result.partitions():
+            writer.writerows(partition)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        result.close()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@exports_bp.route('/exports/<table>.csv', methods=['GET'])
+@query_budget(2)
+@read_only
+@jwt_required()
+def export_table(table: str):
+    """
+    download the rows of a sales or purchases table as csv
+
+    query params:
+        from, to: inclusive dates in YYYY-MM-DD format, defaults to the last 30 days
+    """
+    if table not in EXPORT_TABLES:
+        return make_response({'success': False, 'msg': f"only {', '.join(EXPORT_TABLES)} can be exported"}, 404)
+
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError:
+        return make_response({'success': False, 'msg': 'from and to should be dates in the format YYYY-MM-DD'}, 400)
+
+    if start >= end:
+        return make_response({'success': False, 'msg': 'from cannot be after to'}, 400)
+
+    model, date_column = EXPORT_TABLES[table]
+    logger.info(f"exporting {table} from {start} to {end}", extra={'user_id': get_jwt_identity()})
+
+    response = Response(stream_with_context(stream_csv(model, date_column, start, end)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f"attachment; filename={table}_{start.isoformat()}_{(end - timedelta(days=1)).isoformat()}.csv"
+    return response
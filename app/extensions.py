@@ -1,26 +1,44 @@
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 import os
 from pathlib import Path
+import queue
+import sys
+import threading
 
-from flask import has_request_context
+from flask import g, has_request_context
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 
-class UserContextFilter(logging.Filter):
-    """ filter to add user context to log errors to avoid raising exceptions"""
-    def filter(self, record):
+def request_user_id() -> str:
+    """
+    id of the user making the current request, 'SYSTEM' when there is none.
+    resolved once per request and kept on flask.g, so log calls do not verify the token again
+    """
+    if not has_request_context():
+        return 'SYSTEM'
+    
+    user_id = g.get('_log_user_id')
+    if user_id is None:
         user_id = 'SYSTEM'
-        
-        if has_request_context():
+        try:
             try:
+                # already verified by jwt_required, no need to decode the token again
+                current_user = get_jwt_identity()
+            except RuntimeError:
                 verify_jwt_in_request(optional=True)
                 current_user = get_jwt_identity()
-                if current_user:
-                    user_id = str(current_user)
-            except Exception:
-                pass
-        
-        record.user_id = user_id
+            if current_user:
+                user_id = str(current_user)
+        except Exception:
+            pass
+        g._log_user_id = user_id
+    return user_id
+
+class UserContextFilter(logging.Filter):
+    """ filter to add user context to log errors to avoid raising exceptions"""
+    def filter(self, record):
+        record.user_id = request_user_id()
         return True
 
 
@@ -35,7 +53,65 @@ def ensure_log_directory(log_path):
     if log_dir and not os.path.exists(log_dir):
         os.makedirs(log_dir, exist_ok=True)
         
-def setup_logging(log_level='INFO', log_dir='logs', log_file='app.log', error_log_file='errors.log') -> logging.Logger:
+class BoundedQueueHandler(QueueHandler):
+    """
+    queue handler that never blocks the caller, when the queue is full the record is
+    dropped and counted instead.
+
+    the listener that writes the queued records is started lazily in each process, so
+    workers forked from a preloaded master get their own writer thread and files
+    """
+    def __init__(self, handler_factory, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.handler_factory = handler_factory
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        
+        with self._lock:
+            if self._pid == pid:
+                return
+            # a queue inherited through fork can hold the parent's records, start with a fresh one
+            self.queue = queue.Queue(self.maxsize)
+            self._listener = QueueListener(self.queue, *self.handler_factory(), respect_handler_level=True)
+            self._listener.start()
+            self._pid = pid
+            atexit.register(self._listener.stop)
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+def worker_log_path(path: Path) -> Path:
+    """ the path with this process's pid before the suffix, logs/app.log becomes logs/app.1234.log """
+    return path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}")
+
+def per_worker_log_files(setting) -> bool:
+    """
+    resolve LOG_PER_WORKER_FILES, 'auto' writes per worker files when running under gunicorn,
+    where several worker processes would otherwise rotate the same files
+
+    Args:
+        setting (str): 'true', 'false' or 'auto'
+    """
+    setting = str(setting).lower()
+    if setting == 'auto':
+        return 'gunicorn' in sys.modules
+    return setting == 'true'
+
+def setup_logging(log_level='INFO', log_dir='logs', log_file='app.log', error_log_file='errors.log',
+                  queue_size=0, per_worker_files=False) -> logging.Logger:
     """
     setup logging configurstion for the application
 
@@ -44,17 +120,17 @@ def setup_logging(log_level='INFO', log_dir='logs', log_file='app.log', error_lo
         log_dir (str): directory for the log fiiles
         log_file (str): name of the main log file Defaults to 'app.log'.
         error_log_file (str): name of the main error log file Defaults to 'errors.log'.
+        queue_size (int): when above zero, request threads only put records on a queue of this size
+            and a background thread writes them. Defaults to 0, writing on the calling thread.
+        per_worker_files (bool): write to app.<pid>.log and errors.<pid>.log so every worker
+            process rotates its own files. the files are opened by the queue listener each
+            process starts, so this always queues, without a bound when queue_size is 0.
+            Defaults to False.
     """
     log_level = log_level.upper()
     numeric_level = getattr(logging, log_level, logging.INFO)
     
-        
     log_dir_path = Path(log_dir)
-    app_log_path = str(log_dir_path / log_file)
-    error_log_path = str(log_dir_path / error_log_file)
-    
-    ensure_log_directory(app_log_path)
-    ensure_log_directory(error_log_path)
     
     logger = logging.getLogger()
     for handler in logger.handlers[:]:
@@ -66,38 +142,76 @@ def setup_logging(log_level='INFO', log_dir='logs', log_file='app.log', error_lo
     )
     user_filter = UserContextFilter()
     
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    console_handler.setLevel(numeric_level)
-    console_handler.addFilter(user_filter)
-    logger.addHandler(console_handler)
-    
-    file_handler = TimedRotatingFileHandler(
-        filename=app_log_path, when='midnight', interval=1, backupCount=30, encoding='utf-8'
-    )
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.INFO)
-    file_handler.addFilter(user_filter)
-    
     def app_log_filter(record):
         return record.levelno < logging.ERROR
     
-    file_handler.addFilter(app_log_filter)
-    logger.addHandler(file_handler)
+    def build_handlers():
+        app_log_path = log_dir_path / log_file
+        error_log_path = log_dir_path / error_log_file
+        if per_worker_files:
+            app_log_path = worker_log_path(app_log_path)
+            error_log_path = worker_log_path(error_log_path)
+        
+        ensure_log_directory(str(app_log_path))
+        ensure_log_directory(str(error_log_path))
+        
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        console_handler.setLevel(numeric_level)
+        
+        file_handler = TimedRotatingFileHandler(
+            filename=str(app_log_path), when='midnight', interval=1, backupCount=30, encoding='utf-8'
+        )
+        file_handler.setFormatter(formatter)
+        file_handler.setLevel(logging.INFO)
+        file_handler.addFilter(app_log_filter)
+        
+        error_handler = TimedRotatingFileHandler(
+            filename=str(error_log_path), when='midnight', interval=1, backupCount=30, encoding='utf-8'
+        )
+        error_handler.setFormatter(formatter)
+        error_handler.setLevel(logging.ERROR)
+        
+        return [console_handler, file_handler, error_handler]
     
-    error_handler = TimedRotatingFileHandler(
-        filename=error_log_path, when='midnight', interval=1, backupCount=30, encoding='utf-8'
-    )
-    error_handler.setFormatter(formatter)
-    error_handler.setLevel(logging.ERROR)
-    error_handler.addFilter(user_filter)
-    logger.addHandler(error_handler)
+    # a file opened here would be inherited by every worker forked from a preloaded master,
+    # per worker files are only opened by the listener each process starts for itself
+    if queue_size > 0 or per_worker_files:
+        # the user filter needs the request context so it runs before the record is queued
+        queue_handler = BoundedQueueHandler(build_handlers, queue_size)
+        queue_handler.setLevel(min(numeric_level, logging.INFO))
+        queue_handler.addFilter(user_filter)
+        logger.addHandler(queue_handler)
+    else:
+        for handler in build_handlers():
+            handler.addFilter(user_filter)
+            logger.addHandler(handler)
     
     logger.setLevel(logging.DEBUG)
     
     return logger
 
 
-logger = setup_logging()
-    
-    
\ No newline at end of file
+# settings logging was last set up with in this process
+_logging_settings = None
+
+def configure_logging(app):
+    """
+    set up logging from the app config, called by create_app. creating another app with the
+    same settings keeps the handlers already in place
+
+    Args:
+        app: the flask app
+    """
+    global _logging_settings
+    settings = (app.config['LOG_LEVEL'], app.config['LOG_DIR'], app.config['LOG_QUEUE_SIZE'], app.config['LOG_PER_WORKER_FILES'])
+    if settings == _logging_settings:
+        return
+    log_level, log_dir, queue_size, per_worker_files = settings
+    setup_logging(log_level=log_level, log_dir=log_dir, queue_size=queue_size,
+                  per_worker_files=per_worker_log_files(per_worker_files))
+    _logging_settings = settings
+
+
+# records go to the handlers configure_logging puts on the root logger
+logger = logging.getLogger('app')
@@ -0,0 +1,277 @@
+import bisect
+import hmac
+import logging
+import os
+import threading
+import time
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from app.models import db
+from app.replica import replica_router
+from app.user.security import login_throttle, password_hashes
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+# where /metrics answers without METRICS_TOKEN
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values]
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values: [count per bucket + overflow, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+def _label_worker(line, worker):
+    """ add the worker label to a sample line, comment lines are returned unchanged """
+    if line.startswith('#'):
+        return line
+    end = min(i for i in (line.find('{'), line.find(' ')) if i != -1)
+    if line[end] == '{':
+        return f'{line[:end]}{{worker="{worker}",{line[end + 1:]}'
+    return f'{line[:end]}{{worker="{worker}"}}{line[end:]}'
+
+def _gauge(name, help_text, samples):
+    """ render a gauge from (label names, label values, value) samples """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_format_labels(names, values)} {value}" for names, values, value in samples]
+    return lines
+
+class Metrics:
+    """
+    collects request latency and status codes per endpoint, the number and duration of sql
+    statements per request through engine events, and how long requests wait for a pooled
+    connection. the per request work is a few counter updates under a lock.
+
+    metrics are kept per worker process and a scrape reads the worker that answered it, so every
+    series carries a `worker` label with its pid. each series then only ever grows, sum without
+    the worker label in queries, e.g. sum without (worker) (rate(lilysplace_http_responses_total[5m]))
+    """
+    def __init__(self):
+        self.request_latency = Histogram(
+            'lilysplace_http_request_duration_seconds', 'time spent handling a request', ('endpoint', 'method')
+        )
+        self.responses = Counter(
+            'lilysplace_http_responses_total', 'responses sent by status code', ('endpoint', 'method', 'status')
+        )
+        self.request_statements = Histogram(
+            'lilysplace_http_request_sql_statements', 'sql statements executed per request', ('endpoint',), STATEMENT_BUCKETS
+        )
+        self.request_sql_time = Histogram(
+            'lilysplace_http_request_sql_duration_seconds', 'time spent executing sql per request', ('endpoint',)
+        )
+        self.pool_wait = Histogram(
+            'lilysplace_db_pool_checkout_wait_seconds', 'time spent waiting for a pooled connection', ('bind',), POOL_WAIT_BUCKETS
+        )
+        self.engines = {}
+        self.collectors = []
+
+    def init_app(self, app):
+        """ register the request hooks, the engine and pool instrumentation and the /metrics endpoint """
+        with app.app_context():
+            for bind, engine in db.engines.items():
+                self.instrument_engine(engine, bind or 'default')
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.view, methods=['GET'])
+
+    def add_collector(self, collector):
+        """ add a callable returning extra prometheus text lines on every scrape """
+        self.collectors.append(collector)
+
+    def instrument_engine(self, engine, bind):
+        self.engines[bind] = engine
+        # dispose() swaps in a new pool, _engine_disposed wraps that one too
+        for name, listener in (('before_cursor_execute', self._before_cursor_execute),
+                               ('after_cursor_execute', self._after_cursor_execute),
+                               ('handle_error', self._handle_error), ('engine_disposed', self._engine_disposed)):
+            if not event.contains(engine, name, listener):
+                event.listen(engine, name, listener)
+        self._wrap_pool(engine, bind)
+
+    def _engine_disposed(self, engine):
+        for bind, instrumented in self.engines.items():
+            if instrumented is engine:
+                self._wrap_pool(engine, bind)
+
+    def _wrap_pool(self, engine, bind):
+        pool = engine.pool
+        if getattr(pool, '_metrics_wrapped', False):
+            return
+        connect = pool.connect
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                self.pool_wait.observe(time.perf_counter() - started, bind)
+
+        pool.connect = timed_connect
+        pool._metrics_wrapped = True
+
+    def _start_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_statements = 0
+        g._metrics_sql_seconds = 0.0
+
+    def _finish_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is None or request.endpoint == 'metrics':
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        self.request_latency.observe(time.perf_counter() - started, endpoint, request.method)
+        self.responses.inc(endpoint, request.method, response.status_code)
+        self.request_statements.observe(g.get('_metrics_statements', 0), endpoint)
+        self.request_sql_time.observe(g.get('_metrics_sql_seconds', 0.0), endpoint)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_started'].pop()
+        if has_request_context() and '_metrics_started' in g:
+            g._metrics_statements += 1
+            g._metrics_sql_seconds += time.perf_counter() - started
+
+    def _handle_error(self, context):
+        if context.connection is not None and context.connection.info.get('_metrics_started'):
+            context.connection.info['_metrics_started'].pop()
+
+    def _pool_lines(self):
+        samples = {'size': [], 'checked_out': [], 'overflow': []}
+        for bind, engine in self.engines.items():
+            pool = engine.pool
+            for name, method in (('size', 'size'), ('checked_out', 'checkedout'), ('overflow', 'overflow')):
+                if hasattr(pool, method):
+                    # overflow() is negative until the pool has opened `size` connections
+                    samples[name].append((('bind',), (bind,), max(0, getattr(pool, method)())))
+        lines = []
+        for name, help_text in (('size', 'configured pool size'), ('checked_out', 'connections in use'),
+                                ('overflow', 'connections opened past the pool size')):
+            if samples[name]:
+                lines += _gauge(f"lilysplace_db_pool_{name}", help_text, samples[name])
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.request_latency, self.responses, self.request_statements, self.request_sql_time, self.pool_wait):
+            lines += metric.render()
+        lines += self._pool_lines()
+        for collector in self.collectors:
+            lines += collector()
+        worker = os.getpid()
+        return '\n'.join(_label_worker(line, worker) for line in lines) + '\n'
+
+    def view(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return Response('unauthorized\n', status=401, mimetype='text/plain')
+        if not token and request.remote_addr not in LOOPBACK_ADDRESSES:
+            return Response('forbidden, set METRICS_TOKEN to scrape from another host\n', status=403, mimetype='text/plain')
+        return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def app_collectors():
+    """ metrics kept by the logging queue, password hashing pool, login throttle and replica router """
+    lines = []
+    dropped = sum(getattr(handler, 'dropped', 0) for handler in logging.getLogger().handlers)
+    lines += [
+        '# HELP lilysplace_log_records_dropped_total log records dropped because the log queue was full',
+        '# TYPE lilysplace_log_records_dropped_total counter',
+        f"lilysplace_log_records_dropped_total {dropped}",
+    ]
+
+    stats = password_hashes.stats()
+    lines += [
+        '# HELP lilysplace_password_checks_total password checks and new hashes run on the hashing pool',
+        '# TYPE lilysplace_password_checks_total counter',
+        f"lilysplace_password_checks_total {stats['checks']}",
+        '# HELP lilysplace_password_checks_rejected_total password checks refused because the pool queue was full or timed out',
+        '# TYPE lilysplace_password_checks_rejected_total counter',
+        f"lilysplace_password_checks_rejected_total {stats['rejected']}",
+        '# HELP lilysplace_password_check_wait_seconds_total time password checks waited for a hashing thread',
+        '# TYPE lilysplace_password_check_wait_seconds_total counter',
+        f"lilysplace_password_check_wait_seconds_total {stats['wait_seconds_total']}",
+        '# HELP lilysplace_password_check_wait_seconds_max longest wait for a hashing thread',
+        '# TYPE lilysplace_password_check_wait_seconds_max gauge',
+        f"lilysplace_password_check_wait_seconds_max {stats['wait_seconds_max']}",
+        '# HELP lilysplace_login_throttled_total login attempts rejected by the throttle',
+        '# TYPE lilysplace_login_throttled_total counter',
+        f"lilysplace_login_throttled_total {login_throttle.rejected}",
+    ]
+
+    if replica_router.enabled:
+        lines += [
+            '# HELP lilysplace_db_read_only_requests_total read only requests by the database they read from',
+            '# TYPE lilysplace_db_read_only_requests_total counter',
+        ]
+        lines += [f'lilysplace_db_read_only_requests_total{{target="{target}"}} {count}'
+                  for target, count in sorted(replica_router.routed.items())]
+        if replica_router.lag is not None:
+            lines += _gauge('lilysplace_db_replica_lag_seconds', 'replica lag at the last probe', [((), (), replica_router.lag)])
+    return lines
+
+
+metrics = Metrics()
+metrics.add_collector(app_collectors)
@@ -2,6 +2,7 @@ from email.policy import default
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.replica import RoutingSession
 
 metadata = MetaData(
     naming_convention={
@@ -13,7 +14,7 @@ metadata = MetaData(
     }
 )
 
-db = SQLAlchemy(metadata=metadata)
+db = SQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
 
 class AuditMixin:
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
@@ -39,6 +40,7 @@ class User(AuditMixin, db.Model):
     username = db.Column(db.String, nullable=False, unique=True)
     role = db.Column(db.Enum('bar', 'restaurant', 'carwash', 'manager', name='user_role'), nullable=False)
     password_hash = db.Column(db.String, nullable=False)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     def hash_password(self, password):
        self.password_hash = generate_password_hash(password)
@@ -90,11 +92,18 @@ class OpenBottle(db.Model, AuditMixin):
     __tablename__ = 'open_bottle'
     
     id = db.Column(db.Integer, primary_key=True)
-    drink_id = db.Column(db.Integer, db.ForeignKey('drinks.id'), nullable=False, unique=True)
+    drink_id = db.Column(db.Integer, db.ForeignKey('drinks.id'), nullable=False)
+    # a finished bottle keeps its row at 0 shots, its tot sales still reference it
     shots_remaining = db.Column(db.Integer, nullable=False)
     
     drink = db.relationship('Drink', backref='open_bottle')
     
+    __table_args__ = (
+        # one bottle of a drink open at a time, finished bottles are left out
+        db.Index('uq_open_bottle_drink_id_open', 'drink_id', unique=True,
+                 postgresql_where=db.text('shots_remaining > 0'), sqlite_where=db.text('shots_remaining > 0')),
+    )
+    
 class DrinkPurchases(db.Model, AuditMixin):
     __tablename__ = 'drink_purchases'
     
@@ -113,6 +122,9 @@ class TotSales(db.Model, AuditMixin):
     
     id = db.Column(db.Integer, primary_key=True)
     open_bottle_id = db.Column(db.Integer, db.ForeignKey('open_bottle.id'), nullable=False)
+    # copied from the bottle when the sale is made, only null for sales older than this column
+    # whose bottle was deleted before it was added
+    drink_id = db.Column(db.Integer, db.ForeignKey('drinks.id'), nullable=True)
     shot_quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     payment_method = db.Column(db.Enum(*PAYMENT_METHODS, name='tot_payment_method'), nullable=False)
@@ -121,6 +133,13 @@ class TotSales(db.Model, AuditMixin):
     
     open_bottle = db.relationship('OpenBottle', backref='tot_sales')
     
+    __table_args__ = (
+        db.Index('ix_tot_sales_created_at', 'created_at'),
+        db.Index('ix_tot_sales_sold_by_created_at', 'sold_by', 'created_at'),
+        db.Index('ix_tot_sales_open_bottle_id_created_at', 'open_bottle_id', 'created_at'),
+        db.Index('ix_tot_sales_drink_id_created_at', 'drink_id', 'created_at'),
+    )
+    
 class DrinkSales(db.Model, AuditMixin):
     __tablename__ = 'drink_sales'
     
@@ -134,4 +153,58 @@ class DrinkSales(db.Model, AuditMixin):
     sold_by = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=True)
     
     drink = db.relationship('Drink', backref='drink_sales')
-    staff = db.relationship('Staff', backref='drink_sales')
\ No newline at end of file
+    staff = db.relationship('Staff', backref='drink_sales')
+    
+    __table_args__ = (
+        db.Index('ix_drink_sales_created_at', 'created_at'),
+        db.Index('ix_drink_sales_sold_by_created_at', 'sold_by', 'created_at'),
+        db.Index('ix_drink_sales_drink_id_created_at', 'drink_id', 'created_at'),
+    )
+    
+class BarDailySales(db.Model):
+    __tablename__ = 'bar_daily_sales'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    drink_id = db.Column(db.Integer, db.ForeignKey('drinks.id'), nullable=False)
+    sale_kind = db.Column(db.String, nullable=False)
+    # 0 for sales that were not recorded against a staff member
+    staff_id = db.Column(db.Integer, nullable=False)
+    payment_method = db.Column(db.String, nullable=False)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'drink_id', 'sale_kind', 'staff_id', 'payment_method'),
+    )
+    
+class CarwashDailyIncome(db.Model):
+    __tablename__ = 'carwash_daily_income'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    service = db.Column(db.String, nullable=False)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
+    payment_method = db.Column(db.String, nullable=False)
+    income_count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'service', 'staff_id', 'payment_method'),
+    )
+    
+class RevokedToken(db.Model, AuditMixin):
+    __tablename__ = 'revoked_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+class TableVersion(db.Model, AuditMixin):
+    __tablename__ = 'table_versions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False, unique=True)
+    # bumped after every commit that wrote to the table, list endpoints build their ETags from it
+    version = db.Column(db.Integer, nullable=False, default=0)
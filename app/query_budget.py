@@ -0,0 +1,170 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+from app.models import db
+from app.slow_queries import normalize_sql
+
+logger = logging.getLogger('app')
+
+# counters currently recording, a request and a count_queries() block inside it both see its statements
+_active_counters = ContextVar('query_counters', default=())
+
+class QueryBudgetExceeded(AssertionError):
+    """ raised in strict mode when a request runs more statements than its endpoint allows """
+
+class QueryCounter:
+    """ the sql statements run while it was active, with literals and bind markers replaced by ? """
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, limit: int = 1) -> dict:
+        """
+        statements that ran more than `limit` times, the usual sign of a lazy load or a
+        query inside a loop (N+1)
+
+        Returns:
+            dict: normalized statement -> times it ran
+        """
+        times = {}
+        for statement in self.statements:
+            times[statement] = times.get(statement, 0) + 1
+        return {statement: n for statement, n in times.items() if n > limit}
+
+class QueryBudget:
+    """
+    the most statements an endpoint may run per request, and how many times the same
+    statement with other parameters may run in it
+
+    Args:
+        limit (int): statements allowed per request
+        repeats (int): times one statement may run. Defaults to QUERY_REPEAT_LIMIT.
+    """
+    def __init__(self, limit: int, repeats: int = None):
+        self.limit = limit
+        self.repeats = repeats
+
+    def violations(self, counter: QueryCounter, default_repeats: int) -> list:
+        problems = []
+        if counter.count > self.limit:
+            problems.append(f"{counter.count} statements, budget is {self.limit}")
+        repeats = self.repeats if self.repeats is not None else default_repeats
+        for statement, n in counter.repeated(repeats).items():
+            problems.append(f"ran {n} times: {statement}")
+        return problems
+
+def query_budget(limit: int, repeats: int = None):
+    """
+    declare the statement budget of a view, put it right under the route decorator.
+    the view is returned unchanged, the budget is checked after each request
+
+    Args:
+        limit (int): statements allowed per request
+        repeats (int): times one statement may run. Defaults to QUERY_REPEAT_LIMIT.
+    """
+    def decorator(fn):
+        fn.query_budget = QueryBudget(limit, repeats)
+        return fn
+    return decorator
+
+@contextmanager
+def count_queries():
+    """
+    count the statements run inside the block, on every bind
+
+        with count_queries() as queries:
+            client.get('/api/v1/drinks/open-bottle')
+        assert queries.count <= 2 and not queries.repeated()
+    """
+    counter = QueryCounter()
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    counters = _active_counters.get()
+    if counters:
+        # an insert of many rows can be sent as several batches, count it once like an executemany
+        if context is not None:
+            if getattr(context, '_query_budget_counted', False):
+                return
+            context._query_budget_counted = True
+        normalized = normalize_sql(statement)
+        for counter in counters:
+            counter.statements.append(normalized)
+
+class QueryBudgets:
+    """
+    counts the statements of every request and checks them against the budget the endpoint
+    declared with @query_budget. a request over budget, or one that repeats a statement, is
+    logged as a warning, with QUERY_BUDGET_STRICT it raises QueryBudgetExceeded so a test or
+    benchmark run fails instead of shipping the N+1
+    """
+    def __init__(self):
+        self.strict = False
+        self.repeat_limit = 2
+
+    def init_app(self, app):
+        self.strict = app.config.get('QUERY_BUDGET_STRICT', self.strict)
+        self.repeat_limit = app.config.get('QUERY_REPEAT_LIMIT', self.repeat_limit)
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', _record_statement):
+                    event.listen(engine, 'before_cursor_execute', _record_statement)
+
+        app.before_request(self._start_request)
+        app.after_request(self._check_request)
+        app.teardown_request(self._end_request)
+
+    def _start_request(self):
+        counter = QueryCounter()
+        g._query_counter = counter
+        g._query_counter_token = _active_counters.set(_active_counters.get() + (counter,))
+
+    def _check_request(self, response):
+        counter = g.get('_query_counter')
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if counter is None or budget is None:
+            return response
+
+        if response.is_streamed:
+            # a streamed body runs its queries after this hook and after the first teardown, keep
+            # counting until the server closes the response and check then
+            token = g.pop('_query_counter_token')
+            method, endpoint = request.method, request.endpoint
+
+            def check_streamed():
+                _active_counters.reset(token)
+                self._check(budget, counter, method, endpoint)
+
+            response.call_on_close(check_streamed)
+        else:
+            self._check(budget, counter, request.method, request.endpoint)
+        return response
+
+    def _check(self, budget, counter, method, endpoint):
+        problems = budget.violations(counter, self.repeat_limit)
+        if problems:
+            message = f"query budget exceeded on {method} {endpoint}: " + '; '.join(problems)
+            logger.warning(message)
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+
+    def _end_request(self, exc):
+        token = g.pop('_query_counter_token', None)
+        g.pop('_query_counter', None)
+        if token is not None:
+            _active_counters.reset(token)
+
+
+query_budgets = QueryBudgets()
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+
+# seconds the replica is behind the primary, 0 when it has replayed everything it received
+POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+logger = logging.getLogger('app')
+
+def read_only(fn):
+    """
+    let a view that only reads run its queries on the read replica, put it right under the
+    route decorator. the view is returned unchanged
+    """
+    fn.read_only = True
+    return fn
+
+class RoutingSession(Session):
+    """
+    flask-sqlalchemy session that sends the reads of a replica routed request to the
+    replica bind. flushes, insert/update/delete statements, SELECT ... FOR UPDATE and
+    statements run with execution_options(primary=True) always go to the primary. the
+    request is routed before the view's @jwt_required runs, the token checks use the
+    option so a token revoked a moment ago is not accepted by a lagging replica
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause) -> bool:
+        if not has_request_context() or not g.get('_read_replica'):
+            return False
+        if self._flushing or isinstance(clause, UpdateBase):
+            return False
+        if clause is not None and clause.get_execution_options().get('primary'):
+            return False
+        return getattr(clause, '_for_update_arg', None) is None
+
+class ReplicaRouter:
+    """
+    routes the requests of @read_only views to the read replica when SQLALCHEMY_BINDS has one.
+
+    the primary is read instead when the client wrote something in the last
+    `read_your_writes_seconds`, every successful write sets a short lived cookie for that, or
+    when the replica is more than `max_lag_seconds` behind. the lag is probed at most once per
+    `lag_check_interval` seconds per worker, a replica that cannot be reached counts as lagging.
+    """
+    def __init__(self, max_lag_seconds=5.0, lag_check_interval=5.0, read_your_writes_seconds=5,
+                 cookie_name='read_primary'):
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.cookie_name = cookie_name
+        self.enabled = False
+        self.lag = None
+        self.routed = {'replica': 0, 'primary': 0}
+        self._engine = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_lag_seconds = app.config.get('REPLICA_MAX_LAG_SECONDS', self.max_lag_seconds)
+        self.lag_check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', self.lag_check_interval)
+        self.read_your_writes_seconds = app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', self.read_your_writes_seconds)
+        self.enabled = REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+        if not self.enabled:
+            return
+
+        with app.app_context():
+            self._engine = app.extensions['sqlalchemy'].engines[REPLICA_BIND]
+        app.before_request(self._route_request)
+        app.after_request(self._remember_write)
+
+    def lagging(self) -> bool:
+        """ whether the replica is too far behind to read from, probing it when the last check is stale """
+        now = time.monotonic()
+        stale = self._checked_at is None or now - self._checked_at >= self.lag_check_interval
+        # one request per worker probes, the others use the last result meanwhile
+        if stale and self._lock.acquire(blocking=False):
+            try:
+                self.lag = self.probe_lag()
+            except Exception as e:
+                logger.warning(f"read replica lag probe failed, reading from the primary: {str(e)}")
+                self.lag = None
+            finally:
+                self._checked_at = now
+                self._lock.release()
+        return self.lag is None or self.lag > self.max_lag_seconds
+
+    def probe_lag(self) -> float:
+        """ seconds the replica is behind the primary """
+        if self._engine.dialect.name != 'postgresql':
+            # a copied sqlite file has no replication stream to fall behind on
+            return 0.0
+        with self._engine.connect() as conn:
+            return float(conn.execute(POSTGRES_LAG_QUERY).scalar() or 0.0)
+
+    def _route_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'read_only', False):
+            return
+        if request.cookies.get(self.cookie_name) or self.lagging():
+            self.routed['primary'] += 1
+            return
+        g._read_replica = True
+        self.routed['replica'] += 1
+
+    def _remember_write(self, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=self.read_your_writes_seconds, httponly=True, samesite='Lax',
+                secure=current_app.config.get('JWT_COOKIE_SECURE', True)
+            )
+        return response
+
+
+replica_router = ReplicaRouter()
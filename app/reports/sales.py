@@ -0,0 +1,122 @@
+from datetime import date, timedelta
+from flask import Blueprint, make_response, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import func
+from app.models import Drink, DrinkSales, Staff, TotSales, db
+from app.etags import conditional
+from app.extensions import logger
+from app.query_budget import query_budget
+from app.replica import read_only
+
+reports_bp = Blueprint('reports_bp', __name__, url_prefix='/api/v1')
+
+REPORT_GROUPS = ['day', 'drink', 'staff', 'payment_method']
+
+DEFAULT_REPORT_DAYS = 30
+
+def parse_date_range(args):
+    """
+    read the from and to query params, both are inclusive dates in YYYY-MM-DD format
+
+    Returns:
+        tuple of (start, end) where end is the day after `to`, so callers filter created_at < end
+    """
+    end = date.fromisoformat(args['to']) if args.get('to') else date.today()
+    start = date.fromisoformat(args['from']) if args.get('from') else end - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+    return start, end + timedelta(days=1)
+
+def _grouped_sales(group_by, start, end, model, quantity, amount, drink_id):
+    """
+    sum one sales table over the date range, grouped in the database
+
+    Args:
+        group_by (str): one of REPORT_GROUPS
+        model: DrinkSales or TotSales
+        quantity: column holding the units sold
+        amount: column holding the amount charged
+        drink_id: column holding the drink id of the sale
+    """
+    if group_by == 'day':
+        key = func.date(model.created_at, type_=db.Date)
+        label = None
+    elif group_by == 'drink':
+        key = drink_id
+        label = Drink.name
+    elif group_by == 'staff':
+        key = model.sold_by
+        label = Staff.name
+    else:
+        key = model.payment_method
+        label = None
+
+    columns = [key.label('key'), func.count(model.id), func.sum(quantity), func.sum(amount)]
+    if label is not None:
+        columns.append(label.label('label'))
+
+    query = db.session.query(*columns).filter(model.created_at >= start, model.created_at < end)
+    # an outer join keeps old tot sales without a drink id in the totals, under a null drink
+    if group_by == 'drink':
+        query = query.outerjoin(Drink, Drink.id == drink_id)
+    elif group_by == 'staff':
+        query = query.outerjoin(Staff, Staff.id == model.sold_by)
+
+    group_columns = [key, label] if label is not None else [key]
+    return query.group_by(*group_columns).all()
+
+@reports_bp.route('/reports/sales', methods=['GET'])
+@query_budget(4)
+@read_only
+@jwt_required()
+@conditional(DrinkSales, TotSales, Drink, Staff, daily=True)
+def sales_report():
+    """
+    bottle and tot sales totals between two dates
+
+    query params:
+        from, to: inclusive dates in YYYY-MM-DD format, defaults to the last 30 days
+        group_by: day, drink, staff or payment_method, defaults to day
+    """
+    try:
+        group_by = request.args.get('group_by', 'day')
+        if group_by not in REPORT_GROUPS:
+            return make_response({'success': False, 'msg': f"sales can only be grouped by {', '.join(REPORT_GROUPS)}"}, 400)
+        
+        try:
+            start, end = parse_date_range(request.args)
+        except ValueError:
+            return make_response({'success': False, 'msg': 'from and to should be dates in the format YYYY-MM-DD'}, 400)
+        
+        if start >= end:
+            return make_response({'success': False, 'msg': 'from cannot be after to'}, 400)
+        
+        bottles = _grouped_sales(group_by, start, end, DrinkSales, DrinkSales.quantity, DrinkSales.amount, DrinkSales.drink_id)
+        tots = _grouped_sales(group_by, start, end, TotSales, TotSales.shot_quantity, TotSales.price, TotSales.drink_id)
+        
+        report = {}
+        for sales, quantity_key, amount_key in ((bottles, 'bottles_sold', 'bottle_sales'), (tots, 'shots_sold', 'shot_sales')):
+            for row in sales:
+                key = row.key.isoformat() if group_by == 'day' else row.key
+                entry = report.setdefault(key, {
+                    group_by: key, 'sales_count': 0, 'bottles_sold': 0, 'bottle_sales': 0.0,
+                    'shots_sold': 0, 'shot_sales': 0.0, 'total_amount': 0.0
+                })
+                if 'label' in row._fields:
+                    entry['name'] = row.label
+                entry['sales_count'] += row[1]
+                entry[quantity_key] += row[2] or 0
+                entry[amount_key] = round(entry[amount_key] + (row[3] or 0), 2)
+                entry['total_amount'] = round(entry['total_amount'] + (row[3] or 0), 2)
+        
+        rows = sorted(report.values(), key=lambda r: (r[group_by] is None, r[group_by]))
+        return make_response({
+            'success': True,
+            'from': start.isoformat(),
+            'to': (end - timedelta(days=1)).isoformat(),
+            'group_by': group_by,
+            'sales': rows,
+            'total_amount': round(sum(r['total_amount'] for r in rows), 2)
+        }, 200)
+    
+    except Exception as e:
+        logger.error(f"an error occured generating a sales report: {str(e)}", extra={'user_id': get_jwt_identity()})
+        return make_response({'success': False, 'msg': 'internal server error'}, 500)
@@ -0,0 +1,228 @@
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import BarDailySales, CarwashDailyIncome, CarwashIncome, DrinkSales, TotSales, db
+
+BAR_ROLLUP_KEY = ['day', 'drink_id', 'sale_kind', 'staff_id', 'payment_method']
+BAR_ROLLUP_TOTALS = ['sales_count', 'quantity', 'amount']
+
+CARWASH_ROLLUP_KEY = ['day', 'service', 'staff_id', 'payment_method']
+CARWASH_ROLLUP_TOTALS = ['income_count', 'amount']
+
+# databases with INSERT ... ON CONFLICT DO UPDATE, the others take the update then insert path
+UPSERT_DIALECTS = ('postgresql', 'sqlite')
+
+def _upsert_statement(model, key, totals, dialect):
+    """
+    build an insert that adds to the totals of an existing rollup row instead of failing
+
+    Args:
+        model: rollup model
+        key (list): columns of the rollup unique constraint
+        totals (list): columns that are summed
+        dialect (str): postgresql or sqlite
+    """
+    table = model.__table__
+    stmt = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[c] for c in key],
+        set_={c: table.c[c] + stmt.excluded[c] for c in totals}
+    )
+
+def _add_to_rollup(model, key, totals, rows, **shared):
+    """
+    add rows to the totals of a rollup in the caller's transaction, creating the rollup rows
+    that do not exist yet. postgres and sqlite do it with one upsert, other databases update
+    each row and insert it when nothing was updated
+
+    Args:
+        model: rollup model
+        key (list): columns of the rollup unique constraint
+        totals (list): columns that are summed
+        rows (list): dicts with the key and total columns
+        shared: values every row has, they may be sql expressions
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in UPSERT_DIALECTS:
+        stmt = _upsert_statement(model, key, totals, dialect)
+        db.session.execute(stmt.values(**shared) if shared else stmt, rows)
+        return
+
+    # two transactions creating the same rollup row at once make the later insert fail on the
+    # unique key, that sale fails and is retried by the client like any other database error
+    table = model.__table__
+    for row in rows:
+        row = {**row, **shared}
+        updated = db.session.execute(
+            update(table).where(*[table.c[c] == row[c] for c in key]).values({c: table.c[c] + row[c] for c in totals})
+        )
+        if updated.rowcount == 0:
+            db.session.execute(insert(table).values(**row))
+
+def _rollup_day(day):
+    """ the rollup day for a sale, today on the database clock when no day is given """
+    if day is None:
+        return func.date(func.current_timestamp(), type_=db.Date)
+    if isinstance(day, datetime):
+        return day.date()
+    return day
+
+def record_bar_sale(drink_id, sale_kind, staff_id, payment_method, quantity, amount, sales_count=1, day=None):
+    """
+    add a bottle or tot sale to the daily bar rollup, in the caller's transaction.
+    pass negative values to take an edited sale back out
+
+    Args:
+        drink_id (int): id of the drink sold
+        sale_kind (str): 'bottle' or 'tot'
+        staff_id (int): staff member who made the sale
+        payment_method (str): payment method of the sale
+        quantity (int): bottles or shots sold
+        amount (float): amount charged
+        sales_count (int): number of sales rows this covers. Defaults to 1.
+        day (date): day of the sale. Defaults to today.
+    """
+    _add_to_rollup(BarDailySales, BAR_ROLLUP_KEY, BAR_ROLLUP_TOTALS, [{
+        'drink_id': drink_id, 'sale_kind': sale_kind, 'staff_id': staff_id or 0, 'payment_method': payment_method,
+        'sales_count': sales_count, 'quantity': quantity, 'amount': amount
+    }], day=_rollup_day(day))
+
+def record_bar_sales(sales, day=None):
+    """
+    add several sales to the daily bar rollup with one executemany, in the caller's transaction
+
+    Args:
+        sales (list): dicts with the drink_id, sale_kind, staff_id, payment_method, sales_count,
+            quantity and amount of each rollup row, one dict per rollup key
+        day (date): day of the sales. Defaults to today.
+    """
+    if not sales:
+        return
+    _add_to_rollup(BarDailySales, BAR_ROLLUP_KEY, BAR_ROLLUP_TOTALS, [
+        {**sale, 'staff_id': sale['staff_id'] or 0} for sale in sales
+    ], day=_rollup_day(day))
+
+def record_carwash_income(service, staff_id, payment_method, amount, income_count=1, day=None):
+    """
+    add a carwash income entry to the daily carwash rollup, in the caller's transaction.
+    pass negative values to take an edited entry back out
+
+    Args:
+        service (str): carwash service
+        staff_id (int): staff member who did the service
+        payment_method (str): payment method, None is recorded as 'unknown'
+        amount (float): amount charged
+        income_count (int): number of income rows this covers. Defaults to 1.
+        day (date): day of the service. Defaults to today.
+    """
+    _add_to_rollup(CarwashDailyIncome, CARWASH_ROLLUP_KEY, CARWASH_ROLLUP_TOTALS, [{
+        'service': service, 'staff_id': staff_id, 'payment_method': payment_method or 'unknown',
+        'income_count': income_count, 'amount': amount
+    }], day=_rollup_day(day))
+
+def _backfill(id_column, max_id, source, constants, rollup, key, totals, chunk_size, echo):
+    """
+    aggregate one source table into its rollup, one id range at a time, in the caller's transaction
+
+    Args:
+        id_column: primary key column of the source table
+        max_id (int): last id aggregated, read when the rollups were cleared
+        source: select of the non constant key columns followed by the total columns
+        constants (dict): key columns that are the same for every row of the source
+        rollup: rollup model
+        key (list): rollup key columns
+        totals (list): rollup total columns
+    """
+    if max_id is None:
+        return 0
+
+    columns = [c for c in key if c not in constants] + totals
+    group_by = source.selected_columns[:len(key) - len(constants)]
+    low = 0
+    rows_written = 0
+    while low < max_id:
+        high = low + chunk_size
+        groups = db.session.execute(
+            source.where(id_column > low, id_column <= high).group_by(*group_by)
+        ).all()
+        if groups:
+            _add_to_rollup(rollup, key, totals, [dict(zip(columns, g), **constants) for g in groups])
+            rows_written += len(groups)
+        if echo:
+            echo(f"{id_column.table.name}: aggregated up to id {min(high, max_id)} of {max_id}")
+        low = high
+    return rows_written
+
+def rebuild_rollups(chunk_size=10000, echo=None):
+    """
+    rebuild the daily rollups from the sales and income tables, in one transaction.
+
+    the rollups are locked against writes before they are cleared, every endpoint that records
+    or edits a sale updates a rollup in its own transaction so those wait until the rebuild
+    commits, on postgres up to DB_STATEMENT_TIMEOUT_MS. run it when the bar is quiet.
+    the source tables are read a chunk of ids at a time so memory stays flat, tot sales
+    recorded before tot_sales had a drink_id and whose bottle was deleted are left out
+
+    Args:
+        chunk_size (int): number of source ids aggregated per statement
+        echo (callable): optional progress printer
+
+    Returns:
+        dict: number of rollup upserts per source table
+    """
+    try:
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text(
+                f"LOCK TABLE {BarDailySales.__tablename__}, {CarwashDailyIncome.__tablename__} IN EXCLUSIVE MODE"
+            ))
+        # on sqlite the delete takes the database write lock, held until the commit
+        db.session.query(BarDailySales).delete()
+        db.session.query(CarwashDailyIncome).delete()
+        max_ids = db.session.execute(select(
+            select(func.max(DrinkSales.id)).scalar_subquery(),
+            select(func.max(TotSales.id)).scalar_subquery(),
+            select(func.max(CarwashIncome.id)).scalar_subquery()
+        )).one()
+
+        drink_sales = select(
+            func.date(DrinkSales.created_at, type_=db.Date),
+            DrinkSales.drink_id,
+            func.coalesce(DrinkSales.sold_by, 0),
+            DrinkSales.payment_method,
+            func.count(DrinkSales.id),
+            func.sum(DrinkSales.quantity),
+            func.sum(DrinkSales.amount)
+        )
+        tot_sales = select(
+            func.date(TotSales.created_at, type_=db.Date),
+            TotSales.drink_id,
+            TotSales.sold_by,
+            TotSales.payment_method,
+            func.count(TotSales.id),
+            func.sum(TotSales.shot_quantity),
+            func.sum(TotSales.price)
+        ).where(TotSales.drink_id.isnot(None))
+        carwash_income = select(
+            func.date(CarwashIncome.date, type_=db.Date),
+            CarwashIncome.service,
+            CarwashIncome.staff_id,
+            func.coalesce(CarwashIncome.payment_method, 'unknown'),
+            func.count(CarwashIncome.id),
+            func.sum(CarwashIncome.amount_charged)
+        )
+
+        upserts = {
+            'drink_sales': _backfill(DrinkSales.id, max_ids[0], drink_sales, {'sale_kind': 'bottle'}, BarDailySales,
+                                     BAR_ROLLUP_KEY, BAR_ROLLUP_TOTALS, chunk_size, echo),
+            'tot_sales': _backfill(TotSales.id, max_ids[1], tot_sales, {'sale_kind': 'tot'}, BarDailySales,
+                                   BAR_ROLLUP_KEY, BAR_ROLLUP_TOTALS, chunk_size, echo),
+            'carwash_income': _backfill(CarwashIncome.id, max_ids[2], carwash_income, {}, CarwashDailyIncome,
+                                        CARWASH_ROLLUP_KEY, CARWASH_ROLLUP_TOTALS, chunk_size, echo),
+        }
+        db.session.commit()
+        return upserts
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,64 @@
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger('app')
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    json provider backed by orjson, several times faster than the stdlib encoder on the large
+    list responses. dates, decimals and other types orjson does not know go through the same
+    `default` as the stdlib provider, keys are sorted the same way. non ascii text is written
+    as utf-8 instead of \\u escapes.
+
+    calls passing stdlib json arguments (indent, cls, ...) fall back to the stdlib provider
+    """
+    def _options(self) -> int:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        options = self._options() | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            options |= orjson.OPT_INDENT_2
+        # the encoded bytes go straight into the response, no round trip through str
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=options), mimetype=self.mimetype)
+
+JSON_PROVIDERS = {'orjson': OrjsonProvider, 'stdlib': DefaultJSONProvider}
+
+def json_provider(app, name: str = None):
+    """
+    the json provider for an app, registered by create_app
+
+    Args:
+        app: the flask app
+        name (str): 'orjson', 'stdlib' or 'auto' for orjson when it is installed. Defaults to JSON_PROVIDER.
+    """
+    name = name or app.config.get('JSON_PROVIDER', 'auto')
+    if name not in ('auto', *JSON_PROVIDERS):
+        raise ValueError(f"JSON_PROVIDER can only be auto, {', '.join(JSON_PROVIDERS)}")
+    if name in ('auto', 'orjson') and orjson is None:
+        if name == 'orjson':
+            logger.warning('JSON_PROVIDER is orjson but orjson is not installed, using the stdlib encoder')
+        name = 'stdlib'
+    elif name == 'auto':
+        name = 'orjson'
+    return JSON_PROVIDERS[name](app)
@@ -0,0 +1,185 @@
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+from pathlib import Path
+import queue
+import random
+import re
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from app.extensions import BoundedQueueHandler, per_worker_log_files, worker_log_path
+from app.models import db
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|(?<![:\w]):\w+|\$\d+'), '?'),
+    (re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?, ...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+def normalize_sql(statement: str) -> str:
+    """ replace literals and bind markers with ? so the same query with other values groups together """
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+def parameter_shape(parameters, executemany: bool):
+    """ type names of the bound parameters, the values themselves are never logged """
+    if executemany:
+        rows = list(parameters or [])
+        return {'rows': len(rows), 'shape': parameter_shape(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+class SlowQueryLog:
+    """
+    flags sql statements slower than `threshold_ms` and writes them, with the endpoint that ran
+    them and an EXPLAIN plan, to a dedicated rotating log. the log goes through the same queued
+    pipeline as the app logs and follows LOG_PER_WORKER_FILES and LOG_QUEUE_SIZE.
+
+    only `sample_rate` of the slow statements are captured and each distinct statement is
+    explained at most once per `explain_interval` seconds. the EXPLAIN and the file write run on
+    a background thread with its own connection, the request thread only times the statement
+    and queues the capture, dropping it when the queue is full.
+    """
+    def __init__(self, threshold_ms=200, sample_rate=1.0, explain=True, explain_interval=300, max_pending=100):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.max_pending = max_pending
+        self.captured = 0
+        self.dropped = 0
+        self.logger = logging.getLogger('app.slow_queries')
+        self._explained = {}
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', self.threshold_ms)
+        self.sample_rate = app.config.get('SLOW_QUERY_SAMPLE_RATE', self.sample_rate)
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', self.explain)
+        self.explain_interval = app.config.get('SLOW_QUERY_EXPLAIN_INTERVAL', self.explain_interval)
+        if self.threshold_ms is None or self.threshold_ms < 0:
+            return
+
+        log_path = Path(app.config.get('LOG_DIR', 'logs')) / app.config.get('SLOW_QUERY_LOG_FILE', 'slow_queries.log')
+        per_worker_files = per_worker_log_files(app.config.get('LOG_PER_WORKER_FILES', 'auto'))
+
+        def build_handlers():
+            # opened by the listener of the process that writes, like the app logs
+            path = worker_log_path(log_path) if per_worker_files else log_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(str(path), maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            return [handler]
+
+        for old in self.logger.handlers[:]:
+            self.logger.removeHandler(old)
+        self.logger.addHandler(BoundedQueueHandler(build_handlers, app.config.get('LOG_QUEUE_SIZE', 10000)))
+        self.logger.setLevel(logging.INFO)
+        # slow queries have their own file, keep them out of app.log
+        self.logger.propagate = False
+
+        with app.app_context():
+            for engine in db.engines.values():
+                for name, listener in (('before_cursor_execute', self._before_cursor_execute),
+                                       ('after_cursor_execute', self._after_cursor_execute)):
+                    if not event.contains(engine, name, listener):
+                        event.listen(engine, name, listener)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < self.threshold_ms or conn.info.get('_slow_query_explain'):
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        capture = {
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration_ms': round(elapsed_ms, 2),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'method': request.method if has_request_context() else None,
+            'sql': normalize_sql(statement),
+            'params': parameter_shape(parameters, executemany),
+        }
+        explain_parameters = (parameters[0] if parameters else None) if executemany else parameters
+        self._enqueue((conn.engine, statement, explain_parameters, capture))
+
+    def _enqueue(self, item):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._queue = queue.Queue(self.max_pending)
+            threading.Thread(target=self._work, name='slow-query-log', daemon=True).start()
+            self._pid = pid
+
+    def _work(self):
+        while True:
+            engine, statement, parameters, capture = self._queue.get()
+            try:
+                if self.explain and self._should_explain(capture['sql']):
+                    capture['plan'] = self._explain(engine, statement, parameters)
+                self.logger.info(json.dumps(capture, default=str))
+                with self._lock:
+                    self.captured += 1
+            except Exception as e:
+                capture['explain_error'] = str(e)
+                self.logger.info(json.dumps(capture, default=str))
+
+    def _should_explain(self, normalized: str) -> bool:
+        if normalized.split(' ', 1)[0].upper() not in ('SELECT', 'WITH', 'UPDATE', 'DELETE'):
+            return False
+        now = time.monotonic()
+        last = self._explained.get(normalized)
+        if last is not None and now - last < self.explain_interval:
+            return False
+        if len(self._explained) > 10000:
+            self._explained.clear()
+        self._explained[normalized] = now
+        return True
+
+    def _explain(self, engine, statement, parameters):
+        """ run EXPLAIN for a captured statement on a separate connection, never EXPLAIN ANALYZE """
+        prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+        with engine.connect() as conn:
+            conn.info['_slow_query_explain'] = True
+            try:
+                rows = conn.exec_driver_sql(prefix + statement, parameters if parameters is not None else ()).all()
+            finally:
+                conn.info.pop('_slow_query_explain', None)
+                conn.rollback()
+        if engine.dialect.name == 'sqlite':
+            return [row[-1] for row in rows]
+        return [row[0] for row in rows]
+
+
+slow_queries = SlowQueryLog()
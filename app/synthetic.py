@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta, timezone
+import random
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from app.models import (DRINK_TYPES, DRINK_VOLUME, PAYMENT_METHODS, SERVICE_TYPES, CarwashIncome, Drink, DrinkSales,
+                        OpenBottle, Staff, TotSales, User, db)
+from app.rollups import rebuild_rollups
+
+SYNTHETIC_PASSWORD = 'synthetic'
+SEED_CHUNK_SIZE = 10000
+
+# share of bottle, tot and carwash rows in the generated sales
+SALE_MIX = {'bottle': 0.6, 'tot': 0.3, 'carwash': 0.1}
+
+def _insert_chunks(model, rows, echo=None):
+    """ bulk insert generated rows a chunk per transaction """
+    written = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= SEED_CHUNK_SIZE:
+            db.session.execute(insert(model), chunk)
+            db.session.commit()
+            written += len(chunk)
+            chunk = []
+            if echo:
+                echo(f"{model.__tablename__}: {written} rows")
+    if chunk:
+        db.session.execute(insert(model), chunk)
+        db.session.commit()
+        written += len(chunk)
+    return written
+
+def _insert_staff(department, count, password_hash):
+    """ create `count` users and staff in a department, returns the staff ids """
+    first = (db.session.execute(select(func.max(User.id))).scalar() or 0) + 1
+    suffixes = [f"{9 * 10 ** 7 + first + n:08d}" for n in range(count)]
+    user_ids = db.session.execute(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        [{'username': f"07{s}", 'role': department, 'password_hash': password_hash} for s in suffixes]
+    ).scalars().all()
+    staff_ids = db.session.execute(
+        insert(Staff).returning(Staff.id, sort_by_parameter_order=True),
+        [{'name': f"{department} staff {s}", 'phone_number': f"07{s}", 'id_number': s, 'department': department,
+          'user_id': user_id} for s, user_id in zip(suffixes, user_ids)]
+    ).scalars().all()
+    db.session.commit()
+    return staff_ids
+
+def seed_synthetic(drinks=200, sales=100000, bar_staff=8, carwash_staff=4, days=90, seed=None, echo=None) -> dict:
+    """
+    bulk generate a realistic looking bar and carwash history for benchmarks and local testing.
+
+    sales are spread over the last `days` days with more of them in the evenings and at
+    weekends, a few popular drinks take most of the sales. every generated user has the
+    password 'synthetic'. the daily rollups are rebuilt at the end.
+
+    Args:
+        drinks (int): drinks to create
+        sales (int): bottle, tot and carwash rows to create in total
+        bar_staff (int): bar staff to create
+        carwash_staff (int): carwash staff to create, none when there are no SERVICE_TYPES
+        days (int): days of history
+        seed (int): random seed for a repeatable data set
+
+    Returns:
+        dict: rows created per table
+    """
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+    created = {}
+
+    bar_ids = _insert_staff('bar', bar_staff, password_hash)
+    carwash_ids = _insert_staff('carwash', carwash_staff, password_hash) if SERVICE_TYPES else []
+    created['staff'] = len(bar_ids) + len(carwash_ids)
+
+    drink_rows = []
+    for n in range(drinks):
+        purchase_price = round(rng.uniform(200, 6000), -1)
+        drink_type = rng.choice(DRINK_TYPES)
+        drink_rows.append({
+            'name': f"{drink_type.lower()} {n}",
+            'drink_type': drink_type,
+            'volume': rng.choice(DRINK_VOLUME),
+            'stock': rng.randint(20, 500),
+            'purchase_price': purchase_price,
+            'markup': round(rng.uniform(0.2, 0.6), 2),
+            'shot_price': round(purchase_price / 20, -1) or 10.0,
+            'shot_quantity': rng.choice([20, 25, 30]),
+        })
+    drink_ids = db.session.execute(insert(Drink).returning(Drink.id, sort_by_parameter_order=True), drink_rows).scalars().all()
+    db.session.commit()
+    created['drinks'] = len(drink_ids)
+    prices = {drink_id: row for drink_id, row in zip(drink_ids, drink_rows)}
+
+    # spirits sold by the tot keep one bottle open each
+    open_drinks = [d for d in drink_ids if prices[d]['volume'] in ('750 ml', '1L')][:max(1, drinks // 4)]
+    bottle_ids = db.session.execute(
+        insert(OpenBottle).returning(OpenBottle.id, OpenBottle.drink_id, sort_by_parameter_order=True),
+        [{'drink_id': d, 'shots_remaining': prices[d]['shot_quantity']} for d in open_drinks]
+    ).all() if open_drinks else []
+    db.session.commit()
+    created['open_bottle'] = len(bottle_ids)
+
+    # a few drinks take most of the sales
+    drink_weights = [1 / (rank + 1) for rank in range(len(drink_ids))]
+    bottle_weights = [1 / (rank + 1) for rank in range(len(bottle_ids))]
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    weekday_weights = [1, 1, 1, 1.3, 2, 2.5, 1.6]
+    hour_weights = [0.3 if h < 12 else 1 if h < 17 else 3 for h in range(24)]
+
+    def sale_time():
+        while True:
+            moment = now - timedelta(days=rng.randrange(days), hours=rng.randrange(24), minutes=rng.randrange(60))
+            if rng.random() * 7.5 < weekday_weights[moment.weekday()] * hour_weights[moment.hour]:
+                return moment
+
+    mix = dict(SALE_MIX)
+    if not bottle_ids:
+        mix['bottle'] += mix.pop('tot')
+    if not carwash_ids:
+        mix['bottle'] += mix.pop('carwash')
+    counts = {kind: int(sales * share) for kind, share in mix.items()}
+    counts['bottle'] += sales - sum(counts.values())
+
+    def bottle_sales():
+        for drink_id in rng.choices(drink_ids, drink_weights, k=counts['bottle']):
+            drink = prices[drink_id]
+            quantity = rng.choices([1, 2, 3, 6, 12], [70, 15, 7, 5, 3])[0]
+            unit_price = (drink['purchase_price'] * drink['markup'] + drink['purchase_price']) * 1.16
+            yield {
+                'drink_id': drink_id, 'quantity': quantity, 'sale_type': 'wholesale' if quantity >= 6 else 'retail',
+                'payment_method': rng.choice(PAYMENT_METHODS), 'amount': round(unit_price * quantity, 2),
+                'sold_by': rng.choice(bar_ids), 'created_at': sale_time(),
+            }
+
+    def tot_sales():
+        for bottle_id, drink_id in rng.choices(bottle_ids, bottle_weights, k=counts.get('tot', 0)):
+            shots = rng.choices([1, 2, 3], [60, 30, 10])[0]
+            yield {
+                'open_bottle_id': bottle_id, 'drink_id': drink_id, 'shot_quantity': shots, 'price': prices[drink_id]['shot_price'] * shots,
+                'payment_method': rng.choice(PAYMENT_METHODS), 'sold_by': rng.choice(bar_ids), 'created_at': sale_time(),
+            }
+
+    def carwash_income():
+        for _ in range(counts.get('carwash', 0)):
+            moment = sale_time()
+            yield {
+                'customer': f"KD{rng.choice('ABCDEFGH')} {rng.randint(100, 999)}{rng.choice('ABCDEFGH')}",
+                'staff_id': rng.choice(carwash_ids), 'amount_charged': float(rng.choice([300, 500, 800, 1500])),
+                'payment_method': rng.choice(PAYMENT_METHODS), 'service': rng.choice(SERVICE_TYPES),
+                'date': moment, 'created_at': moment,
+            }
+
+    created['drink_sales'] = _insert_chunks(DrinkSales, bottle_sales(), echo)
+    created['tot_sales'] = _insert_chunks(TotSales, tot_sales(), echo)
+    created['carwash_income'] = _insert_chunks(CarwashIncome, carwash_income(), echo)
+
+    rebuild_rollups(echo=echo)
+    return created
@@ -0,0 +1,153 @@
+from datetime import datetime, timezone
+from functools import wraps
+import threading
+import time
+
+from flask import make_response
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+from app.models import RevokedToken, Staff, User, db
+
+class TokenVersionCache:
+    """
+    per worker cache of each user's token version.
+
+    a token carries the version it was issued with in the `tv` claim, bumping the
+    version in the database revokes every token issued before. versions are cached
+    for `ttl` seconds so checking a token does not cost a query on every request,
+    a bump made on another worker is picked up once the cached version expires.
+    """
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('TOKEN_VERSION_CACHE_TTL', self.ttl)
+        with self._lock:
+            self._versions.clear()
+
+    def get(self, user_id: int):
+        """ current token version of a user, None if the user no longer exists """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._versions.get(user_id)
+        if cached is not None and now - cached[1] < self.ttl:
+            return cached[0]
+
+        version = db.session.query(User.token_version).filter(User.id == user_id).execution_options(primary=True).scalar()
+        with self._lock:
+            self._versions[user_id] = (version, now)
+        return version
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._versions.pop(user_id, None)
+
+
+class RevokedTokenList:
+    """
+    refresh tokens revoked one at a time, e.g. on logout.
+
+    revocations are stored in the database so every worker sees them, and kept in
+    memory until the token expires so a revoked token is only looked up once per worker.
+    """
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    def revoke(self, jti: str, expires: int):
+        """
+        revoke a single token, runs in the caller's transaction. call remember once it commits
+
+        Args:
+            jti (str): id of the token
+            expires (int): exp claim of the token
+        """
+        expires_at = datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+        db.session.query(RevokedToken).filter(RevokedToken.expires_at < datetime.now(timezone.utc).replace(tzinfo=None)).delete(synchronize_session=False)
+        db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+
+    def remember(self, jti: str, expires: int):
+        """ cache a revocation after its transaction committed, a rolled back one is never cached """
+        with self._lock:
+            self._revoked[jti] = expires
+
+    def is_revoked(self, jti: str) -> bool:
+        now = time.time()
+        with self._lock:
+            for expired in [j for j, exp in self._revoked.items() if exp < now]:
+                del self._revoked[expired]
+            if jti in self._revoked:
+                return True
+
+        row = db.session.query(RevokedToken.expires_at).filter(RevokedToken.jti == jti).execution_options(primary=True).first()
+        if row is None:
+            return False
+        with self._lock:
+            self._revoked[jti] = row.expires_at.replace(tzinfo=timezone.utc).timestamp()
+        return True
+
+
+token_versions = TokenVersionCache()
+revoked_tokens = RevokedTokenList()
+
+def staff_claims(user: User) -> dict:
+    """
+    extra claims added to a user's access token so endpoints can authorize
+    without looking up the staff profile
+
+    Args:
+        user (User): user logging in
+    """
+    staff = Staff.query.filter_by(user_id=user.id).first()
+    return {
+        'staff_id': staff.id if staff else None,
+        'department': staff.department if staff else None,
+        'role': user.role,
+        'tv': user.token_version
+    }
+
+def is_token_revoked(jwt_header, jwt_payload) -> bool:
+    """
+    token_in_blocklist_loader callback, rejects tokens issued before the user's last revocation.
+    refresh tokens are rare and long lived so they are checked against the database, not the cache.
+    the lookups always read the primary, also in a request routed to the read replica
+    """
+    version = jwt_payload.get('tv')
+    user_id = int(jwt_payload['sub'])
+    if jwt_payload.get('type') == 'refresh':
+        if revoked_tokens.is_revoked(jwt_payload['jti']):
+            return True
+        return db.session.query(User.token_version).filter(User.id == user_id).execution_options(primary=True).scalar() != version
+
+    if version is None:
+        return False
+    return token_versions.get(user_id) != version
+
+def revoke_tokens(user_id: int):
+    """
+    revoke every token issued to a user, runs in the caller's transaction.
+    call token_versions.invalidate(user_id) once it has been committed
+    """
+    db.session.query(User).filter(User.id == user_id).update(
+        {User.token_version: User.token_version + 1}, synchronize_session=False
+    )
+
+def department_required(*departments):
+    """
+    same as jwt_required but also checks the department claim of the token
+
+    Args:
+        departments (str): departments allowed to call the endpoint
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            verify_jwt_in_request()
+            claims = get_jwt()
+            if claims.get('staff_id') is None or claims.get('department') not in departments:
+                return make_response({'success': False, 'msg': 'invalid staff details'}, 400)
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
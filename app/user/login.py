@@ -1,14 +1,32 @@
 from datetime import timedelta
 from flask import Blueprint, make_response, request
-from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
+from flask_jwt_extended import (create_access_token, create_refresh_token, get_csrf_token, get_jwt, get_jwt_identity,
+                                jwt_required, set_refresh_cookies, unset_refresh_cookies)
 from app.extensions import logger
+from app.user.auth import revoke_tokens, revoked_tokens, staff_claims, token_versions
+from app.user.security import HashPoolBusy, login_throttle, password_hashes
 from app.models import User, db
+from app.query_budget import query_budget
 from werkzeug.security import generate_password_hash
 from sqlalchemy.exc import SQLAlchemyError
 
 login_bp = Blueprint('login_bp', __name__, url_prefix="/api/v1")
 
+ACCESS_TOKEN_EXPIRY = timedelta(hours=2)
+
+def create_access(user: User) -> str:
+    """ create a short lived access token carrying the user's staff claims """
+    return create_access_token(identity=str(user.id), expires_delta=ACCESS_TOKEN_EXPIRY, additional_claims=staff_claims(user))
+
+def create_refresh(user: User) -> str:
+    """
+    create a refresh token, it is only ever sent in an httponly cookie and lets the client
+    renew its access token without sending the password again
+    """
+    return create_refresh_token(identity=str(user.id), additional_claims={'tv': user.token_version})
+
 @login_bp.route('/login', methods=['POST'])
+@query_budget(3)
 def login():
     try:
         data = request.get_json()
@@ -16,16 +34,35 @@ def login():
         username = data.get('username')
         password = data.get('password')
         
+        allowed, retry_after = login_throttle.allow(str(username), request.remote_addr)
+        if not allowed:
+            logger.warning(f"login throttled for {username} from {request.remote_addr}")
+            response = make_response({'success': False, 'msg': 'too many login attempts, please try again later'}, 429)
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response
+        
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
-            expiry = timedelta(hours=2)
-            access_token = create_access_token(identity=str(user.id), expires_delta=expiry)
+        try:
+            valid_password = user is not None and password_hashes.check(user.password_hash, password)
+        except HashPoolBusy:
+            logger.warning(f"password check pool is busy, login for {username} rejected")
+            response = make_response({'success': False, 'msg': 'server is busy, please try again'}, 503)
+            response.headers['Retry-After'] = '1'
+            return response
+        
+        if valid_password:
+            access_token = create_access(user)
+            refresh_token = create_refresh(user)
             
+            # the csrf cookie belongs to the api's origin, a client on another origin
+            # cannot read it and sends this value as X-CSRF-TOKEN to /token/refresh instead
             response = make_response({
                 'success': True,
                 'msg': 'login successful',
-                'access_token': access_token
+                'access_token': access_token,
+                'csrf_token': get_csrf_token(refresh_token)
             }, 200)
+            set_refresh_cookies(response, refresh_token)
             response.set_cookie(access_token, samesite='Lax', secure=True, httponly=True)
             
             logger.info(f"{user.id} logged in", extra={'user_id': user.id})
@@ -37,8 +74,51 @@ def login():
     except Exception as e:
         logger.error(f"an error occurred during login: {str(e)}")
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
+
+@login_bp.route('/token/refresh', methods=['POST'])
+@query_budget(5)
+@jwt_required(refresh=True, locations=['cookies'])
+def refresh_access_token():
+    try:
+        user = db.session.get(User, int(get_jwt_identity()))
+        if not user:
+            return make_response({'success': False, 'msg': 'user does not exist'}, 401)
+        
+        access_token = create_access(user)
+        return make_response({'success': True, 'msg': 'token refreshed', 'access_token': access_token}, 200)
+    
+    except Exception as e:
+        logger.error(f"an error occurred refreshing an access token: {str(e)}", extra={'user_id': get_jwt_identity()})
+        return make_response({'success': False, 'msg': 'internal server error'}, 500)
+
+@login_bp.route('/token/revoke', methods=['POST'])
+@query_budget(5)
+@jwt_required(refresh=True, locations=['cookies'])
+def logout():
+    try:
+        claims = get_jwt()
+        try:
+            revoked_tokens.revoke(claims['jti'], claims['exp'])
+            db.session.commit()
+            revoked_tokens.remember(claims['jti'], claims['exp'])
+        
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"database error revoking refresh token: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to log out, please try again'}, 500)
+        
+        response = make_response({'success': True, 'msg': 'logged out successfully'}, 200)
+        unset_refresh_cookies(response)
+        
+        logger.info(f"user {get_jwt_identity()} logged out", extra={'user_id': get_jwt_identity()})
+        return response
+    
+    except Exception as e:
+        logger.error(f"an error occurred during logout: {str(e)}", extra={'user_id': get_jwt_identity()})
+        return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
 @login_bp.route('/change-password', methods=['PATCH'])
+@query_budget(7)
 @jwt_required()
 def change_password():
     try:
@@ -54,10 +134,22 @@ def change_password():
         
         try:
             user.hash_password(new_password)
+            # sessions started with the old password end here, this one gets new tokens
+            revoke_tokens(user.id)
             db.session.commit()
+            token_versions.invalidate(user.id)
+            
+            refresh_token = create_refresh(user)
+            response = make_response({
+                'success': True,
+                'msg': 'password updated successfully',
+                'access_token': create_access(user),
+                'csrf_token': get_csrf_token(refresh_token)
+            }, 200)
+            set_refresh_cookies(response, refresh_token)
             
             logger.info(f"user {user_id} has changed their password")
-            return make_response({'success': True, 'msg': 'password updated successfully'}, 200)
+            return response
         
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -0,0 +1,175 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app.models import Staff, User, db
+
+DEPARTMENTS = ['bar', 'carwash', 'restaurant', 'manager']
+# below this many rows starting worker processes costs more than it saves
+PARALLEL_HASH_MIN_ROWS = 8
+
+logger = logging.getLogger('app')
+
+def validate_staff(data: dict):
+    """
+    validate and normalise the details of a new staff member
+
+    Args:
+        data (dict): name, phone_number, id_number and department
+
+    Returns:
+        tuple of (cleaned details, None) or (None, error message)
+    """
+    name = (data.get('name') or '').strip()
+    phone_number = str(data.get('phone_number') or '').strip()
+    id_number = str(data.get('id_number') or '').strip()
+    department = (data.get('department') or '').strip().lower()
+
+    if not all([name, phone_number, id_number, department]):
+        return None, 'name, phone number, id number and department are required'
+
+    if len(id_number) > 8:
+        return None, 'id number should be 8 digits'
+
+    if department not in DEPARTMENTS:
+        return None, 'department can only be bar, carwash, restaurant or manager'
+
+    if len(phone_number) > 10:
+        return None, 'phone number can only be 10 digits, start with 07 or 011'
+
+    return {'name': name, 'phone_number': phone_number, 'id_number': id_number, 'department': department}, None
+
+def hash_passwords(passwords: list, workers: int = None, hash_password=None) -> list:
+    """
+    hash a list of passwords, spread over worker processes when there are enough of them
+
+    Args:
+        passwords (list): plain text passwords
+        workers (int): number of processes. Defaults to the number of cpus.
+        hash_password: hashes one password in this process instead, `workers` is then ignored.
+            a request passes password_hashes.hash so it never starts processes of its own
+    """
+    if hash_password is not None:
+        return [hash_password(p) for p in passwords]
+
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(passwords) < PARALLEL_HASH_MIN_ROWS:
+        return [generate_password_hash(p) for p in passwords]
+
+    # spawn, forking a threaded server process can copy held locks into the children
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(passwords)), mp_context=context) as executor:
+        return list(executor.map(generate_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+def _find_conflicts(rows: list) -> dict:
+    """ map row index to an error for rows that repeat another row or an existing user or staff member """
+    conflicts = {}
+    seen_phones, seen_ids = {}, {}
+    for index, row in rows:
+        if row['phone_number'] in seen_phones:
+            conflicts[index] = f"phone number repeats row {seen_phones[row['phone_number']]}"
+        elif row['id_number'] in seen_ids:
+            conflicts[index] = f"id number repeats row {seen_ids[row['id_number']]}"
+        seen_phones.setdefault(row['phone_number'], index)
+        seen_ids.setdefault(row['id_number'], index)
+
+    phones = list(seen_phones)
+    ids = list(seen_ids)
+    taken_phones, taken_ids = set(), set()
+    for start in range(0, len(phones), 500):
+        chunk_phones = phones[start:start + 500]
+        chunk_ids = ids[start:start + 500]
+        taken_phones.update(db.session.execute(
+            select(User.username).where(User.username.in_(chunk_phones))
+        ).scalars())
+        for phone, id_number in db.session.execute(
+            select(Staff.phone_number, Staff.id_number).where(or_(
+                Staff.phone_number.in_(chunk_phones), Staff.id_number.in_(chunk_ids)
+            ))
+        ):
+            taken_phones.add(phone)
+            taken_ids.add(id_number)
+
+    for index, row in rows:
+        if index in conflicts:
+            continue
+        if row['phone_number'] in taken_phones:
+            conflicts[index] = 'phone number already exists'
+        elif row['id_number'] in taken_ids:
+            conflicts[index] = 'id number already exists'
+    return conflicts
+
+def _insert_chunk(chunk: list) -> dict:
+    """ insert users and staff for a chunk of (index, row, password hash), returns staff id per row index """
+    users = db.session.execute(
+        insert(User).returning(User.id, User.username, sort_by_parameter_order=True),
+        [{'username': row['phone_number'], 'role': row['department'], 'password_hash': password_hash}
+         for _, row, password_hash in chunk]
+    ).all()
+    staff = db.session.execute(
+        insert(Staff).returning(Staff.id, sort_by_parameter_order=True),
+        [dict(row, user_id=user.id) for (_, row, _), user in zip(chunk, users)]
+    ).scalars().all()
+    return {index: staff_id for (index, _, _), staff_id in zip(chunk, staff)}
+
+def onboard_staff(rows: list, chunk_size: int = 100, workers: int = None, hash_password=None) -> list:
+    """
+    create users and staff profiles for many new staff members at once.
+
+    every row is validated and checked for duplicates before anything is written, then
+    passwords are hashed and the rows are inserted a chunk per transaction.
+    a chunk that fails is retried one row at a time so one bad row only fails itself.
+
+    Args:
+        rows (list): dicts with name, phone_number, id_number and department
+        chunk_size (int): rows inserted per transaction. Defaults to 100.
+        workers (int): password hashing processes. Defaults to the number of cpus.
+        hash_password: hashes one password in this process, see hash_passwords
+
+    Returns:
+        list: one report per row with the row number, status and staff_id or msg
+    """
+    report = [None] * len(rows)
+    valid = []
+    for index, data in enumerate(rows):
+        cleaned, error = validate_staff(data if isinstance(data, dict) else {})
+        if error:
+            report[index] = {'row': index + 1, 'status': 'invalid', 'msg': error}
+        else:
+            valid.append((index, cleaned))
+
+    conflicts = _find_conflicts(valid)
+    for index, error in conflicts.items():
+        report[index] = {'row': index + 1, 'status': 'duplicate', 'msg': error}
+    valid = [(index, row) for index, row in valid if index not in conflicts]
+
+    # the id number is the initial password, as in register_staff
+    hashes = hash_passwords([row['id_number'] for _, row in valid], workers, hash_password)
+    pending = [(index, row, password_hash) for (index, row), password_hash in zip(valid, hashes)]
+
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            created = _insert_chunk(chunk)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            created = {}
+            for item in chunk:
+                try:
+                    created.update(_insert_chunk([item]))
+                    db.session.commit()
+                except IntegrityError as e:
+                    db.session.rollback()
+                    logger.error(f"unique constraint violation onboarding staff row {item[0] + 1}: {str(e.orig)}")
+                    report[item[0]] = {'row': item[0] + 1, 'status': 'failed', 'msg': 'phone number or id number already exists'}
+
+        for index, staff_id in created.items():
+            report[index] = {'row': index + 1, 'status': 'created', 'staff_id': staff_id}
+
+    return report
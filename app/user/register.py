@@ -1,60 +1,105 @@
 from flask import Blueprint, make_response, request
-from flask_jwt_extended import current_user, get_jwt_identity, jwt_required
+from flask import current_app
+from flask_jwt_extended import current_user, get_jwt, get_jwt_identity, jwt_required
 from sqlalchemy import and_
 from app.models import db
 from app.models import Staff, User
 from app.extensions import logger
+from app.user.auth import revoke_tokens, token_versions
+from app.user.onboarding import onboard_staff, validate_staff
+from app.user.security import HashPoolBusy, password_hashes
+from app.query_budget import query_budget
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
 register_bp = Blueprint('register_bp', __name__, url_prefix='/api/v1')
 
 @register_bp.route('/create-staff', methods=['POST'])
+@query_budget(5)
 @jwt_required()
 def register_staff():
     try:
         data = request.get_json()
-        name = data.get('name')
-        phone_number = data.get('phone_number')
-        id_number = data.get('id_number')
-        department = data.get('department').lower()
-        
-        if len(id_number) > 8:
-            return make_response({'success': False, 'msg': 'id number should be 8 digits'}, 400)
-        
-        if department not in ['bar', 'carwash', 'restaurant', 'manager']:
-            return make_response({"success": False, "msg": "department can only be bar, carwash, restaurant or manager"}, 400)
-        
-        if len(phone_number) > 10:
-            return make_response({'success': False, 'msg': 'phone number can only be 10 digits, start with 07 or 011'}, 400)
+        details, error = validate_staff(data)
+        if error:
+            return make_response({'success': False, 'msg': error}, 400)
         
         try:
-            new_user = User(username=phone_number, role=department)
-            new_user.hash_password(id_number)
+            new_user = User(username=details['phone_number'], role=details['department'])
+            new_user.hash_password(details['id_number'])
             db.session.add(new_user)
             db.session.flush()
             
-            new_staff = Staff(name=name, phone_number=phone_number, id_number=id_number, department=department, user_id=new_user.id)
+            new_staff = Staff(**details, user_id=new_user.id)
             db.session.add(new_staff)
             db.session.commit()
             
             logger.info(f"new staff and user profile created: {new_staff.id}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'new staff and user profile created successfully'}, 201)
         
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logger.error(f"database error trying to create staff profile: {str(e)}", extra={'user_id': get_jwt_identity()})
-            return make_response({'success': False, 'msg': 'failed to create staff profile, please try again'}, 500)
-        
         except IntegrityError as e:
             db.session.rollback()
             logger.error(f"database integrity error: {str(e)}", extra={'user_id': get_jwt_identity()})
             return make_response({'success': False, 'msg': 'id number or phone number already exists'}, 500)
         
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"database error trying to create staff profile: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to create staff profile, please try again'}, 500)
+        
     except Exception as e:
         logger.error(f"an error occured trying to create a staff profile: {str(e)}", extra={'user_id': get_jwt_identity()})
         return make_response({'success': False, 'msg': 'Internal Server Error'}, 500)
     
+@register_bp.route('/staff/bulk', methods=['POST'])
+# worst case for STAFF_BULK_MAX_ROWS (50) rows, which fit in one chunk of 100: the token version read,
+# the two duplicate selects and the chunk's two inserts, then after a unique constraint violation
+# every row is retried in its own transaction with two inserts and the staff version bump, 5 + 3 * 50
+@query_budget(155, repeats=51)
+@jwt_required()
+def register_staff_bulk():
+    try:
+        if get_jwt().get('role') != 'manager':
+            return make_response({'success': False, 'msg': 'only managers can onboard staff in bulk'}, 403)
+        
+        data = request.get_json()
+        rows = data.get('staff') if isinstance(data, dict) else None
+        if not isinstance(rows, list) or not rows:
+            return make_response({'success': False, 'msg': 'staff should be a non empty list'}, 400)
+        
+        max_rows = current_app.config.get('STAFF_BULK_MAX_ROWS', 50)
+        if len(rows) > max_rows:
+            return make_response({'success': False, 'msg': f"at most {max_rows} staff can be onboarded per request, split the list or import it with flask import-staff"}, 400)
+        
+        try:
+            # hashed one at a time on the login hash pool, a request never starts processes
+            report = onboard_staff(rows, hash_password=password_hashes.hash)
+        
+        except HashPoolBusy:
+            logger.warning("password hash pool is busy, bulk onboarding rejected", extra={'user_id': get_jwt_identity()})
+            response = make_response({'success': False, 'msg': 'server is busy, please try again'}, 503)
+            response.headers['Retry-After'] = '1'
+            return response
+        
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"database error during bulk staff onboarding: {str(e)}", extra={'user_id': get_jwt_identity()})
+            return make_response({'success': False, 'msg': 'failed to onboard staff, please try again'}, 500)
+        
+        created = sum(1 for row in report if row['status'] == 'created')
+        logger.info(f"bulk onboarding created {created} of {len(rows)} staff profiles", extra={'user_id': get_jwt_identity()})
+        return make_response({
+            'success': True,
+            'msg': f"{created} of {len(rows)} staff profiles created",
+            'created': created,
+            'rows': report
+        }, 200)
+    
+    except Exception as e:
+        logger.error(f"an error occured during bulk staff onboarding: {str(e)}", extra={'user_id': get_jwt_identity()})
+        return make_response({'success': False, 'msg': 'internal server error'}, 500)
+    
 @register_bp.route('/delete-staff/<int:staff_id>', methods=['DELETE'])
+@query_budget(8)
 @jwt_required()
 def delete_user(staff_id: int):
     try:
@@ -72,6 +117,8 @@ def delete_user(staff_id: int):
         try:
             db.session.delete(staff_to_be_deleted)
             db.session.commit()
+            if staff_to_be_deleted.user_id:
+                token_versions.invalidate(staff_to_be_deleted.user_id)
             
             logger.info(f"staff {staff_id} profile has been deleted", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'staff profile has been deleted successfully'}, 200)
@@ -86,6 +133,7 @@ def delete_user(staff_id: int):
         return make_response({'success': False, 'msg': 'internal server error'}, 500)
     
 @register_bp.route('/edit-staff/<int:staff_id>', methods=['PUT'])
+@query_budget(6)
 @jwt_required()
 def edit_staff(staff_id: int):
     try:
@@ -109,7 +157,11 @@ def edit_staff(staff_id: int):
                     return make_response({'success': False, 'msg': 'phone number cannot be more than 10 digits, use 07 or 011 as the format'}, 400)
                 staff.phone_number = data['phone_number']
             
+            if staff.user_id:
+                revoke_tokens(staff.user_id)
             db.session.commit()
+            if staff.user_id:
+                token_versions.invalidate(staff.user_id)
             logger.info(f"staff {staff.id} details have been updated", extra={'user_id': get_jwt_identity()})
             return make_response({'success': True, 'msg': 'staff details have been updated succesfully'}, 200)
         
@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+class HashPoolBusy(Exception):
+    """ raised when too many password checks are already waiting for a worker, or one waited past the timeout """
+
+class PasswordHashPool:
+    """
+    runs password hash checks on a small pool of threads so a burst of logins can only
+    use `max_workers` cores, the key derivation functions release the GIL while hashing.
+    at most `max_pending` checks wait for a worker, more than that fail fast with HashPoolBusy.
+    new hashes made in a request, e.g. by bulk onboarding, go through the same pool.
+
+    the pool is created lazily in each process so forked workers get their own threads
+    """
+    def __init__(self, max_workers=2, max_pending=32, timeout=10):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.checks = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('LOGIN_HASH_WORKERS', self.max_workers)
+        self.max_pending = app.config.get('LOGIN_HASH_MAX_PENDING', self.max_pending)
+        self.timeout = app.config.get('LOGIN_HASH_TIMEOUT', self.timeout)
+        self._pid = None
+
+    def _ensure_executor(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pid = pid
+
+    def check(self, password_hash: str, password: str) -> bool:
+        """
+        check a password against its hash on the pool, blocking the caller until it is done
+
+        Args:
+            password_hash (str): stored werkzeug password hash
+            password (str): password to check
+
+        Raises:
+            HashPoolBusy: when max_pending checks are already queued or the check took longer than `timeout`
+        """
+        return self._run(check_password_hash, password_hash, password)
+
+    def hash(self, password: str) -> str:
+        """
+        hash a new password on the pool, blocking the caller until it is done
+
+        Args:
+            password (str): password to hash
+
+        Raises:
+            HashPoolBusy: when max_pending checks are already queued or the hash took longer than `timeout`
+        """
+        return self._run(generate_password_hash, password)
+
+    def _run(self, fn, *args):
+        self._ensure_executor()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy()
+
+        submitted = time.perf_counter()
+
+        def run():
+            waited = time.perf_counter() - submitted
+            with self._lock:
+                self.checks += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            return fn(*args)
+
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # a check still queued is dropped, one already hashing finishes and frees its slot
+            future.cancel()
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'checks': self.checks,
+                'rejected': self.rejected,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+            }
+
+class LoginThrottle:
+    """
+    token buckets per username and per client ip, checked before any password is hashed.
+    buckets are kept per worker process, the least recently used are dropped past `max_keys`
+    """
+    def __init__(self, user_rate=5, user_burst=5, ip_rate=60, ip_burst=30, max_keys=10000):
+        self.limits = {'user': (user_rate, user_burst), 'ip': (ip_rate, ip_burst)}
+        self.max_keys = max_keys
+        self.rejected = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.limits = {
+            'user': (app.config.get('LOGIN_USER_RATE_PER_MINUTE', 5), app.config.get('LOGIN_USER_BURST', 5)),
+            'ip': (app.config.get('LOGIN_IP_RATE_PER_MINUTE', 60), app.config.get('LOGIN_IP_BURST', 30)),
+        }
+        with self._lock:
+            self._buckets.clear()
+
+    def _level(self, kind, key, now):
+        rate, burst = self.limits[kind]
+        tokens, updated = self._buckets.get((kind, key), (burst, now))
+        return min(burst, tokens + (now - updated) * rate / 60)
+
+    def allow(self, username: str, ip: str):
+        """
+        take one token from both the username and the ip bucket, nothing is taken when either is empty
+
+        Returns:
+            tuple of (allowed, seconds until the next attempt would be allowed)
+        """
+        now = time.monotonic()
+        keys = [('user', username), ('ip', ip)]
+        with self._lock:
+            levels = [self._level(kind, key, now) for kind, key in keys]
+            waits = [(1 - tokens) * 60 / self.limits[kind][0] for (kind, _), tokens in zip(keys, levels) if tokens < 1]
+            allowed = not waits
+            if not allowed:
+                self.rejected += 1
+
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return allowed, max(waits, default=0)
+
+
+password_hashes = PasswordHashPool()
+login_throttle = LoginThrottle()
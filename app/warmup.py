@@ -0,0 +1,61 @@
+import logging
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.bar.catalog import drink_catalog
+from app.models import db
+
+logger = logging.getLogger('app')
+
+def warm_up(app, connections=None, dispose_inherited=False) -> dict:
+    """
+    open pool connections and load the drink catalog before a worker takes requests, so the
+    first sales after a deploy do not pay for connection setup and catalog misses.
+    a database that cannot be reached is logged and left to connect on the first request
+
+    Args:
+        app: the flask app
+        connections (int): connections to open per database, capped at the pool size.
+            Defaults to WARMUP_CONNECTIONS.
+        dispose_inherited (bool): forget the connections inherited from the parent process
+            first, for workers forked from a preloaded master
+
+    Returns:
+        dict: connections opened per bind, drinks loaded and seconds taken
+    """
+    started = time.perf_counter()
+    if connections is None:
+        connections = app.config.get('WARMUP_CONNECTIONS', 1)
+
+    opened = {}
+    primed = 0
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            if dispose_inherited:
+                # close=False leaves the parent's sockets alone, the parent still owns them
+                engine.dispose(close=False)
+            pool_size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+            held = []
+            try:
+                for _ in range(max(0, min(connections, pool_size))):
+                    conn = engine.connect()
+                    held.append(conn)
+                    conn.exec_driver_sql('SELECT 1')
+            except SQLAlchemyError as e:
+                logger.error(f"could not warm up the {bind or 'default'} database pool: {str(e)}")
+            finally:
+                for conn in held:
+                    conn.close()
+            opened[bind or 'default'] = len(held)
+
+        try:
+            primed = drink_catalog.prime()
+        except SQLAlchemyError as e:
+            logger.error(f"could not prime the drink catalog: {str(e)}")
+        finally:
+            db.session.remove()
+
+    seconds = round(time.perf_counter() - started, 3)
+    logger.info(f"worker warmed up in {seconds}s, connections {opened}, {primed} drinks cached")
+    return {'connections': opened, 'drinks': primed, 'seconds': seconds}
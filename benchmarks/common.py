@@ -0,0 +1,77 @@
+"""
+shared setup for the benchmark scripts in this folder
+
+every benchmark runs against a throwaway sqlite file unless a database uri is passed
+explicitly, the benchmarks write data so never point them at the production database
+"""
+import logging
+import os
+import random
+import tempfile
+
+
+def create_benchmark_app(database_uri=None):
+    """
+    build the flask app for a benchmark run and create the tables
+
+    Args:
+        database_uri (str): database to run against, defaults to a new sqlite file
+    """
+    if not database_uri:
+        fd, path = tempfile.mkstemp(prefix='lilysplace-bench-', suffix='.db')
+        os.close(fd)
+        database_uri = f"sqlite:///{path}"
+
+    os.environ['DATABASE_URI'] = database_uri
+    os.environ.setdefault('JWT_sECRET_KEY', 'benchmark-only-jwt-secret-key-0123456789')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-0123456789')
+
+    from app import create_app
+    from app.models import db
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+
+    # every sale logs at INFO, keep the console readable while benchmarking
+    logging.getLogger().setLevel(logging.WARNING)
+    return app
+
+
+def create_staff_headers(app, department='bar'):
+    """
+    create a user and staff profile and return auth headers for them
+
+    Args:
+        app: flask app from create_benchmark_app
+        department (str): department of the new staff member
+    """
+    from flask_jwt_extended import create_access_token
+    from app.models import Staff, User, db
+    from app.user.auth import staff_claims
+
+    with app.app_context():
+        suffix = ''.join(random.choices('0123456789', k=8))
+        user = User(username=f"07{suffix}", role=department)
+        user.hash_password(suffix)
+        db.session.add(user)
+        db.session.flush()
+
+        staff = Staff(name=f"bench {suffix}", id_number=suffix, phone_number=f"07{suffix}",
+                      department=department, user_id=user.id)
+        db.session.add(staff)
+        db.session.commit()
+
+        token = create_access_token(identity=str(user.id), additional_claims=staff_claims(user))
+
+    return {'Authorization': f"Bearer {token}"}
+
+
+def percentile(samples, pct):
+    """ nearest rank percentile of a list of numbers """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,277 @@
+"""
+latency and sql statements per request for every api route, driven through the flask test client
+
+the database is filled with `flask seed-synthetic` data first, then each route is called
+--requests times and the p50 and p99 latency, average and max statements per request and
+the response codes are reported. routes that hash passwords run a tenth as often.
+
+the app runs with QUERY_BUDGET_STRICT, a request over its endpoint's @query_budget or one
+repeating a statement is reported under `budget` and the run exits with status 1.
+
+usage:
+    python -m benchmarks.endpoints [--requests 100] [--drinks 200] [--sales 50000] [--only sell,list]
+                                   [--database-uri postgresql://localhost/lilysplace_bench] [--json results.json]
+"""
+import argparse
+from collections import Counter, namedtuple
+from datetime import date, timedelta
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.common import create_benchmark_app, create_staff_headers, percentile
+
+# path and body are called with (ctx, i), auth picks the headers from ctx
+Case = namedtuple('Case', ['name', 'method', 'path', 'body', 'auth', 'scale'], defaults=[None, 'bar', 1.0])
+
+def _csv_catalog(ctx, i):
+    lines = ['name,drink_type,volume,purchase_price,markup,shot_price']
+    lines += [f"bench import {n},Gin,750 ml,{1000 + n},0.3,50" for n in range(100)]
+    return '\n'.join(lines)
+
+CASES = [
+    Case('login', 'POST', lambda c, i: '/api/v1/login',
+         lambda c, i: {'username': c['bar_username'], 'password': 'synthetic'}, None, 0.1),
+    Case('token refresh', 'POST', lambda c, i: '/api/v1/token/refresh', None, 'refresh'),
+    Case('list drinks', 'GET', lambda c, i: '/api/v1/drinks?limit=50'),
+    # polls with the ETag list drinks was sent last, nothing changed in between so they get a 304
+    Case('list drinks unchanged', 'GET', lambda c, i: '/api/v1/drinks?limit=50', None, 'unchanged'),
+    Case('list drinks filtered', 'GET', lambda c, i: '/api/v1/drinks?drink_type=Gin&low_stock=100&fields=id,name,stock'),
+    Case('list open bottles', 'GET', lambda c, i: '/api/v1/drinks/open-bottle'),
+    Case('add drink', 'POST', lambda c, i: '/api/v1/drinks/add',
+         lambda c, i: {'name': f"bench drink {i}", 'category': 'Gin', 'stock': 10, 'purchase_price': 1000.0,
+                       'volume': '750 ml', 'markup': 0.3, 'shot_price': 50.0, 'shot_quantity': 25}),
+    Case('edit drink', 'PUT', lambda c, i: f"/api/v1/drinks/{random.choice(c['drink_ids'])}/edit",
+         lambda c, i: {'markup': round(random.uniform(0.2, 0.6), 2)}),
+    Case('delete drink', 'DELETE', lambda c, i: f"/api/v1/drinks/{c['added_drink_ids'][i]}/delete"),
+    Case('sell bottle', 'POST', lambda c, i: f"/api/v1/drinks/{random.choice(c['drink_ids'])}/sell/retail",
+         lambda c, i: {'quantity': 1, 'payment_method': 'cash'}),
+    Case('open bottle', 'POST', lambda c, i: f"/api/v1/drinks/open-bottle/{c['closed_drink_ids'][i]}"),
+    Case('sell tot', 'POST', lambda c, i: f"/api/v1/drinks/sell-tot/{random.choice(c['bottle_ids'])}",
+         lambda c, i: {'shot_quantity': 1, 'payment_method': 'mpesa'}),
+    Case('edit tot sale', 'PUT', lambda c, i: f"/api/v1/drinks/tot-sales/{random.choice(c['tot_sale_ids'])}/edit",
+         lambda c, i: {'payment_method': random.choice(['cash', 'mpesa'])}),
+    Case('batch sale', 'POST', lambda c, i: '/api/v1/sales/batch',
+         lambda c, i: {'payment_method': 'cash', 'items': [
+             {'type': 'bottle', 'drink_id': random.choice(c['drink_ids']), 'quantity': 1},
+             {'type': 'bottle', 'drink_id': random.choice(c['drink_ids']), 'quantity': 2},
+             {'type': 'tot', 'bottle_id': random.choice(c['bottle_ids']), 'shot_quantity': 1}]}),
+    Case('record purchase', 'POST', lambda c, i: f"/api/v1/drinks/record-purchase/{random.choice(c['drink_ids'])}",
+         lambda c, i: {'quantity': 12, 'unit_price': 900.0, 'payment_method': 'bank payment', 'supplier': 'bench'}),
+    Case('import catalog dry run', 'POST', lambda c, i: '/api/v1/drinks/import?dry_run=true', _csv_catalog, 'bar', 0.2),
+    Case('export catalog', 'GET', lambda c, i: '/api/v1/drinks/export', None, 'bar', 0.2),
+    Case('sales report by day', 'GET', lambda c, i: '/api/v1/reports/sales?group_by=day'),
+    Case('sales report by drink', 'GET', lambda c, i: '/api/v1/reports/sales?group_by=drink'),
+    Case('export week of sales', 'GET',
+         lambda c, i: f"/api/v1/exports/drink_sales.csv?from={date.today() - timedelta(days=6)}", None, 'bar', 0.2),
+    Case('create staff', 'POST', lambda c, i: '/api/v1/create-staff',
+         lambda c, i: {'name': f"bench {i}", 'phone_number': f"06{c['run']}{i:05d}", 'id_number': f"6{c['run']}{i:04d}",
+                       'department': 'bar'}, 'bar', 0.1),
+    Case('bulk onboard staff', 'POST', lambda c, i: '/api/v1/staff/bulk',
+         lambda c, i: {'staff': [{'name': f"bulk {i} {n}", 'phone_number': f"05{c['run']}{i:03d}{n:02d}",
+                                  'id_number': f"5{c['run']}{i:02d}{n:02d}", 'department': 'bar'} for n in range(5)]},
+         'manager', 0.05),
+    Case('edit staff', 'PUT', lambda c, i: f"/api/v1/edit-staff/{c['created_staff_ids'][i % len(c['created_staff_ids'])]}",
+         lambda c, i: {'name': f"renamed {i}"}),
+    Case('delete staff', 'DELETE', lambda c, i: f"/api/v1/delete-staff/{c['created_staff_ids'][i]}", None, 'manager', 0.1),
+    Case('change password', 'PATCH', lambda c, i: '/api/v1/change-password',
+         lambda c, i: {'new_password': f"bench password {i}"}, 'password', 0.1),
+    Case('logout', 'POST', lambda c, i: '/api/v1/token/revoke', None, 'logout', 0.1),
+    Case('carwash add income', 'POST', lambda c, i: '/api/v1/carwash/add-income',
+         lambda c, i: {'customer': f"KDA {i}", 'staff_id': c['carwash_staff_id'], 'amount_charged': 500,
+                       'payment_method': 'cash', 'service': c['service']}, 'carwash'),
+    Case('carwash edit income', 'PUT', lambda c, i: f"/api/v1/carwash/income/{random.choice(c['carwash_ids'])}/edit",
+         lambda c, i: {'amount_charged': 800}, 'carwash'),
+    Case('carwash delete income', 'DELETE', lambda c, i: f"/api/v1/carwash/income/{c['carwash_ids'].pop()}/delete",
+         None, 'carwash', 0.2),
+    Case('metrics', 'GET', lambda c, i: '/metrics', None, None, 0.2),
+]
+
+
+def prepare(app, drinks, sales):
+    """ seed the database and collect the ids and credentials the cases need """
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import select
+    from app.models import SERVICE_TYPES, CarwashIncome, Drink, OpenBottle, Staff, TotSales, User, db
+    from app.synthetic import seed_synthetic
+    from app.user.auth import staff_claims
+    from app.user.login import create_refresh
+    from app.user.security import login_throttle
+
+    # the throttle would turn most login calls into 429s
+    app.config.update(LOGIN_USER_BURST=10 ** 6, LOGIN_USER_RATE_PER_MINUTE=10 ** 6,
+                      LOGIN_IP_BURST=10 ** 6, LOGIN_IP_RATE_PER_MINUTE=10 ** 6)
+    login_throttle.init_app(app)
+
+    ctx = {'run': random.randint(100, 999), 'service': SERVICE_TYPES[0] if SERVICE_TYPES else None}
+    with app.app_context():
+        seed_synthetic(drinks=drinks, sales=sales, seed=1)
+        # enough stock and shots that sales never run out during the run
+        db.session.query(Drink).update({Drink.stock: 10 ** 6})
+        db.session.query(OpenBottle).update({OpenBottle.shots_remaining: 10 ** 6})
+        db.session.commit()
+
+        ctx['drink_ids'] = db.session.execute(select(Drink.id)).scalars().all()
+        ctx['bottle_ids'] = db.session.execute(select(OpenBottle.id)).scalars().all()
+        opened = set(db.session.execute(select(OpenBottle.drink_id)).scalars())
+        ctx['closed_drink_ids'] = [d for d in ctx['drink_ids'] if d not in opened]
+        ctx['tot_sale_ids'] = db.session.execute(select(TotSales.id).limit(1000)).scalars().all()
+        ctx['carwash_ids'] = db.session.execute(select(CarwashIncome.id).limit(1000)).scalars().all()
+        carwash_staff = db.session.execute(select(Staff.id).where(Staff.department == 'carwash')).scalars().first()
+        ctx['carwash_staff_id'] = carwash_staff
+        ctx['bar_username'] = db.session.execute(
+            select(User.username).join(Staff, Staff.user_id == User.id).where(Staff.department == 'bar')
+        ).scalars().first()
+
+        manager = User(username=f"08{ctx['run']}00000", role='manager')
+        manager.hash_password('bench manager')
+        db.session.add(manager)
+        db.session.commit()
+        ctx['manager'] = {'Authorization': f"Bearer {create_access_token(identity=str(manager.id), additional_claims=staff_claims(manager))}"}
+
+        ctx['refresh_token'] = create_refresh(db.session.get(User, manager.id))
+
+    ctx['bar'] = create_staff_headers(app)
+    # replaced with the bar headers plus an If-None-Match once list drinks has run
+    ctx['unchanged'] = ctx['bar']
+    ctx['carwash'] = create_staff_headers(app, 'carwash')
+    ctx['password'] = create_staff_headers(app)
+    return ctx
+
+
+def headers_for(app, client, case, ctx):
+    """ auth headers for a case, setting the refresh cookie on the client when the case needs one """
+    from flask_jwt_extended import decode_token
+    from app.models import User, db
+    from app.user.login import create_refresh
+
+    if case.auth in ('refresh', 'logout'):
+        token = ctx['refresh_token']
+        if case.auth == 'logout':
+            with app.app_context():
+                token = create_refresh(db.session.get(User, int(decode_token(ctx['refresh_token'])['sub'])))
+        client.set_cookie('refresh_token_cookie', token, path='/api/v1/token')
+        with app.app_context():
+            return {'X-CSRF-TOKEN': decode_token(token)['csrf']}
+    if case.auth is None:
+        return {}
+    return ctx[case.auth]
+
+
+def run_case(app, client, case, ctx, requests):
+    from app.query_budget import QueryBudgetExceeded, count_queries
+
+    latencies, counts, codes, violations = [], [], Counter(), []
+    for i in range(requests):
+        headers = headers_for(app, client, case, ctx)
+        path = case.path(ctx, i)
+        body = case.body(ctx, i) if case.body else None
+        kwargs = {'headers': headers}
+        if isinstance(body, str):
+            kwargs.update(data=body, content_type='text/csv')
+        elif body is not None:
+            kwargs['json'] = body
+
+        began = time.perf_counter()
+        with count_queries() as queries:
+            try:
+                response = client.open(path, method=case.method, **kwargs)
+                data = response.get_data()
+                # a streamed response is checked against its budget when it closes
+                response.close()
+            except QueryBudgetExceeded as e:
+                violations.append(str(e))
+                response = None
+        latencies.append(time.perf_counter() - began)
+        counts.append(queries.count)
+        if response is None:
+            codes['budget'] += 1
+            continue
+        codes[response.status_code] += 1
+
+        if case.name == 'list drinks' and response.status_code == 200:
+            ctx['unchanged'] = {**ctx['bar'], 'If-None-Match': response.headers['ETag']}
+        elif case.name == 'add drink' and response.status_code == 201:
+            with app.app_context():
+                from app.models import Drink, db
+                ctx['added_drink_ids'].append(db.session.query(Drink.id).filter(Drink.name == f"bench drink {i}").scalar())
+        elif case.name == 'create staff' and response.status_code == 201:
+            with app.app_context():
+                from app.models import Staff, db
+                ctx['created_staff_ids'].append(db.session.query(Staff.id).filter(Staff.name == f"bench {i}").scalar())
+        elif case.name == 'change password' and response.status_code == 200:
+            ctx['password'] = {'Authorization': f"Bearer {json.loads(data)['access_token']}"}
+
+    return {
+        'route': case.name,
+        'requests': requests,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'statements_avg': sum(counts) / len(counts),
+        'statements_max': max(counts),
+        'codes': dict(sorted(codes.items(), key=str)),
+        'budget_violations': sorted(set(violations)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--drinks', type=int, default=200)
+    parser.add_argument('--sales', type=int, default=50000)
+    parser.add_argument('--only', default='', help='comma separated parts of route names to run')
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--json', dest='json_path', default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    os.environ['QUERY_BUDGET_STRICT'] = 'true'
+    app = create_benchmark_app(args.database_uri)
+    print(f"seeding {args.drinks} drinks and {args.sales} sales on {app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}")
+    ctx = prepare(app, args.drinks, args.sales)
+    ctx['added_drink_ids'] = []
+    ctx['created_staff_ids'] = []
+
+    client = app.test_client()
+    only = [part.strip() for part in args.only.split(',') if part.strip()]
+    results = []
+    print(f"{'route':<24} {'n':>5} {'p50 ms':>8} {'p99 ms':>8} {'sql avg':>8} {'sql max':>8}  codes")
+    for case in CASES:
+        if only and not any(part in case.name for part in only):
+            continue
+        if case.auth == 'carwash' and not ctx['service']:
+            print(f"{case.name:<24} skipped, SERVICE_TYPES is empty")
+            continue
+
+        requests = max(1, int(args.requests * case.scale))
+        if case.name == 'delete drink':
+            requests = min(requests, len(ctx['added_drink_ids']))
+        elif case.name == 'delete staff':
+            requests = min(requests, len(ctx['created_staff_ids']))
+        elif case.name == 'open bottle':
+            requests = min(requests, len(ctx['closed_drink_ids']))
+        elif case.name == 'carwash delete income':
+            requests = min(requests, len(ctx['carwash_ids']))
+        if requests == 0 or (case.name == 'edit staff' and not ctx['created_staff_ids']):
+            print(f"{case.name:<24} skipped, nothing to act on")
+            continue
+
+        result = run_case(app, client, case, ctx, requests)
+        results.append(result)
+        codes = ' '.join(f"{code}x{count}" for code, count in result['codes'].items())
+        print(f"{result['route']:<24} {result['requests']:>5} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+              f"{result['statements_avg']:>8.1f} {result['statements_max']:>8}  {codes}")
+        for violation in result['budget_violations']:
+            print(f"    {violation}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if any(result['budget_violations'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+memory and throughput of the streaming csv export at GET /api/v1/exports/<table>.csv
+
+seeds `--rows` drink sales spread over a year, downloads the whole range and reports
+rows per second and the peak python memory allocated while the export ran. with
+--compare-naive the same rows are also built into a single csv string in memory,
+the way an export without a streaming response would.
+
+usage:
+    python -m benchmarks.export_csv [--rows 1000000] [--compare-naive] [--database-uri URI]
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+import tracemalloc
+
+from benchmarks.common import create_benchmark_app, create_staff_headers
+
+SEED_CHUNK = 20000
+
+
+def seed(app, rows):
+    from sqlalchemy import insert
+    from app.models import Drink, DrinkSales, Staff, db
+
+    with app.app_context():
+        drink = Drink(name='export gin', drink_type='Gin', stock=0, purchase_price=1000.0,
+                      volume='750 ml', markup=0.3, shot_price=100.0, shot_quantity=25)
+        db.session.add(drink)
+        db.session.flush()
+        staff_id = db.session.query(Staff.id).scalar()
+
+        first_day = datetime(2025, 1, 1)
+        for low in range(0, rows, SEED_CHUNK):
+            db.session.execute(insert(DrinkSales), [
+                {'drink_id': drink.id, 'quantity': 1, 'sale_type': 'retail', 'payment_method': 'cash',
+                 'amount': 1508.0, 'sold_by': staff_id,
+                 'created_at': first_day + timedelta(seconds=31536000 * n // rows)}
+                for n in range(low, min(low + SEED_CHUNK, rows))
+            ])
+            db.session.commit()
+
+
+def measure(fn):
+    tracemalloc.start()
+    began = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - began
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--compare-naive', action='store_true')
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    app = create_benchmark_app(args.database_uri)
+    headers = create_staff_headers(app)
+
+    began = time.perf_counter()
+    seed(app, args.rows)
+    print(f"seeded {args.rows} drink sales in {time.perf_counter() - began:.1f}s")
+
+    client = app.test_client()
+    url = '/api/v1/exports/drink_sales.csv?from=2025-01-01&to=2025-12-31'
+
+    def streamed():
+        response = client.get(url, headers=headers, buffered=False)
+        assert response.status_code == 200, response.status_code
+        size = 0
+        for chunk in response.response:
+            size += len(chunk)
+        response.close()
+        return size
+
+    def naive():
+        import csv
+        import io
+        from app.models import DrinkSales, db
+
+        with app.app_context():
+            rows = db.session.query(*DrinkSales.__table__.columns).order_by(DrinkSales.created_at).all()
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            return len(buffer.getvalue())
+
+    print(f"{'export':>8} {'MB':>8} {'seconds':>8} {'rows/s':>9} {'peak MB':>8}")
+    runs = [('stream', streamed)] + ([('naive', naive)] if args.compare_naive else [])
+    for name, fn in runs:
+        size, elapsed, peak = measure(fn)
+        print(f"{name:>8} {size / 1e6:>8.1f} {elapsed:>8.1f} {args.rows / elapsed:>9.0f} {peak / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
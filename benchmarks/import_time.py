@@ -0,0 +1,121 @@
+"""
+cold start import time, measured with `python -X importtime` in a fresh interpreter per run
+
+each target runs --runs times, the median time spent importing modules (interpreter startup
+excluded) and the wall time of the whole process are reported with the slowest modules of the
+last run. a median over its budget exits with status 1, so a change that makes startup slower
+fails the run.
+
+usage:
+    python -m benchmarks.import_time [--runs 5] [--top 10] [--budget package=400 --budget create_app=1100]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# what `import app` costs scripts and the flask cli, and what a worker pays to build the app
+TARGETS = {
+    'package': 'import app',
+    'models': 'import app.models',
+    'create_app': 'from app import create_app; create_app()',
+}
+
+# milliseconds, with headroom for noisy machines. pulling alembic back into the package import
+# or a heavy module into app.models goes over them
+DEFAULT_BUDGETS = {'package': 400, 'models': 900, 'create_app': 1100}
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(stderr: str) -> list:
+    """ (self us, cumulative us, depth, module) for every line -X importtime wrote """
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            rows.append((int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+    return rows
+
+
+def run_target(code: str, env: dict, baseline: set):
+    """
+    run `code` in a new interpreter
+
+    Returns:
+        tuple: import ms, wall ms and the parsed importtime rows
+    """
+    began = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - began) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"{code!r} failed:\n{result.stderr[-2000:]}")
+    rows = parse_importtime(result.stderr)
+    # top level imports only, the interpreter's own startup imports are left out
+    import_us = sum(cumulative for _, cumulative, depth, name in rows if depth == 0 and name not in baseline)
+    return import_us / 1000, wall_ms, rows
+
+
+def isolated_env(workdir: str) -> dict:
+    """ environment of the measured interpreters, a throwaway sqlite database and log directory """
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.getcwd(),
+        'DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'importtime.db')}",
+        'LOG_DIR': os.path.join(workdir, 'logs'),
+        'JWT_sECRET_KEY': os.environ.get('JWT_sECRET_KEY', 'benchmark-only-jwt-secret-key-0123456789'),
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'benchmark-only-secret-key-0123456789'),
+    }
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    return env
+
+
+def startup_modules(env: dict) -> set:
+    """ modules an empty interpreter already imports, left out of every measurement """
+    _, _, startup = run_target('pass', env, set())
+    return {name for _, _, depth, name in startup if depth == 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest modules listed per target')
+    parser.add_argument('--budget', action='append', default=[], metavar='TARGET=MS', help='override a default budget')
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in args.budget:
+        target, ms = item.split('=')
+        budgets[target] = float(ms)
+
+    env = isolated_env(tempfile.mkdtemp(prefix='lilysplace-importtime-'))
+    baseline = startup_modules(env)
+
+    failed = False
+    print(f"{'target':<12} {'import ms':>10} {'wall ms':>9} {'budget':>8}")
+    for target, code in TARGETS.items():
+        imports, walls = [], []
+        for _ in range(args.runs):
+            import_ms, wall_ms, rows = run_target(code, env, baseline)
+            imports.append(import_ms)
+            walls.append(wall_ms)
+        import_ms = statistics.median(imports)
+        budget = budgets.get(target)
+        over = budget is not None and import_ms > budget
+        failed = failed or over
+        print(f"{target:<12} {import_ms:>10.1f} {statistics.median(walls):>9.1f} {budget or '-':>8}{'  OVER BUDGET' if over else ''}")
+
+        slowest = sorted((r for r in rows if r[3] not in baseline), key=lambda r: r[0], reverse=True)[:args.top]
+        for self_us, cumulative_us, _, name in slowest:
+            print(f"    {name:<48} self {self_us / 1000:>7.1f} ms  cumulative {cumulative_us / 1000:>7.1f} ms")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+json encoding and response compression on GET /api/v1/drinks with a large catalog
+
+seeds `--drinks` drinks and reports:
+  - encoding the whole catalog as one payload with the stdlib and the orjson provider
+  - the payload size and compress time with gzip and brotli at the configured levels
+  - walking every page of GET /api/v1/drinks (MAX_DRINK_PAGE_SIZE per page) with each
+    provider and Accept-Encoding, total time and bytes sent
+
+usage:
+    python -m benchmarks.json_compression [--drinks 5000] [--repeat 20]
+"""
+import argparse
+import time
+
+from benchmarks.common import create_benchmark_app, create_staff_headers
+
+
+def seed(app, drinks):
+    from sqlalchemy import insert
+    from app.models import DRINK_TYPES, DRINK_VOLUME, Drink, db
+
+    with app.app_context():
+        db.session.execute(insert(Drink), [
+            {'name': f"bench {DRINK_TYPES[n % len(DRINK_TYPES)].lower()} {n}", 'drink_type': DRINK_TYPES[n % len(DRINK_TYPES)],
+             'volume': DRINK_VOLUME[n % len(DRINK_VOLUME)], 'stock': n % 300, 'purchase_price': 500.0 + n % 4000,
+             'markup': 0.3, 'shot_price': 50.0 + n % 200, 'shot_quantity': 25}
+            for n in range(drinks)
+        ])
+        db.session.commit()
+
+
+def catalog_payload(app):
+    """ every drink in the shape list_drinks returns """
+    from app.bar.app import DRINK_LIST_FIELDS
+    from app.models import db
+
+    with app.app_context():
+        rows = db.session.query(*DRINK_LIST_FIELDS.values()).order_by(DRINK_LIST_FIELDS['id']).all()
+    return {'success': True, 'drinks': [dict(row._mapping) for row in rows], 'next_cursor': None}
+
+
+def time_encoding(app, provider, payload, repeat):
+    with app.app_context():
+        began = time.perf_counter()
+        for _ in range(repeat):
+            body = provider.response(payload).get_data()
+        return (time.perf_counter() - began) / repeat * 1000, body
+
+
+def walk_pages(client, headers):
+    """ fetch every page of GET /drinks, returns (ms, bytes on the wire, pages) """
+    from app.bar.app import MAX_DRINK_PAGE_SIZE
+
+    cursor, sent, pages = None, 0, 0
+    began = time.perf_counter()
+    while True:
+        path = f"/api/v1/drinks?limit={MAX_DRINK_PAGE_SIZE}" + (f"&cursor={cursor}" if cursor else '')
+        response = client.get(path, headers=headers)
+        sent += len(response.get_data())
+        pages += 1
+        cursor = _next_cursor(response)
+        if cursor is None:
+            break
+    return (time.perf_counter() - began) * 1000, sent, pages
+
+
+def _next_cursor(response):
+    """ the test client does not decode the body, undo the compression to read the cursor """
+    import gzip
+    import json
+
+    data = response.get_data()
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        data = gzip.decompress(data)
+    elif encoding == 'br':
+        import brotli
+        data = brotli.decompress(data)
+    return json.loads(data)['next_cursor']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drinks', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20, help='encodings of the whole catalog per provider')
+    args = parser.parse_args()
+
+    app = create_benchmark_app()
+    seed(app, args.drinks)
+    headers = create_staff_headers(app)
+
+    from flask.json.provider import DefaultJSONProvider
+    from app.compression import compression
+    from app.serialization import OrjsonProvider, orjson
+
+    providers = {'stdlib': DefaultJSONProvider(app)}
+    if orjson is not None:
+        providers['orjson'] = OrjsonProvider(app)
+    else:
+        print('orjson is not installed, only the stdlib provider is measured')
+
+    payload = catalog_payload(app)
+    print(f"whole catalog, {len(payload['drinks'])} drinks")
+    print(f"{'provider':<10} {'ms/encode':>10} {'bytes':>10}")
+    body = None
+    for name, provider in providers.items():
+        ms, body = time_encoding(app, provider, payload, args.repeat)
+        print(f"{name:<10} {ms:>10.2f} {len(body):>10}")
+
+    print(f"\n{'encoding':<10} {'ms':>10} {'bytes':>10} {'ratio':>7}")
+    for encoding in ['identity'] + compression.encodings:
+        began = time.perf_counter()
+        compressed = body if encoding == 'identity' else compression.compress(body, encoding)
+        ms = (time.perf_counter() - began) * 1000
+        print(f"{encoding:<10} {ms:>10.2f} {len(compressed):>10} {len(body) / len(compressed):>7.1f}")
+
+    client = app.test_client()
+    print("\nevery page of GET /api/v1/drinks")
+    print(f"{'provider':<10} {'encoding':<10} {'pages':>6} {'total ms':>10} {'bytes sent':>11}")
+    for name, provider in providers.items():
+        app.json = provider
+        for encoding in ['identity'] + compression.encodings:
+            ms, sent, pages = walk_pages(client, {**headers, 'Accept-Encoding': encoding})
+            print(f"{name:<10} {encoding:<10} {pages:>6} {ms:>10.1f} {sent:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+per log call overhead of UserContextFilter inside an authenticated request
+
+the filter is attached to every log handler, so one logger call runs it once per handler.
+the previous implementation verified the token on every run, the current one resolves the
+user once per request and reuses it from flask.g
+
+usage:
+    python -m benchmarks.log_filter [--calls 20000]
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.common import create_benchmark_app, create_staff_headers
+
+
+class VerifyEveryCallFilter(logging.Filter):
+    """ the filter as it was before the user id was kept on flask.g """
+    def filter(self, record):
+        from flask import has_request_context
+        from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+        user_id = 'SYSTEM'
+        if has_request_context():
+            try:
+                verify_jwt_in_request(optional=True)
+                current_user = get_jwt_identity()
+                if current_user:
+                    user_id = str(current_user)
+            except Exception:
+                pass
+        record.user_id = user_id
+        return True
+
+
+def time_filter(app, headers, log_filter, calls):
+    record = logging.LogRecord('bench', logging.INFO, __file__, 0, 'sale recorded', None, None)
+    with app.test_request_context('/api/v1/drinks', headers=headers):
+        start = time.perf_counter()
+        for _ in range(calls):
+            log_filter.filter(record)
+        elapsed = time.perf_counter() - start
+    return elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    app = create_benchmark_app()
+    headers = create_staff_headers(app)
+
+    from app.extensions import UserContextFilter
+
+    before = time_filter(app, headers, VerifyEveryCallFilter(), args.calls)
+    after = time_filter(app, headers, UserContextFilter(), args.calls)
+    # three handlers share the filter, so a single logger call pays for it three times
+    print(f"{'filter':<26} {'us/filter':>10} {'us/log call':>12}")
+    print(f"{'verify every call':<26} {before:>10.2f} {before * 3:>12.2f}")
+    print(f"{'memoized on flask.g':<26} {after:>10.2f} {after * 3:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
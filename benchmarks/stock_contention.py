@@ -0,0 +1,102 @@
+"""
+stress test for the conditional stock updates in sell_drink
+
+a pool of sellers hammers one drink until it is out of stock, then the run checks
+that exactly the starting stock was sold and reports sales per second
+
+usage:
+    python -m benchmarks.stock_contention [--stock 500] [--sellers 1,8,32] [--database-uri URI]
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.common import create_benchmark_app, create_staff_headers
+
+
+def run(app, headers, drink_id, stock, sellers):
+    from app.models import Drink, DrinkSales, db
+
+    with app.app_context():
+        db.session.query(DrinkSales).filter(DrinkSales.drink_id == drink_id).delete()
+        db.session.query(Drink).filter(Drink.id == drink_id).update({Drink.stock: stock})
+        db.session.commit()
+
+    sold = []
+    rejected = []
+    errors = []
+    start = threading.Barrier(sellers + 1)
+
+    def seller():
+        client = app.test_client()
+        counts = {200: 0, 400: 0, 'other': 0}
+        start.wait()
+        while True:
+            response = client.post(f"/api/v1/drinks/{drink_id}/sell/retail", headers=headers,
+                                   json={'quantity': 1, 'payment_method': 'cash'})
+            if response.status_code == 200:
+                counts[200] += 1
+            elif response.status_code == 400:
+                counts[400] += 1
+                break
+            else:
+                counts['other'] += 1
+        sold.append(counts[200])
+        rejected.append(counts[400])
+        errors.append(counts['other'])
+
+    threads = [threading.Thread(target=seller) for _ in range(sellers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    with app.app_context():
+        stock_left = db.session.query(Drink.stock).filter(Drink.id == drink_id).scalar()
+        sales_rows = db.session.query(db.func.sum(DrinkSales.quantity)).filter(DrinkSales.drink_id == drink_id).scalar() or 0
+
+    return {
+        'sellers': sellers,
+        'sold': sum(sold),
+        'errors': sum(errors),
+        'stock_left': stock_left,
+        'sales_rows': sales_rows,
+        'elapsed': elapsed,
+        'oversold': sum(sold) > stock or stock_left < 0 or sales_rows != sum(sold),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--sellers', default='1,8,32')
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    app = create_benchmark_app(args.database_uri)
+    headers = create_staff_headers(app)
+
+    from app.models import Drink, db
+    with app.app_context():
+        drink = Drink(name='stress test gin', drink_type='Gin', stock=0, purchase_price=1000.0,
+                      volume='750 ml', markup=0.3, shot_price=100.0, shot_quantity=25)
+        db.session.add(drink)
+        db.session.commit()
+        drink_id = drink.id
+
+    print(f"{'sellers':>8} {'sold':>6} {'errors':>7} {'left':>5} {'sales/s':>9}  result")
+    failed = False
+    for sellers in (int(n) for n in args.sellers.split(',')):
+        result = run(app, headers, drink_id, args.stock, sellers)
+        failed = failed or result['oversold']
+        print(f"{result['sellers']:>8} {result['sold']:>6} {result['errors']:>7} {result['stock_left']:>5} "
+              f"{result['sold'] / result['elapsed']:>9.1f}  {'OVERSOLD' if result['oversold'] else 'ok'}")
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,117 @@
+from datetime import timedelta
 import os
 from dotenv import load_dotenv
 
+# values are read from the environment when this module is first imported, so .env is loaded
+# here and every entry point reading Config (create_app, the flask cli, alembic's env.py) sees it
 load_dotenv()
 
+def engine_options(database_uri, pool_size, max_overflow, pool_timeout, pool_recycle, pre_ping, statement_timeout_ms) -> dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for a database, sqlite opens a file per connection and keeps
+    the sqlalchemy defaults
+
+    Args:
+        statement_timeout_ms (int): cancel statements running longer than this on postgres, 0 for no limit
+    """
+    if not database_uri or database_uri.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': pre_ping,
+    }
+    if statement_timeout_ms and database_uri.startswith('postgresql'):
+        options['connect_args'] = {'options': f"-c statement_timeout={statement_timeout_ms}"}
+    return options
+
 class Config:
     JWT_SECRET_KEY = os.getenv('JWT_sECRET_KEY')
     SECRET_KEY = os.getenv('SECRET_KEY')
-    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI')
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI')
+    
+    # optional read replica, the queries of @read_only endpoints are sent to it
+    REPLICA_DATABASE_URI = os.getenv('REPLICA_DATABASE_URI')
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URI} if REPLICA_DATABASE_URI else {}
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 5))
+    REPLICA_READ_YOUR_WRITES_SECONDS = int(os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', 5))
+    
+    # per worker pool, keep DB_POOL_SIZE at least the number of threads a worker runs
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+        DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS
+    )
+    # connections each worker opens per database before it takes requests
+    WARMUP_CONNECTIONS = int(os.getenv('WARMUP_CONNECTIONS', DB_POOL_SIZE))
+    
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_DIR = os.getenv('LOG_DIR', 'logs')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    # true gives every process its own app.<pid>.log so one writer rotates each file, auto does
+    # that when running under gunicorn. false shares the files, only safe with a single process
+    LOG_PER_WORKER_FILES = os.getenv('LOG_PER_WORKER_FILES', 'auto').lower()
+    
+    DRINK_CATALOG_CACHE_SIZE = int(os.getenv('DRINK_CATALOG_CACHE_SIZE', 1024))
+    DRINK_CATALOG_CACHE_TTL = int(os.getenv('DRINK_CATALOG_CACHE_TTL', 60))
+    
+    TOKEN_VERSION_CACHE_TTL = int(os.getenv('TOKEN_VERSION_CACHE_TTL', 30))
+    
+    # refresh tokens only live in an httponly cookie sent to the /token endpoints. the csrf
+    # cookie the client echoes back as X-CSRF-TOKEN has to be readable from every page, login
+    # also returns its value for clients on another origin
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(hours=int(os.getenv('JWT_REFRESH_TOKEN_HOURS', 16)))
+    JWT_REFRESH_COOKIE_PATH = '/api/v1/token'
+    JWT_REFRESH_CSRF_COOKIE_PATH = '/'
+    JWT_COOKIE_SECURE = os.getenv('JWT_COOKIE_SECURE', 'true').lower() == 'true'
+    JWT_COOKIE_SAMESITE = 'Lax'
+    
+    LOGIN_HASH_WORKERS = int(os.getenv('LOGIN_HASH_WORKERS', 2))
+    LOGIN_HASH_MAX_PENDING = int(os.getenv('LOGIN_HASH_MAX_PENDING', 32))
+    LOGIN_HASH_TIMEOUT = int(os.getenv('LOGIN_HASH_TIMEOUT', 10))
+    LOGIN_USER_RATE_PER_MINUTE = int(os.getenv('LOGIN_USER_RATE_PER_MINUTE', 5))
+    LOGIN_USER_BURST = int(os.getenv('LOGIN_USER_BURST', 5))
+    LOGIN_IP_RATE_PER_MINUTE = int(os.getenv('LOGIN_IP_RATE_PER_MINUTE', 60))
+    LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', 30))
+    # reverse proxies in front of gunicorn that append to X-Forwarded-For. behind a proxy, leaving it
+    # at 0 gives every client the proxy's address, they share one login ip bucket and /metrics
+    # takes them all for local requests. more than the real number of proxies lets clients spoof it
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
+    
+    # every row costs a scrypt hash of ~0.1s of cpu, 50 rows stay well inside the gunicorn timeout on
+    # one core. larger lists go through `flask import-staff`
+    STAFF_BULK_MAX_ROWS = int(os.getenv('STAFF_BULK_MAX_ROWS', 50))
+    SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+    SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', 1.0))
+    SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+    SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', 300))
+    SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE', 'slow_queries.log')
+    
+    # endpoints declare a statement budget with @query_budget, strict mode raises instead of logging
+    QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+    QUERY_REPEAT_LIMIT = int(os.getenv('QUERY_REPEAT_LIMIT', 2))
+    
+    # auto uses orjson when it is installed, stdlib forces the flask default encoder
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
+    # responses smaller than this are sent uncompressed, -1 turns compression off
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 4))
+    # seconds a worker trusts its cached table versions, a write on another worker can get a
+    # 304 for up to this long. 0 reads them on every conditional request
+    TABLE_VERSION_CACHE_TTL = float(os.getenv('TABLE_VERSION_CACHE_TTL', 2))
+    
+    # when set /metrics needs an `Authorization: Bearer <token>` header, without it /metrics only
+    # answers requests from the machine itself
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    
+    # password hashing processes of flask import-staff, /staff/bulk hashes on the login hash pool
+    STAFF_IMPORT_HASH_WORKERS = int(os.getenv('STAFF_IMPORT_HASH_WORKERS', os.cpu_count() or 1))
@@ -0,0 +1,28 @@
+"""
+gunicorn settings, every value can be overridden from the environment.
+
+preload_app builds the app once in the master so workers fork with the code already
+imported. a forked worker must not use the master's pooled connections, post_fork drops them
+and opens the worker's own pool and primes its caches before the worker accepts requests.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# keep DB_POOL_SIZE at least `threads`, every thread can hold a connection
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+preload_app = True
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+
+
+def post_fork(server, worker):
+    from app.warmup import warm_up
+    from wsgi import app
+
+    warm_up(app, dispose_inherited=True)
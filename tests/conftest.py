@@ -0,0 +1,68 @@
+import os
+import random
+import tempfile
+
+import pytest
+
+# config.py reads the environment when it is first imported, so this runs before create_app
+os.environ.update({
+    'DATABASE_URI': 'sqlite://',
+    'JWT_sECRET_KEY': 'test-only-jwt-secret-key-0123456789abcdef',
+    'SECRET_KEY': 'test-only-secret-key-0123456789abcdef',
+    'JWT_COOKIE_SECURE': 'false',
+    'LOG_DIR': tempfile.mkdtemp(prefix='lilysplace-tests-'),
+    'SLOW_QUERY_THRESHOLD_MS': '-1',
+    # an endpoint over its @query_budget raises and fails the test
+    'QUERY_BUDGET_STRICT': 'true',
+})
+
+@pytest.fixture
+def app():
+    """ a new app on an empty in-memory database, the caches of the previous test are dropped by init_app """
+    from app import create_app
+    from app.models import db
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def make_staff(app):
+    """
+    create a user with a staff profile and return auth headers for them
+
+    Args:
+        department (str): department of the staff member and role of the user
+        role (str): role of the user when it differs from the department, e.g. manager
+    """
+    from flask_jwt_extended import create_access_token
+    from app.models import Staff, User, db
+    from app.user.auth import staff_claims
+
+    def make(department='bar', role=None, password='password'):
+        with app.app_context():
+            suffix = ''.join(random.choices('0123456789', k=8))
+            user = User(username=f"07{suffix}", role=role or department)
+            user.hash_password(password)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Staff(name=f"staff {suffix}", id_number=suffix, phone_number=f"07{suffix}",
+                                 department=department, user_id=user.id))
+            db.session.commit()
+            token = create_access_token(identity=str(user.id), additional_claims=staff_claims(user))
+            return {'Authorization': f"Bearer {token}", 'username': user.username, 'user_id': user.id}
+
+    return make
+
+@pytest.fixture
+def bar_headers(make_staff):
+    staff = make_staff('bar')
+    return {'Authorization': staff['Authorization']}
@@ -0,0 +1,88 @@
+import pytest
+
+from app.etags import table_versions
+
+@pytest.mark.parametrize('if_none_match', ['*', 'W/"{etag}"', '"{etag}-gzip"'])
+def test_matching_if_none_match_gets_a_304(client, bar_headers, if_none_match):
+    etag = client.get('/api/v1/drinks', headers=bar_headers).headers['ETag'].strip('"')
+
+    response = client.get('/api/v1/drinks', headers={**bar_headers, 'If-None-Match': if_none_match.format(etag=etag)})
+
+    assert response.status_code == 304
+
+def test_other_tags_get_the_body(client, bar_headers):
+    response = client.get('/api/v1/drinks', headers={**bar_headers, 'If-None-Match': '"not-the-tag"'})
+    assert response.status_code == 200
+
+@pytest.mark.parametrize('upsert', [True, False])
+def test_bump_counts_each_commit(app, monkeypatch, upsert):
+    from app.models import db
+
+    monkeypatch.setattr(table_versions, 'upsert', upsert)
+
+    with app.app_context():
+        table_versions.bump(['drinks'])
+        db.session.commit()
+        table_versions.bump(['drinks', 'open_bottle'])
+        db.session.commit()
+        assert table_versions.get(['drinks', 'open_bottle']) == {'drinks': 2, 'open_bottle': 1}
+
+def test_bump_rolls_back_with_its_transaction(app, client, bar_headers):
+    from app.models import Drink, db
+
+    with app.app_context():
+        db.session.add(Drink(name='gin', drink_type='Gin', volume='750 ml', stock=10, purchase_price=1000.0,
+                             markup=0.3, shot_price=50.0, shot_quantity=25))
+        db.session.flush()
+        db.session.rollback()
+        assert table_versions.get(['drinks']) == {'drinks': 0}
+
+def test_concurrent_writes_fit_in_one_connection_each(monkeypatch, tmp_path):
+    """ a pool of one connection, a write that needs a second one for its bump times out """
+    import threading
+    from flask_jwt_extended import create_access_token
+    from config import Config
+    from app import create_app
+    from app.models import Drink, Staff, User, db
+    from app.user.auth import staff_claims
+
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'pool.db'}")
+    monkeypatch.setattr(Config, 'SQLALCHEMY_ENGINE_OPTIONS', {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 2})
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        user = User(username='0700000001', role='bar')
+        user.hash_password('password')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Staff(name='seller', id_number='1', phone_number='0700000001', department='bar', user_id=user.id))
+        drink = Drink(name='gin', drink_type='Gin', volume='750 ml', stock=100, purchase_price=1000.0,
+                      markup=0.3, shot_price=50.0, shot_quantity=25)
+        db.session.add(drink)
+        db.session.commit()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=str(user.id), additional_claims=staff_claims(user))}"}
+        drink_id = drink.id
+
+    statuses = []
+
+    def seller():
+        client = app.test_client()
+        for _ in range(5):
+            response = client.post(f"/api/v1/drinks/{drink_id}/sell/retail", headers=headers,
+                                   json={'quantity': 1, 'payment_method': 'cash'})
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=seller) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 20
+    with app.app_context():
+        table_versions._versions.clear()
+        # the seed bumped drinks once
+        assert table_versions.get(['drinks', 'drink_sales']) == {'drinks': 21, 'drink_sales': 20}
+    with app.app_context():
+        db.engine.dispose()
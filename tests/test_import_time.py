@@ -0,0 +1,24 @@
+"""
+the cold start budgets of benchmarks/import_time.py, each target is imported in fresh
+interpreters and the median has to stay under DEFAULT_BUDGETS
+"""
+import os
+import statistics
+
+import pytest
+
+from benchmarks.import_time import DEFAULT_BUDGETS, TARGETS, isolated_env, run_target, startup_modules
+
+RUNS = 3
+
+@pytest.fixture(scope='module')
+def interpreter(tmp_path_factory):
+    env = isolated_env(str(tmp_path_factory.mktemp('importtime')))
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return env, startup_modules(env)
+
+@pytest.mark.parametrize('target', sorted(DEFAULT_BUDGETS))
+def test_import_time_within_budget(interpreter, target):
+    env, baseline = interpreter
+    import_ms = statistics.median(run_target(TARGETS[target], env, baseline)[0] for _ in range(RUNS))
+    assert import_ms <= DEFAULT_BUDGETS[target], f"{target} imports in {import_ms:.0f} ms, budget is {DEFAULT_BUDGETS[target]} ms"
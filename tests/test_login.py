@@ -0,0 +1,34 @@
+import threading
+
+from app.user.security import password_hashes
+
+def test_login_answers_503_when_the_password_check_times_out(app, client, make_staff, monkeypatch):
+    staff = make_staff('bar')
+    release = threading.Event()
+    monkeypatch.setattr(password_hashes, 'timeout', 0.05)
+    monkeypatch.setattr('app.user.security.check_password_hash', lambda password_hash, password: release.wait(5))
+
+    try:
+        response = client.post('/api/v1/login', json={'username': staff['username'], 'password': 'password'})
+    finally:
+        release.set()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_login_throttle_sees_the_forwarded_client(monkeypatch):
+    from config import Config
+    monkeypatch.setattr(Config, 'PROXY_FIX_X_FOR', 1)
+    from app import create_app
+    from app.user.security import login_throttle
+
+    app = create_app()
+    client = app.test_client()
+    seen = []
+    monkeypatch.setattr(login_throttle, 'allow', lambda username, ip: seen.append(ip) or (False, 1))
+
+    response = client.post('/api/v1/login', json={'username': 'someone', 'password': 'password'},
+                           headers={'X-Forwarded-For': '198.51.100.20'})
+
+    assert response.status_code == 429
+    assert seen == ['198.51.100.20']
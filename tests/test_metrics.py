@@ -0,0 +1,35 @@
+import os
+
+def test_every_sample_has_the_worker_label(client):
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    samples = [line for line in response.get_data(as_text=True).splitlines() if line and not line.startswith('#')]
+    assert samples
+    assert all(f'worker="{os.getpid()}"' in line for line in samples)
+
+def test_metrics_only_answer_locally_without_a_token(client):
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 403
+
+def test_metrics_token_is_required_once_set(app, client):
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'},
+                          environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 200
+
+def test_engine_is_instrumented_once(app):
+    from sqlalchemy import event
+    from app.metrics import metrics
+    from app.models import db
+
+    with app.app_context():
+        metrics.instrument_engine(db.engine, 'default')
+        metrics.instrument_engine(db.engine, 'default')
+        assert event.contains(db.engine, 'before_cursor_execute', metrics._before_cursor_execute)
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('select 1')
+            # one listener pair, a second before_cursor_execute would leave a start time behind
+            assert conn.info['_metrics_started'] == []
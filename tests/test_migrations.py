@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'migrations')
+
+@pytest.fixture
+def file_app(monkeypatch, tmp_path):
+    """ an app on an empty sqlite file, alembic runs its migrations on a connection of their own """
+    from config import Config
+    from app import create_app
+
+    monkeypatch.delenv('FLASK_RUN_FROM_CLI', raising=False)
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'migrations.db'}")
+    return create_app()
+
+def test_upgrade_runs_outside_the_flask_cli(file_app):
+    import flask_migrate
+    from sqlalchemy import inspect
+    from app.models import db
+
+    with file_app.app_context():
+        flask_migrate.upgrade(directory=MIGRATIONS)
+        tables = set(inspect(db.engine).get_table_names())
+
+    assert {'alembic_version', 'drinks', 'table_versions', 'bar_daily_sales'} <= tables
+
+def test_db_command_group_is_registered(file_app):
+    result = file_app.test_cli_runner().invoke(args=['db', '-d', MIGRATIONS, 'current'])
+
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,56 @@
+from app.user import onboarding
+
+def staff_rows(count, prefix='0744'):
+    return [{'name': f"staff {n}", 'phone_number': f"{prefix}{n:06d}", 'id_number': f"{n:08d}", 'department': 'bar'}
+            for n in range(count)]
+
+def test_bulk_onboarding_is_capped(app, client, make_staff):
+    headers = {'Authorization': make_staff('manager')['Authorization']}
+    rows = staff_rows(app.config['STAFF_BULK_MAX_ROWS'] + 1)
+
+    response = client.post('/api/v1/staff/bulk', headers=headers, json={'staff': rows})
+
+    assert response.status_code == 400
+    assert 'flask import-staff' in response.get_json()['msg']
+
+def test_failed_rows_do_not_leak_database_errors(app, monkeypatch):
+    # rows that slip past the duplicate check, e.g. inserted by another request in the meantime
+    monkeypatch.setattr(onboarding, '_find_conflicts', lambda rows: {})
+    rows = staff_rows(2)
+
+    with app.app_context():
+        onboarding.onboard_staff(rows, workers=1)
+        report = onboarding.onboard_staff(rows, workers=1)
+
+    assert [row['status'] for row in report] == ['failed', 'failed']
+    assert all(row['msg'] == 'phone number or id number already exists' for row in report)
+
+def test_bulk_onboarding_retrying_every_row_stays_within_its_budget(app, client, make_staff, monkeypatch):
+    from app.models import Staff, db
+
+    headers = {'Authorization': make_staff('manager')['Authorization']}
+    rows = staff_rows(app.config['STAFF_BULK_MAX_ROWS'])
+    # the last row slips past the duplicate check, the chunk fails and every row is retried on its own
+    monkeypatch.setattr(onboarding, '_find_conflicts', lambda rows: {})
+    with app.app_context():
+        db.session.add(Staff(name='taken', phone_number='0799999999', id_number=rows[-1]['id_number'], department='bar'))
+        db.session.commit()
+
+    response = client.post('/api/v1/staff/bulk', headers=headers, json={'staff': rows})
+
+    assert response.status_code == 200
+    assert response.get_json()['created'] == len(rows) - 1
+
+def test_bulk_onboarding_hashes_on_the_login_pool(app, client, make_staff, monkeypatch):
+    from app.user.security import password_hashes
+
+    hashed = []
+    monkeypatch.setattr(password_hashes, 'hash', lambda password: hashed.append(password) or f"hash of {password}")
+    monkeypatch.setattr(onboarding, 'ProcessPoolExecutor', None)
+    headers = {'Authorization': make_staff('manager')['Authorization']}
+    rows = staff_rows(onboarding.PARALLEL_HASH_MIN_ROWS * 2)
+
+    response = client.post('/api/v1/staff/bulk', headers=headers, json={'staff': rows})
+
+    assert response.get_json()['created'] == len(rows)
+    assert hashed == [row['id_number'] for row in rows]
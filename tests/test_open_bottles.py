@@ -0,0 +1,37 @@
+import pytest
+
+from app.query_budget import count_queries
+
+def seed_bottles(app, count):
+    from sqlalchemy import insert
+    from app.models import Drink, OpenBottle, db
+
+    with app.app_context():
+        drink_ids = db.session.execute(insert(Drink).returning(Drink.id, sort_by_parameter_order=True), [
+            {'name': f"spirit {n}", 'drink_type': 'Gin', 'volume': '750 ml', 'stock': 10, 'purchase_price': 1000.0,
+             'markup': 0.3, 'shot_price': 50.0, 'shot_quantity': 25}
+            for n in range(count)
+        ]).scalars().all()
+        db.session.execute(insert(OpenBottle), [{'drink_id': d, 'shots_remaining': 25} for d in drink_ids])
+        db.session.commit()
+
+@pytest.mark.parametrize('bottles', [1, 10, 100])
+def test_list_open_bottles_is_one_statement(app, client, bar_headers, bottles):
+    seed_bottles(app, bottles)
+    # the first request loads the token version and table versions into the worker caches
+    client.get('/api/v1/drinks/open-bottle', headers=bar_headers)
+
+    with count_queries() as queries:
+        response = client.get('/api/v1/drinks/open-bottle', headers=bar_headers)
+
+    assert response.status_code == 200
+    assert len(response.get_json()['open_bottles']) == bottles
+    assert queries.count == 1, queries.statements
+
+def test_finished_bottles_are_not_listed(app, client, bar_headers):
+    seed_bottles(app, 2)
+    response = client.post('/api/v1/drinks/sell-tot/1', headers=bar_headers, json={'shot_quantity': 25, 'payment_method': 'cash'})
+    assert response.status_code == 201
+
+    bottles = client.get('/api/v1/drinks/open-bottle', headers=bar_headers).get_json()['open_bottles']
+    assert [bottle['id'] for bottle in bottles] == [2]
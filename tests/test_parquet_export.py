@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+def add_sale(app, created_at):
+    from app.models import Drink, DrinkSales, db
+
+    with app.app_context():
+        drink = Drink.query.first()
+        if drink is None:
+            drink = Drink(name='gin', drink_type='Gin', volume='750 ml', stock=10, purchase_price=1000.0, markup=0.3,
+                          shot_price=50.0, shot_quantity=25)
+            db.session.add(drink)
+            db.session.flush()
+        db.session.add(DrinkSales(drink_id=drink.id, quantity=1, sale_type='retail', payment_method='cash',
+                                  amount=1300.0, created_at=created_at))
+        db.session.commit()
+
+def test_incremental_export_picks_up_rows_committed_behind_the_watermark(app, tmp_path):
+    from app.exports.parquet import export_parquet
+
+    stamped = datetime(2026, 3, 1, 0, 0)
+    add_sale(app, stamped)
+    with app.app_context():
+        export_parquet(tmp_path, tables=['drink_sales'])
+
+    # a transaction that started before the first export read its watermark but committed after it
+    add_sale(app, stamped - timedelta(minutes=1))
+    with app.app_context():
+        rewritten = export_parquet(tmp_path, tables=['drink_sales'])
+
+    assert rewritten == {'drink_sales': 2}
+    assert pq.read_table(tmp_path / 'drink_sales' / 'month=2026-02' / 'data.parquet').num_rows == 1
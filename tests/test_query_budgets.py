@@ -0,0 +1,164 @@
+"""
+every api route is called once on a fresh app, so the worker caches are
+cold, with QUERY_BUDGET_STRICT on. a request over its budget or repeating a statement more than
+QUERY_REPEAT_LIMIT times raises QueryBudgetExceeded and fails the test
+"""
+from collections import namedtuple
+from datetime import date
+
+import pytest
+
+from app.models import SERVICE_TYPES
+
+Case = namedtuple('Case', ['endpoint', 'method', 'path', 'body', 'auth', 'status'])
+
+# routes outside the api, /metrics reads no table and static serves files
+UNBUDGETED = {'static', 'metrics'}
+
+CASES = [
+    Case('bar_bp.add_drinks', 'POST', lambda c: '/api/v1/drinks/add',
+         lambda c: {'name': 'new gin', 'category': 'Gin', 'stock': 10, 'purchase_price': 1000.0, 'volume': '750 ml',
+                    'markup': 0.3, 'shot_price': 50.0, 'shot_quantity': 25}, 'bar', 201),
+    Case('bar_bp.import_drinks', 'POST', lambda c: '/api/v1/drinks/import',
+         lambda c: [{'name': 'drink 0', 'category': 'Gin', 'volume': '750 ml', 'purchase_price': 1100.0, 'markup': 0.3,
+                     'shot_price': 55.0, 'shot_quantity': 25}] +
+                   [{'name': f"imported {n}", 'category': 'Gin', 'volume': '750 ml', 'stock': 6, 'purchase_price': 900.0,
+                     'markup': 0.3, 'shot_price': 45.0, 'shot_quantity': 25} for n in range(10)], 'bar', 200),
+    Case('bar_bp.list_drinks', 'GET', lambda c: '/api/v1/drinks?limit=5', None, 'bar', 200),
+    Case('bar_bp.export_drinks', 'GET', lambda c: '/api/v1/drinks/export', None, 'bar', 200),
+    Case('bar_bp.edit_drinks', 'PUT', lambda c: f"/api/v1/drinks/{c['drink_ids'][0]}/edit", lambda c: {'markup': 0.4}, 'bar', 200),
+    Case('bar_bp.delete_drink', 'DELETE', lambda c: f"/api/v1/drinks/{c['unsold_drink_id']}/delete", None, 'bar', 200),
+    Case('bar_bp.sell_drink', 'POST', lambda c: f"/api/v1/drinks/{c['drink_ids'][0]}/sell/retail",
+         lambda c: {'quantity': 1, 'payment_method': 'cash'}, 'bar', 200),
+    Case('bar_bp.open_bottle', 'POST', lambda c: f"/api/v1/drinks/open-bottle/{c['drink_ids'][1]}", None, 'bar', 201),
+    Case('bar_bp.list_open_bottles', 'GET', lambda c: '/api/v1/drinks/open-bottle', None, 'bar', 200),
+    Case('bar_bp.sell_tots', 'POST', lambda c: f"/api/v1/drinks/sell-tot/{c['bottle_id']}",
+         lambda c: {'shot_quantity': 1, 'payment_method': 'mpesa'}, 'bar', 201),
+    Case('bar_bp.edit_tot_sale', 'PUT', lambda c: f"/api/v1/drinks/tot-sales/{c['tot_sale_id']}/edit",
+         lambda c: {'payment_method': 'mpesa'}, 'bar', 200),
+    Case('bar_bp.record_drink_purchase', 'POST', lambda c: f"/api/v1/drinks/record-purchase/{c['drink_ids'][0]}",
+         lambda c: {'quantity': 12, 'unit_price': 900.0, 'payment_method': 'cash', 'supplier': 'test'}, 'bar', 201),
+    Case('bar_bp.sell_batch', 'POST', lambda c: '/api/v1/sales/batch',
+         lambda c: {'payment_method': 'cash', 'items': [
+             {'type': 'bottle', 'drink_id': c['drink_ids'][0], 'quantity': 1},
+             {'type': 'bottle', 'drink_id': c['drink_ids'][2], 'quantity': 2},
+             {'type': 'tot', 'bottle_id': c['bottle_id'], 'shot_quantity': 1}]}, 'bar', 201),
+    Case('carwash_bp.add_carwash_income', 'POST', lambda c: '/api/v1/carwash/add-income',
+         lambda c: {'customer': 'KDA 123A', 'staff_id': c['carwash_staff_id'], 'amount_charged': 500,
+                    'payment_method': 'cash', 'service': SERVICE_TYPES[0]}, 'carwash', 201),
+    Case('carwash_bp.edit_carwash_income', 'PUT', lambda c: f"/api/v1/carwash/income/{c['carwash_income_id']}/edit",
+         lambda c: {'amount_charged': 800}, 'carwash', 200),
+    Case('carwash_bp.delete_carwash_income', 'DELETE', lambda c: f"/api/v1/carwash/income/{c['carwash_income_id']}/delete",
+         None, 'carwash', 200),
+    Case('exports_bp.export_table', 'GET', lambda c: f"/api/v1/exports/drink_sales.csv?from={date.today()}", None, 'bar', 200),
+    Case('login_bp.login', 'POST', lambda c: '/api/v1/login',
+         lambda c: {'username': c['bar_username'], 'password': 'password'}, None, 200),
+    Case('login_bp.refresh_access_token', 'POST', lambda c: '/api/v1/token/refresh', None, 'refresh', 200),
+    Case('login_bp.logout', 'POST', lambda c: '/api/v1/token/revoke', None, 'refresh', 200),
+    Case('login_bp.change_password', 'PATCH', lambda c: '/api/v1/change-password',
+         lambda c: {'new_password': 'a new password'}, 'bar', 200),
+    Case('register_bp.register_staff', 'POST', lambda c: '/api/v1/create-staff',
+         lambda c: {'name': 'new staff', 'phone_number': '0711111111', 'id_number': '11111111', 'department': 'bar'},
+         'manager', 201),
+    Case('register_bp.register_staff_bulk', 'POST', lambda c: '/api/v1/staff/bulk',
+         lambda c: {'staff': [{'name': f"bulk {n}", 'phone_number': f"07222222{n:02d}", 'id_number': f"222222{n:02d}",
+                               'department': 'bar'} for n in range(20)]}, 'manager', 200),
+    Case('register_bp.edit_staff', 'PUT', lambda c: f"/api/v1/edit-staff/{c['spare_staff_id']}",
+         lambda c: {'name': 'renamed'}, 'manager', 200),
+    Case('register_bp.delete_user', 'DELETE', lambda c: f"/api/v1/delete-staff/{c['spare_staff_id']}", None, 'manager', 200),
+    Case('reports_bp.sales_report', 'GET', lambda c: '/api/v1/reports/sales?group_by=drink', None, 'bar', 200),
+]
+
+@pytest.fixture
+def seeded(app, client, make_staff):
+    """ drinks, an open bottle, a sale of each kind and spare staff, with the ids the cases need """
+    from app.models import CarwashIncome, Drink, DrinkSales, OpenBottle, Staff, TotSales, db
+
+    bar = make_staff('bar')
+    ctx = {
+        'bar': {'Authorization': bar['Authorization']},
+        'bar_username': bar['username'],
+        'manager': {'Authorization': make_staff('bar', role='manager')['Authorization']},
+        'carwash': {'Authorization': make_staff('carwash')['Authorization']},
+    }
+    with app.app_context():
+        drinks = [Drink(name=f"drink {n}", drink_type='Gin', volume='750 ml', stock=20, purchase_price=1000.0,
+                        markup=0.3, shot_price=50.0, shot_quantity=25) for n in range(4)]
+        db.session.add_all(drinks)
+        db.session.flush()
+        bottle = OpenBottle(drink_id=drinks[2].id, shots_remaining=25)
+        db.session.add(bottle)
+        db.session.flush()
+        staff_id = Staff.query.filter_by(department='bar').first().id
+        db.session.add(DrinkSales(drink_id=drinks[0].id, quantity=1, sale_type='retail', payment_method='cash',
+                                  amount=1508.0, sold_by=staff_id))
+        tot_sale = TotSales(open_bottle_id=bottle.id, drink_id=drinks[2].id, shot_quantity=1, price=50.0,
+                            payment_method='cash', sold_by=staff_id)
+        db.session.add(tot_sale)
+        spare = Staff(name='spare', id_number='33333333', phone_number='0733333333', department='bar')
+        db.session.add(spare)
+        carwash_staff_id = Staff.query.filter_by(department='carwash').first().id
+        if SERVICE_TYPES:
+            income = CarwashIncome(customer='KDA 1', staff_id=carwash_staff_id, amount_charged=500.0,
+                                   payment_method='cash', service=SERVICE_TYPES[0])
+            db.session.add(income)
+            db.session.flush()
+            ctx['carwash_income_id'] = income.id
+        db.session.commit()
+        ctx.update(drink_ids=[d.id for d in drinks[:3]], unsold_drink_id=drinks[3].id, bottle_id=bottle.id,
+                   tot_sale_id=tot_sale.id, spare_staff_id=spare.id, carwash_staff_id=carwash_staff_id)
+    return ctx
+
+def _request(app, client, seeded, case):
+    headers = dict(seeded[case.auth]) if case.auth in ('bar', 'manager', 'carwash') else {}
+    if case.auth == 'refresh':
+        login = client.post('/api/v1/login', json={'username': seeded['bar_username'], 'password': 'password'})
+        headers['X-CSRF-TOKEN'] = login.get_json()['csrf_token']
+    body = case.body(seeded) if case.body else None
+    response = client.open(case.path(seeded), method=case.method, headers=headers, json=body)
+    # a streamed response is checked against its budget when it is closed, as a server does
+    response.get_data()
+    response.close()
+    return response
+
+@pytest.mark.parametrize('case', [pytest.param(case, id=case.endpoint) for case in CASES])
+def test_endpoint_stays_within_its_query_budget(app, client, seeded, case):
+    if case.endpoint.startswith('carwash_bp.') and not SERVICE_TYPES:
+        pytest.skip('SERVICE_TYPES is empty, no carwash income can be recorded')
+    response = _request(app, client, seeded, case)
+    assert response.status_code == case.status, response.get_data(as_text=True)
+
+def test_edit_tot_sale_moving_to_another_bottle(app, client, seeded):
+    from app.models import OpenBottle, db
+
+    with app.app_context():
+        bottle = OpenBottle(drink_id=seeded['drink_ids'][1], shots_remaining=25)
+        db.session.add(bottle)
+        db.session.commit()
+        bottle_id = bottle.id
+    response = client.put(f"/api/v1/drinks/tot-sales/{seeded['tot_sale_id']}/edit", headers=seeded['bar'],
+                          json={'bottle_id': bottle_id, 'shot_quantity': 2})
+    assert response.status_code == 200
+
+def test_sell_tots_finishing_a_bottle(app, client, seeded):
+    response = client.post(f"/api/v1/drinks/sell-tot/{seeded['bottle_id']}", headers=seeded['bar'],
+                           json={'shot_quantity': 24, 'payment_method': 'cash'})
+    assert response.status_code == 201
+
+def test_every_route_has_a_budget_and_a_case(app):
+    routes = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint not in UNBUDGETED}
+    unbudgeted = sorted(endpoint for endpoint in routes if getattr(app.view_functions[endpoint], 'query_budget', None) is None)
+
+    assert unbudgeted == []
+    assert routes == {case.endpoint for case in CASES}
+
+def test_streamed_response_is_checked_when_closed(app, client, bar_headers, monkeypatch):
+    from app.query_budget import QueryBudgetExceeded
+
+    # the token version read runs before the view, the catalog select only while the body streams
+    monkeypatch.setattr(app.view_functions['bar_bp.export_drinks'].query_budget, 'limit', 1)
+    response = client.get('/api/v1/drinks/export', headers=bar_headers)
+    response.get_data()
+
+    with pytest.raises(QueryBudgetExceeded, match='2 statements, budget is 1'):
+        response.close()
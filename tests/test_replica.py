@@ -0,0 +1,41 @@
+import shutil
+
+def test_token_revoked_on_the_primary_is_rejected_while_the_replica_lags(monkeypatch, tmp_path):
+    """ the replica is a copy taken before the revocation, like a replica that has not replayed it yet """
+    from flask_jwt_extended import create_access_token
+    from config import Config
+    from app import create_app
+    from app.models import Staff, User, db
+    from app.replica import replica_router
+    from app.user.auth import revoke_tokens, staff_claims
+
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{primary}")
+    monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', {'replica': f"sqlite:///{replica}"})
+    # init_app adds a metadata per bind to the shared db, keep it away from the other tests
+    monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        user = User(username='0700000001', role='bar')
+        user.hash_password('password')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Staff(name='seller', id_number='1', phone_number='0700000001', department='bar', user_id=user.id))
+        db.session.commit()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=str(user.id), additional_claims=staff_claims(user))}"}
+        user_id = user.id
+    shutil.copy(primary, replica)
+
+    with app.app_context():
+        revoke_tokens(user_id)
+        db.session.commit()
+    routed = replica_router.routed['replica']
+    response = app.test_client().get('/api/v1/drinks', headers=headers)
+
+    assert replica_router.routed['replica'] == routed + 1
+    assert response.status_code == 401
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
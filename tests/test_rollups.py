@@ -0,0 +1,26 @@
+from datetime import date
+
+import pytest
+
+from app import rollups
+
+@pytest.mark.parametrize('upsert_dialects', [rollups.UPSERT_DIALECTS, ()], ids=['upsert', 'update-then-insert'])
+def test_rollups_add_up_on_every_dialect(app, monkeypatch, upsert_dialects):
+    from app.models import BarDailySales, db
+
+    monkeypatch.setattr(rollups, 'UPSERT_DIALECTS', upsert_dialects)
+    day = date(2026, 5, 1)
+
+    with app.app_context():
+        rollups.record_bar_sale(1, 'bottle', 7, 'cash', 2, 200.0, day=day)
+        rollups.record_bar_sales([
+            {'drink_id': 1, 'sale_kind': 'bottle', 'staff_id': 7, 'payment_method': 'cash', 'sales_count': 1, 'quantity': 1, 'amount': 100.0},
+            {'drink_id': 2, 'sale_kind': 'tot', 'staff_id': None, 'payment_method': 'mpesa', 'sales_count': 1, 'quantity': 3, 'amount': 150.0},
+        ], day=day)
+        rollups.record_bar_sale(1, 'bottle', 7, 'cash', -1, -100.0, sales_count=-1, day=day)
+        db.session.commit()
+
+        rows = db.session.query(BarDailySales.drink_id, BarDailySales.staff_id, BarDailySales.sales_count,
+                                BarDailySales.quantity, BarDailySales.amount).order_by(BarDailySales.drink_id).all()
+
+    assert [tuple(row) for row in rows] == [(1, 7, 1, 2, 200.0), (2, 0, 1, 3, 150.0)]
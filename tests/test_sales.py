@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.bar.app import retail_unit_price
+
+def reprice(app, drink_id, purchase_price, shot_price):
+    """ change a drink's prices like an edit served by another worker, this worker's catalog cache is not told """
+    from sqlalchemy import update
+    from app.models import Drink, db
+
+    with app.app_context():
+        db.session.execute(update(Drink).where(Drink.id == drink_id).values(purchase_price=purchase_price, shot_price=shot_price))
+        db.session.commit()
+
+@pytest.fixture
+def drink(app):
+    from app.models import Drink, OpenBottle, db
+
+    with app.app_context():
+        drink = Drink(name='house gin', drink_type='Gin', volume='750 ml', stock=20, purchase_price=1000.0,
+                      markup=0.3, shot_price=50.0, shot_quantity=25)
+        db.session.add(drink)
+        db.session.flush()
+        bottle = OpenBottle(drink_id=drink.id, shots_remaining=25)
+        db.session.add(bottle)
+        db.session.commit()
+        return {'id': drink.id, 'bottle_id': bottle.id}
+
+def sales(app):
+    from app.models import DrinkSales, TotSales, db
+
+    with app.app_context():
+        bottles = [amount for amount, in db.session.query(DrinkSales.amount).order_by(DrinkSales.id)]
+        tots = [price for price, in db.session.query(TotSales.price).order_by(TotSales.id)]
+    return bottles, tots
+
+def test_sales_charge_prices_edited_on_another_worker(app, client, bar_headers, drink):
+    # the first sales load the drink into this worker's catalog cache
+    client.post(f"/api/v1/drinks/{drink['id']}/sell/retail", headers=bar_headers, json={'quantity': 1, 'payment_method': 'cash'})
+    client.post(f"/api/v1/drinks/sell-tot/{drink['bottle_id']}", headers=bar_headers, json={'shot_quantity': 1, 'payment_method': 'cash'})
+    reprice(app, drink['id'], purchase_price=2000.0, shot_price=80.0)
+
+    assert client.post(f"/api/v1/drinks/{drink['id']}/sell/retail", headers=bar_headers,
+                       json={'quantity': 1, 'payment_method': 'cash'}).status_code == 200
+    assert client.post(f"/api/v1/drinks/sell-tot/{drink['bottle_id']}", headers=bar_headers,
+                       json={'shot_quantity': 2, 'payment_method': 'cash'}).status_code == 201
+    assert client.post('/api/v1/sales/batch', headers=bar_headers, json={'payment_method': 'cash', 'items': [
+        {'type': 'bottle', 'drink_id': drink['id'], 'quantity': 2},
+        {'type': 'tot', 'bottle_id': drink['bottle_id'], 'shot_quantity': 3}]}).status_code == 201
+
+    old_price = round(retail_unit_price(SimpleNamespace(purchase_price=1000.0, markup=0.3)), 1)
+    new_price = round(retail_unit_price(SimpleNamespace(purchase_price=2000.0, markup=0.3)), 1)
+    assert sales(app) == ([old_price, new_price, new_price * 2], [50.0, 160.0, 240.0])
@@ -0,0 +1,11 @@
+"""
+production entry point, served by gunicorn with the settings in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+the app is built once here in the gunicorn master, each forked worker then warms up its own
+connections and caches in the post_fork hook
+"""
+from app import create_app
+
+app = create_app()